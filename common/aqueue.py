@@ -0,0 +1,37 @@
+# aqueue.py - Small bounded queue for uasyncio tasks
+#
+# MicroPython's uasyncio has no Queue. This one never blocks producers:
+# when full, the oldest item is dropped, so a slow consumer always sees
+# the freshest data (what we want for sensor samples and announcements).
+#
+# Uploaded to both devices, so keep it MicroPython-safe.
+import uasyncio as asyncio
+
+class Queue:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = []
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put_nowait(self, item):
+        if len(self._items) >= self.maxsize:
+            self._items.pop(0)
+            self.dropped += 1
+        self._items.append(item)
+        self._ready.set()
+
+    def get_nowait(self):
+        """Oldest item; raises IndexError when empty"""
+        item = self._items.pop(0)
+        if not self._items:
+            self._ready.clear()
+        return item
+
+    async def get(self):
+        while not self._items:
+            await self._ready.wait()
+        return self.get_nowait()
@@ -0,0 +1,275 @@
+# protocol.py - Sensory Spectrum UDP message format (sender <-> receiver)
+#
+# Fixed-layout little-endian datagrams packed with struct into
+# preallocated buffers:
+#
+#   offset size field
+#   0      2    magic "SS"
+#   2      1    version
+#   3      1    message type
+#   4      2    sender ID
+#   6      2    sequence number (wraps at 65536)
+#   8      2    color ID (= DFPlayer track number)
+#   10     1    confidence (0-255)
+#   11     4    sender timestamp (ticks_ms)
+#
+# Acknowledgements echo the sender ID and sequence number:
+#
+#   0      2    magic "SS"
+#   2      1    version
+#   3      1    message type (MSG_ACK)
+#   4      2    sender ID
+#   6      2    acknowledged sequence number
+#
+# Discovery: a sender broadcasts a probe on the service port and every
+# receiver answers it directly with its ID and capabilities:
+#
+#   probe  (MSG_DISCOVER): magic, version, type, sender ID, nonce
+#   answer (MSG_ANNOUNCE): magic, version, type, receiver ID, echoed nonce,
+#                          capability bits (CAP_*), number of tracks
+#
+# Telemetry (MSG_STATS, see stats.py) goes to an optional collector:
+#
+#   0      2    magic "SS"
+#   2      1    version
+#   3      1    message type (MSG_STATS)
+#   4      1    role (ROLE_SENDER / ROLE_RECEIVER)
+#   5      2    unit ID (sender / receiver ID)
+#   7      2    report sequence number
+#   9      4    uptime (ticks_ms)
+#   13     4    period covered (ms)
+#   17     3    number of timers, counters, gauges
+#   20          per timer: count, min, avg, max (us, 4 bytes each) and
+#               STATS_BUCKETS histogram counts (2 bytes each); then
+#               counters and gauges (4 bytes each)
+#
+# Metric order per role is fixed by the *_TIMERS/_COUNTERS/_GAUGES names
+# below; new metrics are only ever appended.
+#
+# Notable moments go out at once as MSG_EVENT: magic, version, type,
+# role, unit ID, event code (EVT_*), 32-bit value.
+#
+# Raw sample capture (MSG_CAPTURE, see sender/capture.py): magic,
+# version, type, sender ID, batch sequence number, record count, then
+# that many CAPTURE_RECORD_FORMAT records.
+#
+# The legacy text format "Color:0.92" (ACKed with b"ACK") is still parsed
+# during rollout.
+#
+# Uploaded to both devices, so keep it MicroPython-safe.
+import os
+import struct
+
+MAGIC = b"SS"
+VERSION = 1
+
+MSG_COLOR = 1
+MSG_ACK = 2
+MSG_DISCOVER = 3
+MSG_ANNOUNCE = 4
+MSG_STATS = 5
+MSG_EVENT = 6
+MSG_CAPTURE = 7
+
+# Receiver capability bits (MSG_ANNOUNCE)
+CAP_BINARY = 0x01  # Binary color messages with sequence ACKs
+CAP_TEXT = 0x02    # Legacy "Color:confidence" messages
+CAP_AUDIO = 0x04   # Plays announcements (DFPlayer)
+
+COLOR_FORMAT = "<2sBBHHHBI"
+COLOR_SIZE = struct.calcsize(COLOR_FORMAT)  # 15 bytes
+
+def pack_color(buf, sender_id, seq, color_id, confidence, timestamp):
+    """Pack a color message into buf (at least COLOR_SIZE bytes)"""
+    struct.pack_into(COLOR_FORMAT, buf, 0, MAGIC, VERSION, MSG_COLOR,
+                     sender_id, seq, color_id, confidence, timestamp & 0xFFFFFFFF)
+    return buf
+
+ACK_FORMAT = "<2sBBHH"
+ACK_SIZE = struct.calcsize(ACK_FORMAT)  # 8 bytes
+
+def pack_ack(buf, sender_id, seq):
+    struct.pack_into(ACK_FORMAT, buf, 0, MAGIC, VERSION, MSG_ACK, sender_id, seq)
+    return buf
+
+def unpack_ack(data):
+    """Returns (sender_id, seq) or None"""
+    if len(data) < ACK_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_ACK:
+        return None
+    _, _, _, sender_id, seq = struct.unpack_from(ACK_FORMAT, data, 0)
+    return sender_id, seq
+
+DISCOVER_FORMAT = "<2sBBHH"
+DISCOVER_SIZE = struct.calcsize(DISCOVER_FORMAT)  # 8 bytes
+
+def pack_discover(buf, sender_id, nonce):
+    struct.pack_into(DISCOVER_FORMAT, buf, 0, MAGIC, VERSION, MSG_DISCOVER, sender_id, nonce)
+    return buf
+
+def unpack_discover(data):
+    """Returns (sender_id, nonce) or None"""
+    if len(data) < DISCOVER_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_DISCOVER:
+        return None
+    _, _, _, sender_id, nonce = struct.unpack_from(DISCOVER_FORMAT, data, 0)
+    return sender_id, nonce
+
+ANNOUNCE_FORMAT = "<2sBBHHHH"
+ANNOUNCE_SIZE = struct.calcsize(ANNOUNCE_FORMAT)  # 12 bytes
+
+def pack_announce(buf, receiver_id, nonce, capabilities, tracks):
+    struct.pack_into(ANNOUNCE_FORMAT, buf, 0, MAGIC, VERSION, MSG_ANNOUNCE,
+                     receiver_id, nonce, capabilities, tracks)
+    return buf
+
+def unpack_announce(data):
+    """Returns (receiver_id, nonce, capabilities, tracks) or None"""
+    if len(data) < ANNOUNCE_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_ANNOUNCE:
+        return None
+    _, _, _, receiver_id, nonce, capabilities, tracks = \
+        struct.unpack_from(ANNOUNCE_FORMAT, data, 0)
+    return receiver_id, nonce, capabilities, tracks
+
+def msg_type(data):
+    """Message type of a binary datagram (check is_binary first)"""
+    return data[3]
+
+def is_binary(data):
+    return len(data) >= 4 and data[0] == 0x53 and data[1] == 0x53
+
+def unpack_color(data):
+    """Returns (sender_id, seq, color_id, confidence, timestamp) or None"""
+    if len(data) < COLOR_SIZE or data[2] != VERSION or data[3] != MSG_COLOR:
+        return None
+    _, _, _, sender_id, seq, color_id, confidence, timestamp = \
+        struct.unpack_from(COLOR_FORMAT, data, 0)
+    return sender_id, seq, color_id, confidence, timestamp
+
+def parse_text(data):
+    """Legacy "Color:confidence" message; returns (color, confidence)"""
+    parts = data.decode('utf-8').strip().split(':')
+    return parts[0], float(parts[1]) if len(parts) > 1 else 0.0
+
+def seq_start():
+    """Random sequence number to count from after boot. The receiver keeps
+    its duplicate window per sender across a sender reboot; starting from 0
+    every time would replay seqs it has already marked as seen."""
+    b = os.urandom(2)
+    return b[0] | (b[1] << 8)
+
+def seq_next(seq):
+    return (seq + 1) & 0xFFFF
+
+def seq_diff(seq, last):
+    """Signed distance from last to seq, accounting for wrap-around"""
+    d = (seq - last) & 0xFFFF
+    return d - 0x10000 if d >= 0x8000 else d
+
+# ===== Telemetry =====
+ROLE_SENDER = 1
+ROLE_RECEIVER = 2
+
+SENDER_TIMERS = ("read", "classify", "rtt", "gc", "wake")
+SENDER_COUNTERS = ("samples", "sent", "retries", "ack_lost", "wifi_reconnects",
+                   "sensor_errors", "queue_drops", "sleep_ms", "awake_ms")
+SENDER_GAUGES = ("samples_depth", "outgoing_depth", "in_flight", "free_heap")
+RECEIVER_TIMERS = ("handle", "queue_wait", "gc")
+RECEIVER_COUNTERS = ("datagrams", "duplicates", "late", "dropped", "plays", "player_errors")
+RECEIVER_GAUGES = ("queued", "senders", "free_heap")
+
+STATS_BUCKETS = 8
+STATS_HEADER_FORMAT = "<2sBBBHHIIBBB"
+STATS_HEADER_SIZE = struct.calcsize(STATS_HEADER_FORMAT)  # 20 bytes
+STATS_TIMER_SIZE = 16 + 2 * STATS_BUCKETS
+
+def stats_size(timers, counters, gauges):
+    return STATS_HEADER_SIZE + timers * STATS_TIMER_SIZE + 4 * (counters + gauges)
+
+def pack_stats_header(buf, role, unit_id, seq, uptime, period, timers, counters, gauges):
+    """Returns the offset of the first timer"""
+    struct.pack_into(STATS_HEADER_FORMAT, buf, 0, MAGIC, VERSION, MSG_STATS, role, unit_id,
+                     seq, uptime & 0xFFFFFFFF, period & 0xFFFFFFFF, timers, counters, gauges)
+    return STATS_HEADER_SIZE
+
+def pack_stats_timer(buf, offset, count, low, avg, high, hist, start):
+    struct.pack_into("<IIII", buf, offset, count, low, avg, high)
+    offset += 16
+    for i in range(STATS_BUCKETS):
+        struct.pack_into("<H", buf, offset, hist[start + i])
+        offset += 2
+    return offset
+
+def pack_stats_values(buf, offset, values):
+    for v in values:
+        struct.pack_into("<I", buf, offset, v & 0xFFFFFFFF)
+        offset += 4
+    return offset
+
+def unpack_stats(data):
+    """Returns a dict (role, unit_id, seq, uptime_ms, period_ms, timers, counters,
+    gauges) or None; each timer is (count, min, avg, max, histogram)"""
+    if len(data) < STATS_HEADER_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_STATS:
+        return None
+    _, _, _, role, unit_id, seq, uptime, period, nt, nc, ng = \
+        struct.unpack_from(STATS_HEADER_FORMAT, data, 0)
+    if len(data) < stats_size(nt, nc, ng):
+        return None
+    offset = STATS_HEADER_SIZE
+    timers = []
+    for _ in range(nt):
+        count, low, avg, high = struct.unpack_from("<IIII", data, offset)
+        hist = struct.unpack_from("<%dH" % STATS_BUCKETS, data, offset + 16)
+        timers.append((count, low, avg, high, hist))
+        offset += STATS_TIMER_SIZE
+    counters = struct.unpack_from("<%dI" % nc, data, offset)
+    gauges = struct.unpack_from("<%dI" % ng, data, offset + 4 * nc)
+    return {"role": role, "unit_id": unit_id, "seq": seq, "uptime_ms": uptime,
+            "period_ms": period, "timers": timers, "counters": counters, "gauges": gauges}
+
+# Event codes (MSG_EVENT); value in brackets
+EVT_BOOT = 1              # Unit started (machine.reset_cause())
+EVT_WIFI_RECONNECT = 2    # Link restored after a drop
+EVT_RECEIVER_CHANGED = 3  # Sender now talks to another receiver (receiver ID)
+EVT_CALIBRATED = 4        # New white calibration (0 = requested, 1 = drift correction)
+EVT_PLAYER_ERROR = 5      # DFPlayer reported an error (error code)
+EVENT_NAMES = ("", "boot", "wifi_reconnect", "receiver_changed", "calibrated", "player_error")
+
+EVENT_FORMAT = "<2sBBBHBI"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)  # 12 bytes
+
+def pack_event(buf, role, unit_id, code, value=0):
+    struct.pack_into(EVENT_FORMAT, buf, 0, MAGIC, VERSION, MSG_EVENT, role, unit_id,
+                     code, value & 0xFFFFFFFF)
+    return buf
+
+def unpack_event(data):
+    """Returns (role, unit_id, code, value) or None"""
+    if len(data) < EVENT_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_EVENT:
+        return None
+    _, _, _, role, unit_id, code, value = struct.unpack_from(EVENT_FORMAT, data, 0)
+    return role, unit_id, code, value
+
+# ===== Raw capture =====
+# One reading: timestamp (ticks_ms), unscaled r, g, b, clear counts, ATIME
+# and gain register values, label (wire color ID, CAPTURE_UNLABELLED if none)
+CAPTURE_RECORD_FORMAT = "<IHHHHBBH"
+CAPTURE_RECORD_SIZE = struct.calcsize(CAPTURE_RECORD_FORMAT)  # 16 bytes
+CAPTURE_UNLABELLED = 0xFFFF
+CAPTURE_HEADER_FORMAT = "<2sBBHHB"
+CAPTURE_HEADER_SIZE = struct.calcsize(CAPTURE_HEADER_FORMAT)  # 9 bytes
+
+def pack_capture_record(buf, offset, timestamp, raw, atime, gain, label):
+    struct.pack_into(CAPTURE_RECORD_FORMAT, buf, offset, timestamp & 0xFFFFFFFF,
+                     raw[0], raw[1], raw[2], raw[3], atime, gain, label)
+
+def pack_capture_header(buf, sender_id, seq, count):
+    struct.pack_into(CAPTURE_HEADER_FORMAT, buf, 0, MAGIC, VERSION, MSG_CAPTURE,
+                     sender_id, seq, count)
+
+def unpack_capture(data):
+    """Returns (sender_id, seq, count, offset of the first record) or None"""
+    if len(data) < CAPTURE_HEADER_SIZE or not is_binary(data) or data[2] != VERSION or data[3] != MSG_CAPTURE:
+        return None
+    _, _, _, sender_id, seq, count = struct.unpack_from(CAPTURE_HEADER_FORMAT, data, 0)
+    if len(data) < CAPTURE_HEADER_SIZE + count * CAPTURE_RECORD_SIZE:
+        return None
+    return sender_id, seq, count, CAPTURE_HEADER_SIZE
@@ -0,0 +1,117 @@
+# reliable.py - Windowed acknowledgement (sender) and duplicate suppression (receiver)
+#
+# Sender side: Outbox keeps up to `window` unacknowledged messages and
+# retransmits them on a timer from poll(), which the transmit task calls
+# while messages are in flight - sending never blocks sampling.
+#
+# Receiver side: SeqWindow remembers which of the last 32 sequence
+# numbers from one sender have been seen, so a retransmit whose ACK was
+# lost is ACKed again but never played twice.
+#
+# Uploaded to both devices, so keep it MicroPython-safe.
+import time
+import protocol
+
+class Outbox:
+    def __init__(self, sock, addr, window=4, timeout_ms=500, retries=3,
+                 on_ack=None, on_fail=None):
+        self.sock = sock
+        self.addr = addr
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.on_ack = on_ack
+        self.on_fail = on_fail
+        self.pending = []  # [seq, payload, deadline, attempts, context, sent_us], oldest first
+        self.retransmits = 0
+        self.failures = 0
+        self.last_rtt_us = 0  # First transmission to ACK of the latest acknowledged message
+        sock.settimeout(0)
+
+    def send(self, seq, payload, context=None):
+        """Queue and transmit a message; returns immediately"""
+        if len(self.pending) >= self.window:
+            self._fail(self.pending.pop(0))
+        entry = [seq, bytes(payload), 0, 0, context, time.ticks_us()]
+        self.pending.append(entry)
+        self._transmit(entry, time.ticks_ms())
+
+    def _transmit(self, entry, now):
+        entry[2] = time.ticks_add(now, self.timeout_ms)
+        entry[3] += 1
+        try:
+            self.sock.sendto(entry[1], self.addr)
+        except OSError as e:
+            print("Send error:", e)
+
+    def _fail(self, entry):
+        self.failures += 1
+        if self.on_fail:
+            self.on_fail(entry[0], entry[4])
+
+    def _acked(self, index):
+        entry = self.pending.pop(index)
+        self.last_rtt_us = time.ticks_diff(time.ticks_us(), entry[5])
+        if self.on_ack:
+            self.on_ack(entry[0], entry[4])
+
+    def poll(self):
+        """Drain ACKs and retransmit overdue messages; never blocks"""
+        while self.pending:
+            try:
+                data, _ = self.sock.recvfrom(64)
+            except OSError:
+                break  # Nothing waiting (EAGAIN / timeout)
+            ack = protocol.unpack_ack(data)
+            if ack:
+                for i in range(len(self.pending)):
+                    if self.pending[i][0] == ack[1]:
+                        self._acked(i)
+                        break
+            elif data == b"ACK" and self.pending:
+                self._acked(0)  # Legacy ACK carries no sequence number
+
+        now = time.ticks_ms()
+        i = 0
+        while i < len(self.pending):
+            entry = self.pending[i]
+            if time.ticks_diff(now, entry[2]) >= 0:
+                if entry[3] > self.retries:
+                    self.pending.pop(i)
+                    self._fail(entry)
+                    continue
+                self.retransmits += 1
+                self._transmit(entry, now)
+            i += 1
+
+# SeqWindow.check() results
+NEW = 0        # Newer than anything seen: deliver
+DUPLICATE = 1  # Already seen (retransmit after a lost ACK)
+LATE = 2       # Unseen but older than the newest: stale, do not deliver
+
+class SeqWindow:
+    SIZE = 32
+
+    def __init__(self):
+        self.highest = None
+        self.seen = 0  # Bit n set = highest - n has been received
+
+    def check(self, seq):
+        """Classify and record a sequence number"""
+        if self.highest is None:
+            self.highest, self.seen = seq, 1
+            return NEW
+        d = protocol.seq_diff(seq, self.highest)
+        if d > 0:
+            self.seen = ((self.seen << d) | 1) & 0xFFFFFFFF if d < self.SIZE else 1
+            self.highest = seq
+            return NEW
+        if -d >= self.SIZE:
+            # Far behind the window: the sender restarted its sequence
+            self.highest, self.seen = seq, 1
+            return NEW
+        bit = 1 << -d
+        if self.seen & bit:
+            return DUPLICATE
+        self.seen |= bit
+        return LATE
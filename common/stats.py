@@ -0,0 +1,101 @@
+# stats.py - Preallocated timers, counters and gauges for field telemetry
+#
+# Timers take durations in microseconds (time.ticks_us deltas) and keep,
+# per reporting period, count / min / max / sum and a histogram of
+# log4 buckets:
+#
+#   <100us  <400us  <1.6ms  <6.4ms  <25.6ms  <102ms  <410ms  longer
+#
+# Counters are cumulative since boot, so the collector can take rates
+# from any two reports even when some datagrams are lost. Gauges hold the
+# peak seen in the period (queue depth) or the last value set (free heap).
+#
+# Everything lives in arrays allocated once: recording never allocates.
+# pack() writes one protocol.MSG_STATS datagram into a preallocated
+# buffer and starts the next period.
+#
+# Uploaded to both devices, so keep it MicroPython-safe.
+from array import array
+import time
+import protocol
+
+BUCKETS = protocol.STATS_BUCKETS
+_FIRST_BUCKET_US = 100  # Upper edge of bucket 0; each next edge is 4x
+
+def bucket(us):
+    edge = _FIRST_BUCKET_US
+    for i in range(BUCKETS - 1):
+        if us < edge:
+            return i
+        edge <<= 2
+    return BUCKETS - 1
+
+class Stats:
+    def __init__(self, role, unit_id, timers, counters, gauges):
+        """timers/counters/gauges: number of each (names live in protocol.py)"""
+        self.role = role
+        self.unit_id = unit_id
+        self.timers = timers
+        self._count = array('L', [0] * timers)
+        self._sum = array('L', [0] * timers)
+        self._min = array('L', [0] * timers)
+        self._max = array('L', [0] * timers)
+        self._hist = array('H', [0] * (timers * BUCKETS))
+        self.counters = array('L', [0] * counters)
+        self.gauges = array('L', [0] * gauges)
+        self.seq = 0
+        self._buf = bytearray(protocol.stats_size(timers, counters, gauges))
+        self._period_start = time.ticks_ms()
+
+    def add(self, timer, us):
+        """Record one duration (microseconds)"""
+        n = self._count[timer]
+        if n == 0 or us < self._min[timer]:
+            self._min[timer] = us
+        if us > self._max[timer]:
+            self._max[timer] = us
+        self._count[timer] = n + 1
+        self._sum[timer] += us
+        i = timer * BUCKETS + bucket(us)
+        if self._hist[i] < 0xFFFF:
+            self._hist[i] += 1
+
+    def since(self, timer, start_us):
+        """Record the time since a time.ticks_us() reading"""
+        self.add(timer, time.ticks_diff(time.ticks_us(), start_us))
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def peak(self, gauge, value):
+        """Keep the largest value seen this period"""
+        if value > self.gauges[gauge]:
+            self.gauges[gauge] = value
+
+    def reset(self):
+        """Start a new period (counters keep counting)"""
+        for t in range(self.timers):
+            self._count[t] = self._sum[t] = self._min[t] = self._max[t] = 0
+        for i in range(len(self._hist)):
+            self._hist[i] = 0
+        for i in range(len(self.gauges)):
+            self.gauges[i] = 0
+        self._period_start = time.ticks_ms()
+
+    def pack(self):
+        """This period as a MSG_STATS datagram (a reused buffer); then reset()"""
+        now = time.ticks_ms()
+        self.seq = protocol.seq_next(self.seq)
+        buf = self._buf
+        offset = protocol.pack_stats_header(buf, self.role, self.unit_id, self.seq, now,
+                                            time.ticks_diff(now, self._period_start),
+                                            self.timers, len(self.counters), len(self.gauges))
+        for t in range(self.timers):
+            n = self._count[t]
+            offset = protocol.pack_stats_timer(buf, offset, n, self._min[t],
+                                               self._sum[t] // n if n else 0, self._max[t],
+                                               self._hist, t * BUCKETS)
+        offset = protocol.pack_stats_values(buf, offset, self.counters)
+        protocol.pack_stats_values(buf, offset, self.gauges)
+        self.reset()
+        return buf
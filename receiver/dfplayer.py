@@ -0,0 +1,138 @@
+# dfplayer.py - DFPlayer Mini driver
+#
+# Play packets for every known track are built once at startup, so a play
+# is a single uart.write() of a ready buffer. Replies from the module are
+# parsed from the UART in poll(): track finished (0x3D), errors (0x40) and
+# online (0x3F). The optional BUSY pin (LOW while playing) takes
+# precedence over replies for knowing whether a clip is still running.
+#
+# What plays when (rate limits, repeats, cutting a clip short) is decided
+# by scheduler.py, which calls play().
+from micropython import const
+import time
+
+_START = const(0x7E)
+_VERSION = const(0xFF)
+_LENGTH = const(0x06)
+_END = const(0xEF)
+PACKET_SIZE = const(10)
+
+CMD_PLAY = const(0x03)
+CMD_VOLUME = const(0x06)
+CMD_STOP = const(0x16)
+
+REPLY_USB_FINISHED = const(0x3C)
+REPLY_SD_FINISHED = const(0x3D)
+REPLY_FLASH_FINISHED = const(0x3E)
+REPLY_ONLINE = const(0x3F)
+REPLY_ERROR = const(0x40)
+
+# No finish reply or BUSY pin wired: assume a clip is over after this long
+_MAX_CLIP_MS = const(10000)
+_BUSY_LAG_MS = const(100)
+
+def build_packet(buf, cmd, param=0):
+    """Fill a 10-byte command packet; param is 16-bit (high, low byte)"""
+    buf[0] = _START
+    buf[1] = _VERSION
+    buf[2] = _LENGTH
+    buf[3] = cmd
+    buf[4] = 0x00  # No ACK requested
+    buf[5] = (param >> 8) & 0xFF
+    buf[6] = param & 0xFF
+    checksum = -(_VERSION + _LENGTH + cmd + buf[5] + buf[6]) & 0xFFFF
+    buf[7] = checksum >> 8
+    buf[8] = checksum & 0xFF
+    buf[9] = _END
+    return buf
+
+class DFPlayer:
+    def __init__(self, uart, tracks, busy=None, on_play=None, on_finish=None, on_error=None):
+        self.uart = uart
+        self.busy = busy  # Optional Pin: LOW while playing
+        self.on_play = on_play
+        self.on_finish = on_finish
+        self.on_error = on_error
+        # Precomputed play packets: track -> 10 bytes
+        self.packets = {}
+        for track in tracks:
+            self.packets[track] = bytes(build_packet(bytearray(PACKET_SIZE), CMD_PLAY, track))
+        self._cmd_buf = bytearray(PACKET_SIZE)
+        self._rx_buf = bytearray(PACKET_SIZE)
+        self._rx_len = 0
+        self.online = False
+        self.playing = 0  # Track currently playing, 0 = idle
+        self.started = time.ticks_ms()
+        self.errors = 0
+
+    # ===== Commands =====
+    def send(self, cmd, param=0):
+        self.uart.write(build_packet(self._cmd_buf, cmd, param))
+
+    def set_volume(self, volume):
+        self.send(CMD_VOLUME, max(0, min(30, volume)))
+
+    def stop(self):
+        self.send(CMD_STOP)
+        self.playing = 0
+
+    def play(self, track):
+        """Start a track now, whatever is playing"""
+        packet = self.packets.get(track)
+        if packet is None:
+            packet = build_packet(self._cmd_buf, CMD_PLAY, track)
+        self.uart.write(packet)
+        self.playing = track
+        self.started = time.ticks_ms()
+        if self.on_play:
+            self.on_play(track)
+
+    # ===== State =====
+    def is_playing(self):
+        if self.playing:
+            elapsed = time.ticks_diff(time.ticks_ms(), self.started)
+            if self.busy is not None:
+                # BUSY lags the play command: trust our own state briefly
+                if elapsed >= _BUSY_LAG_MS and self.busy.value():
+                    self.playing = 0
+            elif elapsed >= _MAX_CLIP_MS:
+                self.playing = 0
+        return self.playing != 0
+
+    def poll(self):
+        """Handle module replies"""
+        if self.uart.any():
+            data = self.uart.read()
+            if data:
+                for byte in data:
+                    self._feed(byte)
+
+    # ===== Replies =====
+    def _feed(self, byte):
+        buf = self._rx_buf
+        if self._rx_len == 0 and byte != _START:
+            return  # Resync on the start byte
+        buf[self._rx_len] = byte
+        self._rx_len += 1
+        if self._rx_len < PACKET_SIZE:
+            return
+        self._rx_len = 0
+        checksum = (buf[7] << 8) | buf[8]
+        if buf[9] != _END or (buf[1] + buf[2] + buf[3] + buf[4] + buf[5] + buf[6] + checksum) & 0xFFFF:
+            return
+        self._reply(buf[3], (buf[5] << 8) | buf[6])
+
+    def _reply(self, cmd, param):
+        if cmd in (REPLY_SD_FINISHED, REPLY_USB_FINISHED, REPLY_FLASH_FINISHED):
+            # The module reports some finishes twice; only the current clip counts
+            if param == self.playing:
+                self.playing = 0
+                if self.on_finish:
+                    self.on_finish(param)
+        elif cmd == REPLY_ONLINE:
+            self.online = True
+        elif cmd == REPLY_ERROR:
+            self.errors += 1
+            self.playing = 0  # The requested clip did not start
+            if self.on_error:
+                self.on_error(param)
@@ -1,6 +1,14 @@
 # receiver.py - Enhanced MicroPython for ESP32
-import network, socket, time, ujson
+import network, socket, time, ujson, gc
+import uasyncio as asyncio
+import machine
 from machine import UART, Pin
+import protocol
+import reliable
+import aqueue
+import dfplayer
+import scheduler
+import stats
 
 # ===== LED for status =====
 led = Pin(2, Pin.OUT)
@@ -39,10 +47,48 @@ if not config:
 SSID = config["wifi"]["ssid"]
 PASSWORD = config["wifi"]["password"]
 UDP_PORT = config["network"]["udp_port"]
+# Default receiver ID (sent in discovery answers): low 16 bits of the chip's unique ID
+RECEIVER_ID = config["network"].get("receiver_id")
+if RECEIVER_ID is None:
+    uid = machine.unique_id()
+    RECEIVER_ID = (uid[-2] << 8) | uid[-1]
 DF_TX = config["dfplayer"]["tx_pin"]
 DF_RX = config["dfplayer"]["rx_pin"]
 VOLUME = config["dfplayer"]["volume"]
+DF_BUSY = config["dfplayer"].get("busy_pin")  # None = track state from UART replies
+MIN_PLAY_MS = config["dfplayer"].get("min_play_ms", 500)  # Before a new color may cut in
+MIN_PLAY_INTERVAL = 3  # seconds between same color plays (per sender)
 COLOR_TO_TRACK = config["audio"]["track_map"]
+MAX_QUEUED = config["audio"].get("max_queued", 8)  # Pending announcements, all senders
+MAX_SENDERS = config["audio"].get("max_senders", 32)
+SENDER_RATE_MS = config["audio"].get("sender_rate_ms", 500)  # Min time between one sender's plays
+# Sender ID -> priority (higher is served first and may cut in)
+PRIORITIES = {int(k): v for k, v in config["audio"].get("priorities", {}).items()}
+TRACK_TO_COLOR = {track: color for color, track in COLOR_TO_TRACK.items()}
+# Optional collector for stats datagrams (utils/telemetry_collector.py)
+TELEMETRY = config.get("telemetry", {})
+TELEMETRY_HOST = TELEMETRY.get("host")  # None = no reports
+TELEMETRY_PORT = TELEMETRY.get("port", 4211)
+TELEMETRY_INTERVAL = TELEMETRY.get("interval", 10)  # seconds
+
+# ===== Instrumentation =====
+# Metric indices, in the order of protocol.RECEIVER_TIMERS/_COUNTERS/_GAUGES
+T_HANDLE, T_QUEUE_WAIT, T_GC = range(3)
+C_DATAGRAMS, C_DUPLICATES, C_LATE, C_DROPPED, C_PLAYS, C_PLAYER_ERRORS = range(6)
+G_QUEUED, G_SENDERS, G_FREE_HEAP = range(3)
+telemetry = stats.Stats(protocol.ROLE_RECEIVER, RECEIVER_ID, len(protocol.RECEIVER_TIMERS),
+                        len(protocol.RECEIVER_COUNTERS), len(protocol.RECEIVER_GAUGES))
+event_buf = bytearray(protocol.EVENT_SIZE)
+
+def send_event(code, value=0):
+    """Report a protocol.EVT_* event to the collector right away (if configured)"""
+    if not TELEMETRY_HOST:
+        return
+    try:
+        sock.sendto(protocol.pack_event(event_buf, protocol.ROLE_RECEIVER, RECEIVER_ID, code, value),
+                    (TELEMETRY_HOST, TELEMETRY_PORT))
+    except OSError as e:
+        print("Telemetry send error:", e)
 
 # ===== WiFi Functions =====
 def wifi_connect(ssid, password, timeout=20):
@@ -58,33 +104,30 @@ def wifi_connect(ssid, password, timeout=20):
             time.sleep(0.5)
     return wlan
 
-# ===== DFPlayer Functions =====
+# ===== DFPlayer =====
 uart = UART(2, baudrate=9600, tx=DF_TX, rx=DF_RX)
+busy = Pin(DF_BUSY, Pin.IN) if DF_BUSY is not None else None
 time.sleep(0.1)
 
-def dfplayer_send(cmd, param1=0, param2=0):
-    head = 0x7E
-    ver = 0xFF
-    length = 0x06
-    feedback = 0x00
-    high = param1 & 0xFF
-    low = param2 & 0xFF
-    checksum = -(ver + length + cmd + feedback + high + low) & 0xFFFF
-    chkh = (checksum >> 8) & 0xFF
-    chkl = checksum & 0xFF
-    packet = bytearray([head, ver, length, cmd, feedback, high, low, chkh, chkl, 0xEF])
-    uart.write(packet)
-
-def df_play(track_no):
-    if 1 <= track_no <= 3000:
-        dfplayer_send(0x03, 0x00, track_no)
-
-def df_set_volume(volume):
-    volume = max(0, min(30, volume))
-    dfplayer_send(0x06, 0x00, volume)
-
-def df_stop():
-    dfplayer_send(0x16)
+def on_play(track):
+    ip, sender_id = audio.owner.key
+    telemetry.count(C_PLAYS)
+    telemetry.add(T_QUEUE_WAIT, time.ticks_diff(time.ticks_ms(), audio.owner.since) * 1000)
+    print(f"  ♪ Playing track {track}: {TRACK_TO_COLOR.get(track, track)} (for {ip}#{sender_id})")
+    led_signal(2, 0.1)
+
+def on_play_error(code):
+    telemetry.count(C_PLAYER_ERRORS)
+    send_event(protocol.EVT_PLAYER_ERROR, code)
+    print(f"  DFPlayer error {code}")
+    led_signal(5, 0.05)
+
+player = dfplayer.DFPlayer(uart, TRACK_TO_COLOR, busy=busy,
+                           on_play=on_play, on_error=on_play_error)
+# Per-sender state table and fair scheduling in front of the player
+audio = scheduler.Scheduler(player, max_queued=MAX_QUEUED, max_senders=MAX_SENDERS,
+                            rate_ms=SENDER_RATE_MS, repeat_ms=MIN_PLAY_INTERVAL * 1000,
+                            preempt_ms=MIN_PLAY_MS, priorities=PRIORITIES)
 
 # ===== Initialize =====
 print("\n" + "="*40)
@@ -101,66 +144,163 @@ ip = wlan.ifconfig()[0]
 print(f"WiFi connected! IP: {ip}")
 blink_led(3, 0.1)
 
-# Setup UDP socket
+# Setup UDP socket (non-blocking: reader_task polls it between other tasks)
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(1.0)
+sock.setblocking(False)
 sock.bind(('', UDP_PORT))
-print(f"Listening on UDP port {UDP_PORT}")
+print(f"Listening on UDP port {UDP_PORT} (receiver ID {RECEIVER_ID})")
+send_event(protocol.EVT_BOOT, machine.reset_cause())
 
 # Initialize DFPlayer
 time.sleep(0.3)
-df_set_volume(VOLUME)
+player.set_volume(VOLUME)
 time.sleep(0.2)
+player.poll()
 print(f"DFPlayer ready (Volume: {VOLUME})")
 
-print("\nWaiting for color data...")
-print("="*40 + "\n")
+# ===== Tasks =====
+# reader_task -> audio (scheduler.Scheduler) -> audio_task -> player
+# The reader ACKs every datagram as soon as it is read; playback and LED
+# feedback happen in their own tasks, so neither delays the next message.
+RECV_POLL_MS = 5  # Idle poll interval of the non-blocking socket
+AUDIO_POLL_MS = 20  # Reply/BUSY poll interval while a clip is playing
 
-# ===== Main Loop =====
-last_played = None
-last_play_time = 0
-MIN_PLAY_INTERVAL = 3  # seconds between same color plays
+led_patterns = aqueue.Queue(4)  # (times, duration)
+audio_wake = asyncio.Event()  # Set when an announcement is queued
+ack_buf = bytearray(protocol.ACK_SIZE)
+announce_buf = bytearray(protocol.ANNOUNCE_SIZE)
+CAPABILITIES = protocol.CAP_BINARY | protocol.CAP_TEXT | protocol.CAP_AUDIO
 
-while True:
-    try:
-        data, addr = sock.recvfrom(512)
-        if not data:
-            continue
+def led_signal(times=1, duration=0.1):
+    """Non-blocking blink_led(): queue a pattern for led_task"""
+    led_patterns.put_nowait((times, duration))
+
+async def led_task():
+    while True:
+        times, duration = await led_patterns.get()
+        for _ in range(times):
+            led.on()
+            await asyncio.sleep(duration)
+            led.off()
+            await asyncio.sleep(duration)
+
+def handle_datagram(data, addr):
+    """Answer a discovery probe, or ACK a color and queue it with the sender's state"""
+    # Parse message: binary (protocol.py) or legacy "Color:confidence"
+    if protocol.is_binary(data):
+        if protocol.msg_type(data) == protocol.MSG_DISCOVER:
+            probe = protocol.unpack_discover(data)
+            if probe:
+                # Answer directly to the prober, whatever address it broadcast to
+                print(f"Discovery probe from {addr[0]}#{probe[0]}")
+                sock.sendto(protocol.pack_announce(announce_buf, RECEIVER_ID, probe[1],
+                                                   CAPABILITIES, len(TRACK_TO_COLOR)), addr)
+            return
+        msg = protocol.unpack_color(data)
+        if msg is None:
+            print(f"Unsupported message from {addr[0]}")
+            return
+        sender_id, seq, track, conf_u8, _ = msg
+        color = TRACK_TO_COLOR.get(track, track)
+        confidence = conf_u8 / 255
+        
+        print(f"Received from {addr[0]}#{sender_id} seq {seq}: {color} ({confidence:.1%})")
+        
+        # ACK every copy (the previous ACK may have been lost)
+        sock.sendto(protocol.pack_ack(ack_buf, sender_id, seq), addr)
         
-        # Parse message: "Color:confidence"
-        text = data.decode('utf-8').strip()
-        parts = text.split(':')
-        color = parts[0]
-        confidence = float(parts[1]) if len(parts) > 1 else 0.0
+        # Drop retransmits and stale (reordered) messages before playing
+        sender = audio.sender(addr[0], sender_id)
+        verdict = sender.window.check(seq)
+        if verdict == reliable.DUPLICATE:
+            telemetry.count(C_DUPLICATES)
+            print("  Dropping duplicate")
+            return
+        if verdict == reliable.LATE:
+            telemetry.count(C_LATE)
+            print("  Dropping reordered message")
+            return
+    else:
+        color, confidence = protocol.parse_text(data)
+        track = COLOR_TO_TRACK.get(color)
         
         print(f"Received from {addr[0]}: {color} ({confidence:.1%})")
         
         # Send ACK
         sock.sendto(b"ACK", addr)
-        
-        # Check if valid color
-        if color not in COLOR_TO_TRACK:
-            print(f"  Unknown color: {color}")
+        sender = audio.sender(addr[0])
+    
+    # Check if valid color
+    if track not in TRACK_TO_COLOR:
+        print(f"  Unknown color: {color}")
+        return
+    
+    result = audio.submit(sender, track, color)
+    if result == scheduler.REPEAT:
+        print(f"  Skipping {color} (played recently)")
+    elif result == scheduler.DROPPED:
+        print(f"  Dropping {color} (audio queue full)")
+    else:
+        telemetry.peak(G_QUEUED, audio.queued)
+        audio_wake.set()
+
+async def reader_task():
+    while True:
+        try:
+            data, addr = sock.recvfrom(512)
+        except OSError:
+            # Nothing waiting (EAGAIN)
+            await asyncio.sleep_ms(RECV_POLL_MS)
             continue
-        
-        # Avoid replaying same color too quickly
-        current_time = time.time()
-        if color == last_played and (current_time - last_play_time) < MIN_PLAY_INTERVAL:
-            print(f"  Skipping (played recently)")
+        if not data:
             continue
-        
-        # Play track
-        track = COLOR_TO_TRACK[color]
-        print(f"  ♪ Playing track {track}: {color}")
-        df_play(track)
-        blink_led(2, 0.1)
-        
-        last_played = color
-        last_play_time = current_time
-        
-    except socket.timeout:
-        continue
-    except Exception as e:
-        print("Error:", e)
-        blink_led(5, 0.05)
-        time.sleep(0.5)
+        telemetry.count(C_DATAGRAMS)
+        start = time.ticks_us()
+        try:
+            handle_datagram(data, addr)
+            telemetry.since(T_HANDLE, start)
+        except Exception as e:
+            print("Error:", e)
+            led_signal(5, 0.05)
+
+async def audio_task():
+    while True:
+        try:
+            if not audio.active():
+                await audio_wake.wait()
+                audio_wake.clear()
+                player.poll()  # Drain replies that arrived while idle
+            else:
+                await asyncio.sleep_ms(AUDIO_POLL_MS)
+            audio.run()
+        except Exception as e:
+            print("DFPlayer error:", e)
+            led_signal(5, 0.05)
+
+async def telemetry_task():
+    """Send a stats datagram every TELEMETRY_INTERVAL seconds"""
+    addr = (TELEMETRY_HOST, TELEMETRY_PORT)
+    while True:
+        await asyncio.sleep(TELEMETRY_INTERVAL)
+        # Collect here and time it: the pause an automatic collection
+        # would otherwise add while handling a datagram
+        start = time.ticks_us()
+        gc.collect()
+        telemetry.since(T_GC, start)
+        telemetry.gauges[G_FREE_HEAP] = gc.mem_free()
+        telemetry.gauges[G_SENDERS] = len(audio.senders)
+        telemetry.counters[C_DROPPED] = audio.dropped
+        try:
+            sock.sendto(telemetry.pack(), addr)
+        except OSError as e:
+            print("Telemetry send error:", e)
+
+async def main():
+    print("\nWaiting for color data...")
+    print("="*40 + "\n")
+    tasks = [reader_task(), audio_task(), led_task()]
+    if TELEMETRY_HOST:
+        tasks.append(telemetry_task())
+    await asyncio.gather(*tasks)
+
+asyncio.run(main())
@@ -0,0 +1,169 @@
+# scheduler.py - Per-sender state and fair announcement scheduling
+#
+# Every sender (keyed by (ip, sender ID)) gets one small Sender entry:
+# duplicate window, last color played, one pending announcement slot,
+# rate limit and priority. A sender never holds more than one pending
+# announcement - a newer color replaces it - so a noisy unit cannot fill
+# the queue.
+#
+# When the player is free, the next announcement comes from the highest
+# priority sender that is due (rate_ms since its last play), and among
+# equals from the one served least recently, i.e. round-robin. After
+# preempt_ms a higher priority sender may cut any clip short, and a sender
+# may cut its own stale clip when nobody else is waiting; otherwise the
+# next announcement waits for the clip to finish.
+#
+# Uploaded to the receiver, so keep it MicroPython-safe.
+import time
+import reliable
+
+# submit() results
+QUEUED = 0
+REPLACED = 1  # Replaced this sender's older pending announcement
+REPEAT = 2    # Same color as this sender's last play within repeat_ms
+DROPPED = 3   # Queue full; this sender is the one to wait
+
+def _goes_before(a, b):
+    """Round-robin order: never played first, then least recently played, then oldest request"""
+    if (a.last_track == 0) != (b.last_track == 0):
+        return a.last_track == 0
+    if a.last_track and a.last_play != b.last_play:
+        return time.ticks_diff(a.last_play, b.last_play) < 0
+    return time.ticks_diff(a.since, b.since) < 0
+
+class Sender:
+    def __init__(self, key, priority=0):
+        self.key = key
+        self.priority = priority
+        self.window = reliable.SeqWindow()
+        self.last_track = 0
+        self.last_play = time.ticks_ms()  # Only meaningful once last_track is set
+        self.last_seen = self.last_play
+        self.track = 0  # Pending announcement, 0 = none
+        self.color = None
+        self.since = 0  # When it was queued
+        self.plays = 0
+        self.dropped = 0
+
+class Scheduler:
+    def __init__(self, player, max_queued=8, max_senders=32, rate_ms=500,
+                 repeat_ms=3000, preempt_ms=500, priorities=None):
+        self.player = player
+        self.max_queued = max_queued
+        self.max_senders = max_senders
+        self.rate_ms = rate_ms
+        self.repeat_ms = repeat_ms
+        self.preempt_ms = preempt_ms
+        self.priorities = priorities or {}  # sender ID -> priority, higher first
+        self.senders = {}
+        self.queued = 0
+        self.owner = None  # Sender whose clip is playing
+        self.dropped = 0
+
+    def sender(self, ip, sender_id=0):
+        """State entry for a sender, created on first contact"""
+        key = (ip, sender_id)
+        entry = self.senders.get(key)
+        if entry is None:
+            if len(self.senders) >= self.max_senders:
+                self._evict()
+            entry = self.senders[key] = Sender(key, self.priorities.get(sender_id, 0))
+        entry.last_seen = time.ticks_ms()
+        return entry
+
+    def _evict(self):
+        # Forget the sender silent the longest (its pending slot goes with it)
+        now = time.ticks_ms()
+        oldest = None
+        for entry in self.senders.values():
+            if oldest is None or (time.ticks_diff(now, entry.last_seen) >
+                                  time.ticks_diff(now, oldest.last_seen)):
+                oldest = entry
+        if oldest.track:
+            self.queued -= 1
+        if oldest is self.owner:
+            self.owner = None
+        del self.senders[oldest.key]
+
+    def submit(self, sender, track, color):
+        """Queue an announcement; returns QUEUED, REPLACED, REPEAT or DROPPED"""
+        now = time.ticks_ms()
+        if track == sender.last_track and time.ticks_diff(now, sender.last_play) < self.repeat_ms:
+            if sender.track:
+                # Back to what was just announced: the pending change is moot
+                sender.track = 0
+                self.queued -= 1
+            return REPEAT
+        if sender.track:
+            result = REPLACED
+        else:
+            sender.since = now
+            if self.queued >= self.max_queued and not self._drop_for(sender):
+                sender.dropped += 1
+                self.dropped += 1
+                return DROPPED
+            self.queued += 1
+            result = QUEUED
+        sender.track = track
+        sender.color = color
+        sender.since = now
+        return result
+
+    def _drop_for(self, sender):
+        """Free a slot from the lowest priority sender that would be served last
+        (possibly the submitting one: then nothing is dropped and we return False)"""
+        victim = sender
+        for entry in self.senders.values():
+            if entry.track and (entry.priority < victim.priority or
+                                (entry.priority == victim.priority and
+                                 _goes_before(victim, entry))):
+                victim = entry
+        if victim is sender:
+            return False
+        victim.track = 0
+        victim.dropped += 1
+        self.dropped += 1
+        self.queued -= 1
+        return True
+
+    def active(self):
+        return self.queued > 0 or self.player.is_playing()
+
+    def _next(self, now):
+        """Pending sender to serve next, or None"""
+        best = None
+        for entry in self.senders.values():
+            if not entry.track:
+                continue
+            if entry.last_track and time.ticks_diff(now, entry.last_play) < self.rate_ms:
+                continue
+            if best is None or entry.priority > best.priority or (
+                    entry.priority == best.priority and _goes_before(entry, best)):
+                best = entry
+        return best
+
+    def run(self):
+        """Handle player replies and start the next announcement when allowed"""
+        self.player.poll()
+        if not self.queued:
+            return
+        now = time.ticks_ms()
+        entry = self._next(now)
+        if entry is None:
+            return
+        if self.player.is_playing():
+            # Cut in only with higher priority, or on our own stale clip when
+            # nobody else is waiting - others wait for the clip to end
+            owner = self.owner
+            if owner is not None and entry is not owner and entry.priority <= owner.priority:
+                return
+            if time.ticks_diff(now, self.player.started) < self.preempt_ms:
+                return
+        track = entry.track
+        entry.last_track = track
+        entry.last_play = now
+        entry.track = 0
+        entry.plays += 1
+        self.queued -= 1
+        self.owner = entry
+        self.player.play(track)
@@ -0,0 +1,198 @@
+# calibration.py - Persisted white calibration and background drift estimation
+#
+# The white calibration is stored in calibration.json, in the format of
+# config/calibration_data.json (white_reference, calibration_factors,
+# last_calibration, performance_stats; other sections are preserved). A
+# valid file is loaded at boot, so detection starts at once; a full
+# calibration only runs when there is no usable file or it is requested.
+#
+# white_reference holds counts scaled to the driver's 50ms / 4x reference
+# (tcs34725 read_scaled_into), whatever range they were read at. Files
+# from before auto-ranging call it raw_white_reference; those counts were
+# read at the fixed 50ms / 4x, i.e. the same scale, and are still loaded.
+#
+# Calibration and drift statistics are robust: a per-channel trimmed mean
+# (measure) and median (DriftEstimator), so a shadow or a flicker in a
+# handful of samples does not skew the factors.
+#
+# DriftEstimator watches the readings the sender takes anyway. Samples
+# about as bright as the stored white (clear within `clear_band`) and
+# neutral to within `neutral_band` after calibration are white-reference
+# candidates; once a window of them in a row is collected (a white card
+# held still for a while: a change in brightness starts over, up to one
+# in ten noisy non-neutral samples are skipped), their median gives fresh
+# factors. If these differ from the current ones by more than `tolerance`
+# (but less than `max_shift`, beyond which the surface is taken to be
+# off-white rather than the same white under drifted light) the new
+# calibration is returned to be applied and saved. Larger drifts are
+# followed in steps.
+#
+# Uploaded to the sender, so keep it MicroPython-safe.
+from array import array
+import time
+import ujson
+
+CALIBRATION_FILE = "calibration.json"
+FACTOR_RANGE = (0.2, 5.0)  # Anything outside is a broken file or a bad white
+
+def median(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    mid = n // 2
+    return ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+def trimmed_mean(values, trim=0.2):
+    """Mean without the lowest and highest `trim` fraction of values"""
+    ordered = sorted(values)
+    k = int(len(ordered) * trim)
+    kept = ordered[k:len(ordered) - k] or ordered
+    return sum(kept) / len(kept)
+
+def factors_for(white):
+    """(r, g, b) multipliers that make a white reading neutral"""
+    top = max(white[0], white[1], white[2])
+    return tuple(top / v if v > 0 else 1.0 for v in white[:3])
+
+def timestamp():
+    t = time.localtime()
+    return "%04d-%02d-%02dT%02d:%02d:%02d" % (t[0], t[1], t[2], t[3], t[4], t[5])
+
+# ===== Persistence =====
+def load(path=CALIBRATION_FILE):
+    """Stored calibration dict, or None when missing or invalid"""
+    try:
+        with open(path) as f:
+            data = ujson.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        f = data["calibration_factors"]
+        factors = (float(f["red_factor"]), float(f["green_factor"]), float(f["blue_factor"]))
+        w = _white_entry(data)
+        white = (int(w["red"]), int(w["green"]), int(w["blue"]), int(w["clear"]))
+    except (KeyError, TypeError, ValueError):
+        print("Calibration file incomplete, ignoring it")
+        return None
+    if min(factors) < FACTOR_RANGE[0] or max(factors) > FACTOR_RANGE[1] or min(white) <= 0:
+        print("Calibration file out of range, ignoring it")
+        return None
+    return data
+
+def factors_of(data):
+    f = data["calibration_factors"]
+    return (f["red_factor"], f["green_factor"], f["blue_factor"])
+
+def _white_entry(data):
+    w = data.get("white_reference")
+    return w if w is not None else data["raw_white_reference"]  # Older files
+
+def white_of(data):
+    w = _white_entry(data)
+    return (w["red"], w["green"], w["blue"], w["clear"])
+
+def update(data, white, source):
+    """Record a new white reference (and its factors) in data; returns data"""
+    data = data or {}
+    factors = factors_for(white)
+    data["last_calibration"] = timestamp()
+    data.pop("raw_white_reference", None)
+    data["white_reference"] = {"red": int(white[0]), "green": int(white[1]),
+                               "blue": int(white[2]), "clear": int(white[3])}
+    data["calibration_factors"] = {"red_factor": round(factors[0], 3),
+                                   "green_factor": round(factors[1], 3),
+                                   "blue_factor": round(factors[2], 3)}
+    conditions = data.setdefault("calibration_conditions", {})
+    conditions["source"] = source  # "white" (requested) or "drift" (background)
+    stats = data.setdefault("performance_stats", {})
+    stats["total_calibrations"] = stats.get("total_calibrations", 0) + 1
+    return data
+
+def save(data, path=CALIBRATION_FILE):
+    try:
+        with open(path, "w") as f:
+            ujson.dump(data, f)
+    except OSError as e:
+        print("Could not save calibration:", e)
+
+# ===== Measurement =====
+def measure(read_into, samples=10, interval_ms=200, trim=0.2):
+    """Sample a white surface; returns the robust (r, g, b, clear) reference,
+    or None when fewer than half of the reads succeed or the light is too low"""
+    raw = [0, 0, 0, 0]
+    channels = ([], [], [], [])
+    for i in range(samples):
+        try:
+            read_into(raw)
+        except Exception as e:
+            print(f"  Sample {i+1}: read failed ({e})")
+            continue
+        for c in range(4):
+            channels[c].append(raw[c])
+        print(f"  Sample {i+1}: R={raw[0]} G={raw[1]} B={raw[2]} C={raw[3]}")
+        time.sleep_ms(interval_ms)
+    if len(channels[0]) * 2 < samples:
+        print(f"Only {len(channels[0])}/{samples} reads succeeded")
+        return None
+    white = tuple(int(trimmed_mean(values, trim)) for values in channels)
+    if min(white[:3]) <= 0:
+        print("No light on the sensor")
+        return None
+    return white
+
+# ===== Drift =====
+class DriftEstimator:
+    def __init__(self, factors, white, window=100, tolerance=0.03, max_shift=0.06,
+                 neutral_band=0.08, clear_band=0.15):
+        """factors/white: current calibration; tolerance/max_shift: relative
+        factor change that counts as drift / as not white after all;
+        window: candidates in a row (100 = 20s at sample_delay 0.2)"""
+        self.window = window
+        self.tolerance = tolerance
+        self.max_shift = max_shift
+        self.neutral_band = neutral_band
+        self.clear_band = clear_band
+        self._ring = [array('L', [0] * window) for _ in range(4)]
+        self._count = 0
+        self._misses = 0
+        self.corrections = 0
+        self.reset(factors, white)
+
+    def reset(self, factors, white):
+        """Start over with a new calibration"""
+        self.factors = factors
+        self.white = white
+        self._count = self._misses = 0
+
+    def observe(self, r, g, b, clear):
+        """Feed one reading; returns a new white reference when drift is detected, else None"""
+        if abs(clear - self.white[3]) > self.white[3] * self.clear_band:
+            self._count = self._misses = 0
+            return None  # Not the stored white's brightness: grey, or another surface
+        f = self.factors
+        cr, cg, cb = r * f[0], g * f[1], b * f[2]
+        top = max(cr, cg, cb)
+        if top <= 0 or top - min(cr, cg, cb) > top * self.neutral_band:
+            self._misses += 1
+            if self._misses > self.window // 10:
+                self._count = self._misses = 0
+            return None  # Not white under the current calibration
+        i = self._count
+        self._ring[0][i] = r
+        self._ring[1][i] = g
+        self._ring[2][i] = b
+        self._ring[3][i] = clear
+        self._count = i + 1
+        if self._count < self.window:
+            return None
+        self._count = self._misses = 0
+
+        white = tuple(int(median(channel)) for channel in self._ring)
+        if min(white[:3]) <= 0:
+            return None
+        new = factors_for(white)
+        shift = max(abs(n / o - 1) for n, o in zip(new, f))
+        if shift < self.tolerance or shift > self.max_shift:
+            return None
+        self.corrections += 1
+        self.reset(new, white)
+        return white
@@ -0,0 +1,129 @@
+# capture.py - Raw RGBC sample capture for offline classifier evaluation
+#
+# Every reading is kept as one fixed 16-byte protocol.CAPTURE_RECORD_FORMAT
+# record: timestamp, the unscaled r/g/b/clear counts, the ATIME and gain
+# register values they were taken with, and a label (the wire color ID
+# of the surface, when known). utils/capture_replay.py rebuilds the
+# scaled readings from these and runs the classifier over them.
+#
+# Two sinks, both filling a preallocated block of records first:
+#
+#   FlashRing   capture.bin: a FILE_HEADER_FORMAT header, then `capacity`
+#               records; the oldest are overwritten once it is full. Each
+#               full block is one write, then the header (total count).
+#   UdpCapture  each full block goes out as one MSG_CAPTURE datagram
+#               (utils/capture_replay.py receive)
+#
+# Host capture files share the file header; capacity 0 marks a plain
+# append-only file.
+#
+# Uploaded to the sender, so keep it MicroPython-safe.
+import struct
+import protocol
+
+CAPTURE_FILE = "capture.bin"
+FILE_MAGIC = b"SCAP"
+FILE_VERSION = 1
+FILE_HEADER_FORMAT = "<4sBBHII"  # magic, version, record size, sender ID, capacity, records written
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)  # 16 bytes
+RECORD_SIZE = protocol.CAPTURE_RECORD_SIZE
+BLOCK = 32  # Records per flash write / datagram (512 bytes)
+
+class FlashRing:
+    def __init__(self, sender_id, capacity=4096, path=CAPTURE_FILE, block=BLOCK):
+        self.sender_id = sender_id
+        self.capacity = capacity
+        self.block = block
+        self._buf = bytearray(block * RECORD_SIZE)
+        self._header = bytearray(FILE_HEADER_SIZE)
+        self._count = 0
+        self.total = self._resume(path)
+        self._file = open(path, "r+b")
+
+    def _resume(self, path):
+        """Records written so far by an earlier run; (re)creates the file if unusable"""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(FILE_HEADER_SIZE)
+            if len(header) < FILE_HEADER_SIZE:
+                raise ValueError("truncated header")  # CPython's struct.error is no ValueError
+            magic, version, size, _, capacity, total = struct.unpack(FILE_HEADER_FORMAT, header)
+            if (magic, version, size, capacity) == (FILE_MAGIC, FILE_VERSION, RECORD_SIZE, self.capacity):
+                return total
+        except (OSError, ValueError):
+            pass
+        # Allocate the whole ring up front, so a full flash shows at once
+        with open(path, "wb") as f:
+            f.write(self._pack_header(0))
+            for _ in range(self.capacity // self.block):
+                f.write(self._buf)
+            f.write(bytes((self.capacity % self.block) * RECORD_SIZE))
+        return 0
+
+    def _pack_header(self, total):
+        struct.pack_into(FILE_HEADER_FORMAT, self._header, 0, FILE_MAGIC, FILE_VERSION,
+                         RECORD_SIZE, self.sender_id, self.capacity, total)
+        return self._header
+
+    def add(self, timestamp, raw, atime, gain, label=protocol.CAPTURE_UNLABELLED):
+        protocol.pack_capture_record(self._buf, self._count * RECORD_SIZE, timestamp, raw,
+                                     atime, gain, label)
+        self._count += 1
+        if self._count == self.block:
+            self.flush()
+
+    def flush(self):
+        """Write the pending records (at most two writes when the ring wraps)"""
+        pending = memoryview(self._buf)
+        n = self._count
+        done = 0
+        while done < n:
+            head = (self.total + done) % self.capacity
+            k = min(n - done, self.capacity - head)
+            self._file.seek(FILE_HEADER_SIZE + head * RECORD_SIZE)
+            self._file.write(pending[done * RECORD_SIZE:(done + k) * RECORD_SIZE])
+            done += k
+        self.total += n
+        self._count = 0
+        self._file.seek(0)
+        self._file.write(self._pack_header(self.total))
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+class UdpCapture:
+    def __init__(self, sock, addr, sender_id, block=BLOCK):
+        self.sock = sock
+        self.addr = addr
+        self.sender_id = sender_id
+        self.block = block
+        self._buf = bytearray(protocol.CAPTURE_HEADER_SIZE + block * RECORD_SIZE)
+        self._count = 0
+        self.seq = protocol.seq_start()  # A restart does not replay batch numbers the host has seen
+        self.total = 0
+
+    def add(self, timestamp, raw, atime, gain, label=protocol.CAPTURE_UNLABELLED):
+        protocol.pack_capture_record(self._buf, protocol.CAPTURE_HEADER_SIZE + self._count * RECORD_SIZE,
+                                     timestamp, raw, atime, gain, label)
+        self._count += 1
+        if self._count == self.block:
+            self.flush()
+
+    def flush(self):
+        """Send the pending records; dropped (and counted by the host) on a send error"""
+        if not self._count:
+            return
+        self.seq = protocol.seq_next(self.seq)
+        protocol.pack_capture_header(self._buf, self.sender_id, self.seq, self._count)
+        try:
+            self.sock.sendto(memoryview(self._buf)[:protocol.CAPTURE_HEADER_SIZE
+                                                   + self._count * RECORD_SIZE], self.addr)
+        except OSError as e:
+            print("Capture send error:", e)
+        self.total += self._count
+        self._count = 0
+
+    def close(self):
+        self.flush()
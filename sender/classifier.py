@@ -0,0 +1,135 @@
+# classifier.py - Calibrated RGB -> color name classification
+#
+# The sender's detect_rgb_color_enhanced() with its state passed in, so
+# host tools (utils/capture_replay.py) run exactly the code the sender
+# runs:
+#
+#   1. calibration factors
+#   2. Black below min_intensity per channel on average, in calibrated
+#      counts (before the scaling below, which would cap the total at 765)
+#   3. scale so the largest channel is <= 255
+#   4. palette nearest neighbour (palette.py) when a palette is given,
+#      else White for bright near-neutral readings and the chromaticity
+#      table (color_lut.py) for everything else
+#
+# FixedClassifier is the table path (1-3 and the table part of 4) in
+# integers only: factors scaled by 4096 (fixed_factor()), the 0-255
+# normalization and every comparison as integer products, and the result
+# packed into one small int, (color ID << 8) | confidence 0-255. On
+# MicroPython small ints are not heap objects, so a call allocates
+# nothing; classify() is compiled with @micropython.native there and runs
+# as plain Python (same arithmetic, same results) elsewhere.
+#
+# Shared by the sender and the host tools, so keep it MicroPython-safe.
+try:
+    import micropython
+    from micropython import const
+except ImportError:
+    # CPython: @micropython.native is only a compiler hint
+    class micropython:
+        @staticmethod
+        def native(f):
+            return f
+
+    def const(value):
+        return value
+
+MAX_TOTAL = 700  # r + g + b above which a neutral reading is White
+_FACTOR_SHIFT = const(12)  # Fixed-point calibration factors: factor * 4096
+_MAX_TOTAL = const(700)
+_NEUTRAL_SPREAD = const(50)
+_CONF_NEUTRAL = const(230)  # 0.9 as 0-255, the confidence of Black and White
+
+def detect(r, g, b, factors, min_intensity, lut, palette=None):
+    """Returns (color name, confidence 0.0-1.0) for scaled RGB counts"""
+    # Apply calibration
+    r = int(r * factors[0])
+    g = int(g * factors[1])
+    b = int(b * factors[2])
+
+    # Black detection
+    if r + g + b < min_intensity * 3:
+        return "Black", 0.9
+
+    # Normalize to 0-255 if needed
+    max_val = max(r, g, b)
+    if max_val > 255:
+        scale = 255 / max_val
+        r, g, b = int(r * scale), int(g * scale), int(b * scale)
+
+    total = r + g + b
+
+    if palette:
+        # d is 4 * ΔE^2; confidence falls off linearly with ΔE
+        color_id, d = palette.nearest_rgb(r, g, b)
+        return palette.name(color_id), max(0.0, 0.95 - (d ** 0.5) / 100)
+
+    # White detection
+    if total > MAX_TOTAL and abs(r-g) < 50 and abs(g-b) < 50 and abs(r-b) < 50:
+        return "White", 0.9
+
+    # Chromaticity lookup (one table index, see color_lut.py)
+    color_id, conf = lut.classify(r, g, b)
+    return lut.name(color_id), conf / 255
+
+def fixed_factor(factor):
+    return int(factor * (1 << _FACTOR_SHIFT) + 0.5)
+
+class FixedClassifier:
+    def __init__(self, lut, factors, min_intensity):
+        self.min_total = min_intensity * 3
+        self.set_table(lut)
+        self.set_factors(factors)
+
+    def set_table(self, lut):
+        self.table = lut.table
+        self.levels = lut.levels
+        self.black = lut.names.index("Black")
+        self.white = lut.names.index("White")
+
+    def set_factors(self, factors):
+        """New calibration (float factors, as calibration.factors_of() returns them)"""
+        self.fr = fixed_factor(factors[0])
+        self.fg = fixed_factor(factors[1])
+        self.fb = fixed_factor(factors[2])
+
+    @micropython.native
+    def classify(self, r, g, b):
+        """(color_id << 8) | confidence 0-255 for scaled RGB counts"""
+        r = (r * self.fr) >> _FACTOR_SHIFT
+        g = (g * self.fg) >> _FACTOR_SHIFT
+        b = (b * self.fb) >> _FACTOR_SHIFT
+        if r + g + b < self.min_total:
+            return (self.black << 8) | _CONF_NEUTRAL
+
+        # Normalize to 0-255 if needed
+        top = r
+        if g > top:
+            top = g
+        if b > top:
+            top = b
+        if top > 255:
+            r = r * 255 // top
+            g = g * 255 // top
+            b = b * 255 // top
+
+        total = r + g + b
+        if total > _MAX_TOTAL:
+            # |r-g|, |g-b|, |r-b| all under the spread
+            if (-_NEUTRAL_SPREAD < r - g < _NEUTRAL_SPREAD and -_NEUTRAL_SPREAD < g - b < _NEUTRAL_SPREAD
+                    and -_NEUTRAL_SPREAD < r - b < _NEUTRAL_SPREAD):
+                return (self.white << 8) | _CONF_NEUTRAL
+        if total <= 0:
+            return 0  # Unknown
+
+        # Chromaticity lookup, as color_lut.ColorLUT.classify()
+        levels = self.levels
+        ri = r * levels // total
+        gi = g * levels // total
+        if ri >= levels:
+            ri = levels - 1
+        if gi >= levels:
+            gi = levels - 1
+        i = (ri * levels + gi) << 1
+        table = self.table
+        return (table[i] << 8) | table[i + 1]
@@ -0,0 +1,86 @@
+# color_filter.py - Temporal filter between the classifier and the network
+#
+# The last WINDOW classifications live in a fixed ring buffer (color IDs
+# and confidences, 0-255). Each frame votes for its color with its
+# confidence, so an uncertain frame barely counts and one noisy frame
+# cannot outvote a run of good ones.
+#
+#   enter: a color holds the majority of the window, both by frames and
+#          by confidence, and the EWMA of its confidence reaches the
+#          threshold -> announced once
+#   hold:  it stays the confirmed color while any confident frame of it
+#          remains, so it is never re-announced while it is in view
+#   exit:  once its support drops below one confident frame the state is
+#          cleared, and the next confirmation is announced again
+#
+# With the default window of 3, a clean change is confirmed on its second
+# sample (2 of 3 votes), and a single noisy frame does not reset the count.
+#
+# Uploaded to the sender, so keep it MicroPython-safe.
+from array import array
+
+UNKNOWN = 0  # Votes against other colors but is never confirmed
+
+class ColorFilter:
+    def __init__(self, window=3, threshold=153, alpha_shift=1):
+        """threshold: confidence 0-255; EWMA weight of a new frame is 1/2**alpha_shift"""
+        self.window = window
+        self.threshold = threshold
+        self.alpha_shift = alpha_shift
+        self._ids = array('B', bytes(window))
+        self._confs = array('B', bytes(window))
+        self._head = 0
+        self._lead = UNKNOWN  # Current weighted-majority color
+        self.state = UNKNOWN  # Last confirmed (announced) color
+        self.confidence = 0   # EWMA confidence of the lead color, 0-255
+
+    def reset(self):
+        for i in range(self.window):
+            self._ids[i] = UNKNOWN
+            self._confs[i] = 0
+        self._lead = self.state = UNKNOWN
+        self.confidence = 0
+
+    def settled(self):
+        """True when every frame in the window has the same color"""
+        first = self._ids[0]
+        for i in range(1, self.window):
+            if self._ids[i] != first:
+                return False
+        return True
+
+    def push(self, color_id, confidence):
+        """Add one frame; returns the newly confirmed color ID, or 0"""
+        i = self._head
+        self._ids[i] = color_id
+        self._confs[i] = confidence
+        self._head = i + 1 if i + 1 < self.window else 0
+
+        # Confidence-weighted votes for this frame's color and the confirmed one
+        score = held = total = count = 0
+        for j in range(self.window):
+            c = self._confs[j]
+            total += c
+            if self._ids[j] == color_id:
+                score += c
+                count += 1
+            elif self._ids[j] == self.state:
+                held += c
+        if color_id == self.state:
+            held = score
+
+        if color_id == self._lead:
+            self.confidence += (confidence - self.confidence) >> self.alpha_shift
+        elif count * 2 > self.window and score * 2 > total:
+            # New majority: seed the EWMA from its frames in the window
+            self._lead = color_id
+            self.confidence = score // count
+
+        if (color_id == self._lead and color_id != self.state and color_id != UNKNOWN and
+                count * 2 > self.window and score * 2 > total and
+                self.confidence >= self.threshold):
+            self.state = color_id
+            return color_id
+        if self.state != UNKNOWN and held < self.threshold:
+            self.state = UNKNOWN
+        return UNKNOWN
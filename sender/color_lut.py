@@ -0,0 +1,145 @@
+# color_lut.py - Chromaticity lookup-table color classifier
+#
+# A profile's rules are compiled once into a LEVELS x LEVELS table indexed
+# by quantized (r%, g%) - b% is implied since r% + g% + b% = 1. Each cell
+# holds two bytes: color ID and confidence (0-255). Classification is then
+# one integer index, however many rules the profile has.
+#
+# Shared by the sender (loads tables at runtime) and utils/lut_generator.py
+# (compiles calibration profiles on the host), so keep it MicroPython-safe.
+import struct
+
+# Color IDs double as DFPlayer track numbers (see receiver track_map)
+COLOR_NAMES = ("Unknown", "Red", "Green", "Blue", "Yellow", "Cyan",
+               "Magenta", "Orange", "Purple", "White", "Black")
+UNKNOWN = 0
+WHITE = 9
+BLACK = 10
+
+# 40 levels puts cell edges on every 0.025, so the 0.05-step r% and g%
+# thresholds below fall exactly on cell boundaries. b% is not an axis: a
+# cell spans up to 2/40 of b% and is decided at its centre, so b%
+# thresholds are only resolved to within 1/40 (about 3% of readings land
+# in such a cell, see tests/test_color_lut.py). Table size: 40*40*2 = 3200
+# bytes.
+DEFAULT_LEVELS = 40
+
+# Mirrors config/calibration_data.json "default" so a table can be built
+# on-device when no .bin file has been uploaded
+DEFAULT_PROFILE = {
+    "red_threshold": 0.50,
+    "green_threshold": 0.50,
+    "blue_threshold": 0.50,
+    "confidence_threshold": 0.60
+}
+
+_MAGIC = b"SLUT"
+_VERSION = 1
+_HEADER = "<4sBBBB"  # magic, version, levels, name count, confidence threshold
+
+def rule_classify(r_pct, g_pct, b_pct, profile):
+    """Reference rule set: returns (color_id, confidence 0.0-1.0)"""
+    rt = profile["red_threshold"]
+    gt = profile["green_threshold"]
+    bt = profile["blue_threshold"]
+
+    # Primary colors
+    if r_pct > rt and g_pct < 0.3 and b_pct < 0.3:
+        return 1, min(r_pct * 1.5, 0.95)
+    if g_pct > gt and r_pct < 0.3 and b_pct < 0.3:
+        return 2, min(g_pct * 1.5, 0.95)
+    if b_pct > bt and r_pct < 0.3 and g_pct < 0.3:
+        return 3, min(b_pct * 1.5, 0.95)
+
+    # Secondary colors
+    if r_pct > 0.35 and g_pct > 0.35 and b_pct < 0.25:
+        return 4, 0.8
+    if r_pct > 0.35 and b_pct > 0.35 and g_pct < 0.25:
+        return 6, 0.8
+    if g_pct > 0.35 and b_pct > 0.35 and r_pct < 0.25:
+        return 5, 0.8
+
+    # Orange
+    if r_pct > 0.45 and g_pct > 0.25 and g_pct < 0.40 and b_pct < 0.2:
+        return 7, 0.75
+
+    # Purple
+    if b_pct > 0.35 and r_pct > 0.30 and g_pct < 0.25:
+        return 8, 0.75
+
+    return UNKNOWN, 0.3
+
+class ColorLUT:
+    def __init__(self, table, levels=DEFAULT_LEVELS, names=COLOR_NAMES,
+                 confidence_threshold=153):
+        if len(table) != levels * levels * 2:
+            raise ValueError("LUT size does not match levels")
+        self.table = table
+        self.levels = levels
+        self.names = names
+        self.confidence_threshold = confidence_threshold  # 0-255
+
+    @classmethod
+    def from_profile(cls, profile, levels=DEFAULT_LEVELS, rules=rule_classify):
+        """Compile a profile by evaluating the rules at every cell centre"""
+        table = bytearray(levels * levels * 2)
+        step = 1.0 / levels
+        for ri in range(levels):
+            r_pct = (ri + 0.5) * step
+            for gi in range(levels):
+                g_pct = (gi + 0.5) * step
+                b_pct = max(0.0, 1.0 - r_pct - g_pct)
+                color_id, conf = rules(r_pct, g_pct, b_pct, profile)
+                i = (ri * levels + gi) * 2
+                table[i] = color_id
+                table[i + 1] = int(conf * 255 + 0.5)
+        threshold = int(profile.get("confidence_threshold", 0.6) * 255 + 0.5)
+        return cls(bytes(table), levels, COLOR_NAMES, threshold)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a table written by save() / utils/lut_generator.py"""
+        with open(filename, "rb") as f:
+            data = f.read()
+        magic, version, levels, count, threshold = struct.unpack_from(_HEADER, data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a color LUT: " + filename)
+        pos = struct.calcsize(_HEADER)
+        names = []
+        for _ in range(count):
+            n = data[pos]
+            names.append(data[pos + 1:pos + 1 + n].decode())
+            pos += 1 + n
+        return cls(data[pos:], levels, tuple(names), threshold)
+
+    def save(self, filename):
+        with open(filename, "wb") as f:
+            f.write(struct.pack(_HEADER, _MAGIC, _VERSION, self.levels,
+                                len(self.names), self.confidence_threshold))
+            for name in self.names:
+                encoded = name.encode()
+                f.write(bytes((len(encoded),)))
+                f.write(encoded)
+            f.write(self.table)
+
+    def classify(self, r, g, b):
+        """Chromaticity lookup: returns (color_id, confidence 0-255).
+
+        Intensity decisions (Black/White) are left to the caller; this
+        only looks at the proportions of r, g and b.
+        """
+        total = r + g + b
+        if total <= 0:
+            return UNKNOWN, 0
+        levels = self.levels
+        ri = r * levels // total
+        gi = g * levels // total
+        if ri >= levels:
+            ri = levels - 1
+        if gi >= levels:
+            gi = levels - 1
+        i = (ri * levels + gi) << 1
+        return self.table[i], self.table[i + 1]
+
+    def name(self, color_id):
+        return self.names[color_id]
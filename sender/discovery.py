@@ -0,0 +1,92 @@
+# discovery.py - Find receivers with a UDP broadcast probe
+#
+# The sender broadcasts a protocol.MSG_DISCOVER probe on the service port
+# from its own socket (so answers never mix with ACKs on the data socket)
+# and every receiver answers with its ID and capabilities. The chosen
+# receiver is cached in receiver.json, so a reboot starts with the last
+# known address; the sender probes again when ACKs stop coming back.
+#
+# Uploaded to the sender, so keep it MicroPython-safe.
+import socket
+import time
+import ujson
+import protocol
+
+CACHE_FILE = "receiver.json"
+
+def broadcast_address(ip, netmask):
+    """Directed broadcast address of the subnet, e.g. 192.168.1.255"""
+    ip_parts = [int(x) for x in ip.split(".")]
+    mask_parts = [int(x) for x in netmask.split(".")]
+    return ".".join(str(i | (~m & 0xFF)) for i, m in zip(ip_parts, mask_parts))
+
+def load_cache():
+    """Last discovered receiver as a dict (ip, id, capabilities, tracks), or None"""
+    try:
+        with open(CACHE_FILE) as f:
+            return ujson.load(f)
+    except:
+        return None
+
+def save_cache(receiver):
+    try:
+        with open(CACHE_FILE, "w") as f:
+            ujson.dump(receiver, f)
+    except OSError as e:
+        print("Could not cache receiver:", e)
+
+class Discovery:
+    def __init__(self, port, sender_id, broadcast="255.255.255.255", receiver_id=None,
+                 required=protocol.CAP_BINARY | protocol.CAP_AUDIO):
+        self.port = port
+        self.sender_id = sender_id
+        self.broadcast = broadcast
+        self.receiver_id = receiver_id  # Only accept this receiver (None = any)
+        self.required = required        # Capability bits an answer must have
+        self.nonce = 0
+        self._buf = bytearray(protocol.DISCOVER_SIZE)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        except (AttributeError, OSError):
+            pass  # Ports without the option allow broadcast by default
+        self.sock.settimeout(0)
+
+    def probe(self):
+        """Broadcast a new probe; answers to older probes are ignored from now on"""
+        self.nonce = protocol.seq_next(self.nonce)
+        try:
+            self.sock.sendto(protocol.pack_discover(self._buf, self.sender_id, self.nonce),
+                             (self.broadcast, self.port))
+        except OSError as e:
+            print("Discovery probe error:", e)
+
+    def poll(self):
+        """First acceptable answer to the current probe as a dict, or None; never blocks"""
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except OSError:
+                return None  # Nothing waiting (EAGAIN)
+            answer = protocol.unpack_announce(data)
+            if answer is None:
+                continue
+            receiver_id, nonce, capabilities, tracks = answer
+            if nonce != self.nonce or capabilities & self.required != self.required:
+                continue
+            if self.receiver_id is not None and receiver_id != self.receiver_id:
+                continue
+            return {"ip": addr[0], "id": receiver_id,
+                    "capabilities": capabilities, "tracks": tracks}
+
+    def find(self, attempts=3, timeout_ms=1000):
+        """Blocking discovery (boot only); returns the receiver dict or None"""
+        for _ in range(attempts):
+            self.probe()
+            deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+            while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+                receiver = self.poll()
+                if receiver:
+                    return receiver
+                time.sleep_ms(20)
+        return None
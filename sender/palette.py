@@ -0,0 +1,170 @@
+# palette.py - Named color palette with CIELAB nearest-neighbour lookup
+#
+# Colors are placed in CIELAB (D65) so "nearest" means perceptually
+# nearest, and bucketed into a GRID x GRID x GRID cell index built
+# offline. A lookup searches outward ring by ring from the query's cell
+# and stops as soon as no unsearched cell can hold a closer color, so
+# cost tracks local density rather than palette size.
+#
+# Shared by the sender and utils/palette_builder.py, so keep it
+# MicroPython-safe.
+import struct
+from array import array
+
+DEFAULT_GRID = 8
+
+_MAGIC = b"SPAL"
+_VERSION = 1
+_HEADER = "<4sBBH"  # magic, version, grid, color count
+_ENTRY = "<BbbH"    # L*2, a, b, color ID (= track number)
+
+def _f(t):
+    return t ** (1.0 / 3) if t > 0.008856 else 7.787 * t + 16.0 / 116
+
+def linear_to_lab(r, g, b):
+    """Linear RGB (0.0-1.0) to CIELAB (L, a, b)"""
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883
+    fx, fy, fz = _f(x), _f(y), _f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+def _srgb_to_linear(c):
+    c = c / 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def srgb_to_lab(r, g, b):
+    """sRGB (0-255, gamma encoded) to CIELAB (L, a, b)"""
+    return linear_to_lab(_srgb_to_linear(r), _srgb_to_linear(g), _srgb_to_linear(b))
+
+def _quantize(lab):
+    # L is kept at half-unit resolution, a/b at one unit
+    l, a, b = lab
+    return (max(0, min(200, int(l * 2 + 0.5))),
+            max(-128, min(127, int(round(a)))),
+            max(-128, min(127, int(round(b)))))
+
+def _cell(l2, a, b, grid):
+    return ((l2 * grid // 201) * grid + (a + 128) * grid // 256) * grid + (b + 128) * grid // 256
+
+def build_palette(colors, grid=DEFAULT_GRID):
+    """Serialize [(name, (r, g, b)), ...] into palette bytes.
+
+    Color IDs are 1-based positions in the list, matching track numbers.
+    """
+    cells = grid * grid * grid
+    entries = []
+    for i, (name, rgb) in enumerate(colors):
+        l2, a, b = _quantize(srgb_to_lab(*rgb))
+        entries.append((_cell(l2, a, b, grid), l2, a, b, i + 1))
+    entries.sort()
+
+    starts = [0] * (cells + 1)
+    for entry in entries:
+        starts[entry[0] + 1] += 1
+    for c in range(cells):
+        starts[c + 1] += starts[c]
+
+    names = [name.encode() for name, _ in colors]
+    offsets = [0]
+    for encoded in names:
+        offsets.append(offsets[-1] + len(encoded))
+
+    out = bytearray(struct.pack(_HEADER, _MAGIC, _VERSION, grid, len(colors)))
+    out += struct.pack("<%dH" % (cells + 1), *starts)
+    for _, l2, a, b, color_id in entries:
+        out += struct.pack(_ENTRY, l2, a, b, color_id)
+    out += struct.pack("<%dH" % len(offsets), *offsets)
+    out += b"".join(names)
+    return bytes(out)
+
+class Palette:
+    def __init__(self, data):
+        magic, version, grid, count = struct.unpack_from(_HEADER, data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a color palette")
+        cells = grid * grid * grid
+        pos = struct.calcsize(_HEADER)
+        self.grid = grid
+        self.count = count
+        self.starts = array("H", struct.unpack_from("<%dH" % (cells + 1), data, pos))
+        pos += 2 * (cells + 1)
+        self.l = array("B", bytes(count))
+        self.a = array("b", bytes(count))
+        self.b = array("b", bytes(count))
+        self.ids = array("H", bytes(2 * count))
+        size = struct.calcsize(_ENTRY)
+        for i in range(count):
+            self.l[i], self.a[i], self.b[i], self.ids[i] = struct.unpack_from(_ENTRY, data, pos)
+            pos += size
+        self.offsets = array("H", struct.unpack_from("<%dH" % (count + 1), data, pos))
+        pos += 2 * (count + 1)
+        self.names = data[pos:]
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls(f.read())
+
+    def name(self, color_id):
+        return bytes(self.names[self.offsets[color_id - 1]:self.offsets[color_id]]).decode()
+
+    def find(self, name):
+        """Color ID for a name, or 0 if it is not in the palette"""
+        encoded = name.encode()
+        for color_id in range(1, self.count + 1):
+            if self.names[self.offsets[color_id - 1]:self.offsets[color_id]] == encoded:
+                return color_id
+        return 0
+
+    def nearest_lab(self, lab):
+        """Returns (color_id, squared distance in quarter ΔE76 units)"""
+        l2, a, b = _quantize(lab)
+        grid = self.grid
+        li = l2 * grid // 201
+        ai = (a + 128) * grid // 256
+        bi = (b + 128) * grid // 256
+        starts = self.starts
+        best_id, best_d = 0, 1 << 30
+        for ring in range(grid):
+            for di in range(-ring, ring + 1):
+                x = li + di
+                if x < 0 or x >= grid:
+                    continue
+                for dj in range(-ring, ring + 1):
+                    y = ai + dj
+                    if y < 0 or y >= grid:
+                        continue
+                    # Only the shell of the cube at this ring distance
+                    if abs(di) == ring or abs(dj) == ring:
+                        dks = range(-ring, ring + 1)
+                    else:
+                        dks = (-ring, ring)
+                    for dk in dks:
+                        z = bi + dk
+                        if z < 0 or z >= grid:
+                            continue
+                        c = (x * grid + y) * grid + z
+                        for i in range(starts[c], starts[c + 1]):
+                            dl = self.l[i] - l2
+                            da = self.a[i] - a
+                            db = self.b[i] - b
+                            d = dl * dl + 4 * (da * da + db * db)
+                            if d < best_d:
+                                best_id, best_d = self.ids[i], d
+            # Cells beyond this ring are at least ring * (100 / grid) ΔE away
+            if best_id and best_d * grid * grid <= (200 * ring) ** 2:
+                break
+        return best_id, best_d
+
+    def nearest_rgb(self, r, g, b, scale=255, linear=True):
+        """Nearest named color for an RGB triple in 0..scale.
+
+        Sensor counts are proportional to light, so they are treated as
+        linear RGB; pass linear=False for gamma-encoded sRGB.
+        """
+        if linear:
+            lab = linear_to_lab(r / scale, g / scale, b / scale)
+        else:
+            lab = srgb_to_lab(r * 255 / scale, g * 255 / scale, b * 255 / scale)
+        return self.nearest_lab(lab)
@@ -0,0 +1,78 @@
+# power.py - Duty cycling for battery-powered senders
+#
+# A sender is ACTIVE (sampling every sample_delay, everything awake) until
+# idle_after_ms pass without activity: a color change, or the wake button.
+# Then it is IDLE, and the sender (on_idle / on_wake in sender.py):
+#
+#   - puts Wi-Fi in power-save (the radio sleeps between AP beacons)
+#   - lets the TCS34725 wait (WEN/WTIME) between cycles
+#   - samples every idle_delay instead of every sample_delay (no INT line)
+#
+# The next activity makes it ACTIVE again. In both states the ESP32
+# light-sleeps between samples and while waiting for INT, whenever nothing
+# is pending. Besides the state this keeps the figures behind the duty
+# cycle: time spent in light sleep vs awake, and wake latency, from the end
+# of a light sleep to the first sample read after it.
+#
+# Uploaded to the sender, so keep it MicroPython-safe.
+import time
+import machine
+
+class PowerManager:
+    def __init__(self, idle_after_ms, on_idle=None, on_wake=None):
+        self.idle_after_ms = idle_after_ms
+        self.on_idle = on_idle
+        self.on_wake = on_wake
+        self.idle = False
+        self.sleeps = 0
+        self.slept_ms = 0
+        self.wake_reason = None  # machine.wake_reason() after the last sleep
+        self._awake_ms = 0
+        self._awake_since = time.ticks_ms()
+        self._last_activity = self._awake_since
+        self._woke_us = None
+
+    def activity(self):
+        """Something happened: stay (or become) ACTIVE"""
+        self._last_activity = time.ticks_ms()
+        if self.idle:
+            self.idle = False
+            if self.on_wake:
+                self.on_wake()
+
+    def check(self):
+        """Go IDLE once idle_after_ms pass without activity; returns self.idle"""
+        if not self.idle and time.ticks_diff(time.ticks_ms(), self._last_activity) >= self.idle_after_ms:
+            self.idle = True
+            if self.on_idle:
+                self.on_idle()
+        return self.idle
+
+    def sleep(self, ms):
+        """Light-sleep up to ms; the configured wake pins end it early"""
+        start = time.ticks_ms()
+        self._awake_ms += time.ticks_diff(start, self._awake_since)
+        machine.lightsleep(ms)
+        self._awake_since = time.ticks_ms()
+        self._woke_us = time.ticks_us()
+        self.slept_ms += time.ticks_diff(self._awake_since, start)
+        self.sleeps += 1
+        self.wake_reason = machine.wake_reason()
+
+    def sampled(self):
+        """Call after each sensor read: wake latency (us) of the first read
+        after a sleep, else None"""
+        if self._woke_us is None:
+            return None
+        us = time.ticks_diff(time.ticks_us(), self._woke_us)
+        self._woke_us = None
+        return us
+
+    def awake_ms(self):
+        """Time not spent in light sleep since boot"""
+        return self._awake_ms + time.ticks_diff(time.ticks_ms(), self._awake_since)
+
+    def duty_cycle(self):
+        """Share of the time awake since boot (0.0-1.0)"""
+        awake = self.awake_ms()
+        return awake / (awake + self.slept_ms) if awake + self.slept_ms else 1.0
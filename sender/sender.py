@@ -1,7 +1,20 @@
 # sender.py - Enhanced MicroPython for ESP32
-import network, socket, time, ujson
+import network, socket, time, ujson, gc
+import uasyncio as asyncio
+import machine
 from machine import I2C, Pin
 import tcs34725
+import color_lut
+import color_filter
+import classifier
+import calibration
+import capture
+import protocol
+import reliable
+import discovery
+import aqueue
+import stats
+import power
 
 # ===== LED for status indication =====
 led = Pin(2, Pin.OUT)
@@ -27,17 +40,74 @@ if not config:
     print("ERROR: No config file. Using defaults (may not work!)")
     config = {
         "wifi": {"ssid": "Your_SSID", "password": "Your_PASSWORD"},
-        "network": {"receiver_ip": "192.168.4.2", "udp_port": 4210},
-        "sensor": {"sample_delay": 1.0, "min_intensity": 200, "confidence_threshold": 0.6}
+        "network": {"receiver_ip": "auto", "udp_port": 4210},
+        "sensor": {"sample_delay": 0.2, "min_intensity": 200, "confidence_threshold": 0.6,
+                   "auto_range": True, "profile": "default"}
     }
 
 SSID = config["wifi"]["ssid"]
 PASSWORD = config["wifi"]["password"]
-RECEIVER_IP = config["network"]["receiver_ip"]
+RECEIVER_IP = config["network"].get("receiver_ip", "auto")  # "auto" = discover
+RECEIVER_ID = config["network"].get("receiver_id")  # Only pair with this receiver
 UDP_PORT = config["network"]["udp_port"]
+PROTOCOL = config["network"].get("protocol", "binary")  # "text" for old receivers
+# Default sender ID: low 16 bits of the chip's unique ID
+SENDER_ID = config["network"].get("sender_id")
+if SENDER_ID is None:
+    uid = machine.unique_id()
+    SENDER_ID = (uid[-2] << 8) | uid[-1]
 SAMPLE_DELAY = config["sensor"]["sample_delay"]
 MIN_INTENSITY = config["sensor"]["min_intensity"]
 CONFIDENCE_THRESHOLD = config["sensor"]["confidence_threshold"]
+AUTO_RANGE = config["sensor"].get("auto_range", True)
+INT_PIN = config["sensor"].get("int_pin")  # None = poll every SAMPLE_DELAY
+CHANGE_BAND = config["sensor"].get("change_band", 10)  # % clear change that wakes us
+# int_pin: resample at least this often (s) anyway; INT only sees brightness,
+# so a new color of similar brightness never fires it. None = INT only
+MAX_IDLE = config["sensor"].get("max_idle", 1.0)
+PROFILE = config["sensor"].get("profile", "default")
+CLASSIFIER = config["sensor"].get("classifier", "lut")  # "lut" or "palette"
+FIXED_POINT = config["sensor"].get("fixed_point", True)  # Integer-only "lut" classification
+FILTER_WINDOW = config["sensor"].get("filter_window", 3)  # Samples voting on each announcement
+CALIBRATE = config["sensor"].get("calibrate", "auto")  # "auto" = only without a stored calibration, "always"
+CALIBRATE_PIN = config["sensor"].get("calibrate_pin", 0)  # Held low at boot = recalibrate (BOOT button)
+DRIFT_CORRECTION = config["sensor"].get("drift_correction", True)
+# Optional collector for stats datagrams (utils/telemetry_collector.py)
+TELEMETRY = config.get("telemetry", {})
+TELEMETRY_HOST = TELEMETRY.get("host")  # None = no reports
+TELEMETRY_PORT = TELEMETRY.get("port", 4211)
+TELEMETRY_INTERVAL = TELEMETRY.get("interval", 10)  # seconds
+# Optional raw sample capture (see capture.py, utils/capture_replay.py)
+CAPTURE = config.get("capture", {})
+CAPTURE_MODE = CAPTURE.get("mode")  # None = off, "flash" or "udp"
+CAPTURE_LABEL = CAPTURE.get("label")  # Color name of the surface being captured, if known
+# Optional battery duty cycling (see power.py)
+POWER = config.get("power", {})
+LOW_POWER = POWER.get("mode", "full") == "low"  # "full" = always awake
+IDLE_AFTER = POWER.get("idle_after", 10)  # seconds without a color change before idling
+IDLE_DELAY = POWER.get("idle_delay", 1.0)  # seconds of light sleep between idle samples / checks
+SENSOR_WAIT = POWER.get("sensor_wait", 200)  # ms TCS34725 wait state between idle cycles (int_pin)
+WAKE_PIN = POWER.get("wake_pin", CALIBRATE_PIN)  # Button that wakes an idle unit (None = none)
+
+# ===== Instrumentation =====
+# Metric indices, in the order of protocol.SENDER_TIMERS/_COUNTERS/_GAUGES
+T_READ, T_CLASSIFY, T_RTT, T_GC, T_WAKE = range(5)
+(C_SAMPLES, C_SENT, C_RETRIES, C_ACK_LOST, C_WIFI_RECONNECTS, C_SENSOR_ERRORS, C_QUEUE_DROPS,
+ C_SLEEP_MS, C_AWAKE_MS) = range(9)
+G_SAMPLES_DEPTH, G_OUTGOING_DEPTH, G_IN_FLIGHT, G_FREE_HEAP = range(4)
+telemetry = stats.Stats(protocol.ROLE_SENDER, SENDER_ID, len(protocol.SENDER_TIMERS),
+                        len(protocol.SENDER_COUNTERS), len(protocol.SENDER_GAUGES))
+event_buf = bytearray(protocol.EVENT_SIZE)
+
+def send_event(code, value=0):
+    """Report a protocol.EVT_* event to the collector right away (if configured)"""
+    if not TELEMETRY_HOST or not wlan.isconnected():
+        return
+    try:
+        sock.sendto(protocol.pack_event(event_buf, protocol.ROLE_SENDER, SENDER_ID, code, value),
+                    (TELEMETRY_HOST, TELEMETRY_PORT))
+    except OSError as e:
+        print("Telemetry send error:", e)
 
 # ===== Wi-Fi Functions =====
 def wifi_connect(ssid, password, timeout=20):
@@ -54,128 +124,249 @@ def wifi_connect(ssid, password, timeout=20):
             blink_led(1, 0.05)
     return wlan
 
-def monitor_wifi(wlan):
-    if not wlan.isconnected():
+async def wifi_task():
+    """Supervise Wi-Fi and reconnect without blocking sampling"""
+    while True:
+        await asyncio.sleep(WIFI_CHECK_INTERVAL)
+        if wlan.isconnected():
+            continue
         print("WiFi dropped! Reconnecting...")
-        blink_led(5, 0.1)  # Error indication
-        return wifi_connect(SSID, PASSWORD)
-    return wlan
+        led_signal(5, 0.1)  # Error indication
+        wlan.connect(SSID, PASSWORD)
+        for _ in range(WIFI_TIMEOUT * 2):
+            if wlan.isconnected():
+                telemetry.count(C_WIFI_RECONNECTS)
+                send_event(protocol.EVT_WIFI_RECONNECT)
+                print(f"WiFi reconnected! IP: {wlan.ifconfig()[0]}")
+                break
+            await asyncio.sleep(0.5)
 
 # ===== Sensor Setup =====
 i2c = I2C(0, scl=Pin(22), sda=Pin(21))
 sensor = tcs34725.TCS34725(i2c)
+sensor.auto_range(AUTO_RANGE)
+raw = [0, 0, 0, 0]  # Reused by every burst read: r, g, b, clear
+
+# ===== Scene-change Interrupt =====
+# The TCS34725 INT line is open-drain, active low. The handler only sets a
+# flag; all I2C work happens in the sampling task.
+scene_flag = asyncio.ThreadSafeFlag()
+scene_idle = False  # True while waiting for INT
+
+def on_sensor_int(pin):
+    scene_flag.set()
+
+if INT_PIN is not None:
+    int_pin = Pin(INT_PIN, Pin.IN, Pin.PULL_UP)
+    int_pin.irq(trigger=Pin.IRQ_FALLING, handler=on_sensor_int)
+    sensor.persistence(2)  # Ignore single noisy integration cycles
+    sensor.interrupt(True)
+
+def arm_scene_interrupt():
+    """Go idle until the clear channel leaves the current window"""
+    global scene_idle
+    scene_idle = True
+    scene_flag.clear()
+    sensor.arm_change_interrupt(CHANGE_BAND)
+
+# ===== Power Saving =====
+# Low-power mode: the ESP32 light-sleeps between samples, waking on a
+# timer, the sensor INT line (ext0) or the wake button (ext1). Once idle
+# (no color change for IDLE_AFTER) Wi-Fi also goes to power-save and
+# polled units sample every IDLE_DELAY. Sleeping blocks the event loop, so
+# it only happens when no task has work queued.
+QUIET_POLL_MS = 20  # Re-check interval while something is still pending
+power_manager = None  # power.PowerManager in low-power mode
+wake_button = None
+
+def wifi_power_save(enable):
+    try:
+        wlan.config(pm=wlan.PM_POWERSAVE if enable else wlan.PM_PERFORMANCE)
+    except (AttributeError, ValueError) as e:
+        print("WiFi power save not available:", e)
+
+def on_idle():
+    print("Power: idle")
+    wifi_power_save(True)
+    # Keep integrating between waits: a polled unit's reading is ready the
+    # moment it wakes, instead of one integration (up to 614ms) later
+    sensor.wait_time(SENSOR_WAIT)
+
+def on_wake():
+    print("Power: active")
+    wifi_power_save(False)
+    sensor.wait_time(0)
+
+def quiet():
+    """Nothing queued, in flight or being searched for: safe to light-sleep"""
+    return not (len(samples) or len(outgoing) or len(led_patterns) or led.value()
+                or outbox.pending or rediscover.is_set())
+
+def woken():
+    """INT asserted (scene change) or the wake button held"""
+    return (INT_PIN is not None and int_pin.value() == 0) or \
+        (wake_button is not None and wake_button.value() == 0)
+
+if LOW_POWER:
+    import esp32
+    power_manager = power.PowerManager(int(IDLE_AFTER * 1000), on_idle, on_wake)
+    if INT_PIN is not None:
+        esp32.wake_on_ext0(int_pin, esp32.WAKEUP_ALL_LOW)
+    if WAKE_PIN is not None:
+        wake_button = Pin(WAKE_PIN, Pin.IN, Pin.PULL_UP)
+        esp32.wake_on_ext1((wake_button,), esp32.WAKEUP_ALL_LOW)
 
 # ===== Calibration Function =====
 calibration_factors = (1.0, 1.0, 1.0)
+calibration_data = None  # Contents of calibration.json
+fixed_classifier = None  # classifier.FixedClassifier, when FIXED_POINT applies
+
+def apply_calibration(data):
+    """Use the factors from calibration.json contents"""
+    global calibration_factors, calibration_data
+    calibration_data = data
+    calibration_factors = calibration.factors_of(data)
+    if fixed_classifier:
+        fixed_classifier.set_factors(calibration_factors)
 
 def calibrate_sensor(samples=10):
-    global calibration_factors
+    """Measure a white surface, then store and apply the new factors"""
     print("\n=== CALIBRATION MODE ===")
     print("Point sensor at WHITE surface in 3 seconds...")
     blink_led(3, 0.3)
     time.sleep(3)
-    
-    r_sum, g_sum, b_sum = 0, 0, 0
+
     print("Sampling...")
-    for i in range(samples):
-        try:
-            r, g, b, _ = sensor.get_raw_data()
-            r_sum += r
-            g_sum += g
-            b_sum += b
-            print(f"  Sample {i+1}: R={r} G={g} B={b}")
-            time.sleep(0.2)
-        except:
-            continue
-    
-    r_avg = r_sum / samples
-    g_avg = g_sum / samples
-    b_avg = b_sum / samples
-    
-    max_avg = max(r_avg, g_avg, b_avg)
-    r_factor = max_avg / r_avg if r_avg > 0 else 1.0
-    g_factor = max_avg / g_avg if g_avg > 0 else 1.0
-    b_factor = max_avg / b_avg if b_avg > 0 else 1.0
-    
-    calibration_factors = (r_factor, g_factor, b_factor)
+    white = calibration.measure(sensor.read_scaled_into, samples)
+    if white is None:
+        print("Calibration failed, keeping previous factors")
+        blink_led(5, 0.05)
+        return calibration_factors
+
+    apply_calibration(calibration.update(calibration_data, white, "white"))
+    calibration.save(calibration_data)
+    send_event(protocol.EVT_CALIBRATED, 0)
     print(f"Calibration complete!")
-    print(f"Factors: R={r_factor:.2f}, G={g_factor:.2f}, B={b_factor:.2f}")
+    print(f"Factors: R={calibration_factors[0]:.2f}, G={calibration_factors[1]:.2f}, "
+          f"B={calibration_factors[2]:.2f}")
     blink_led(2, 0.2)
     return calibration_factors
 
+def calibration_requested():
+    if CALIBRATE == "always":
+        return True
+    if CALIBRATE_PIN is None:
+        return False
+    return Pin(CALIBRATE_PIN, Pin.IN, Pin.PULL_UP).value() == 0
+
+def boot_calibration():
+    """Use the stored calibration unless there is none or a new one is requested"""
+    global calibration_data
+    calibration_data = calibration.load()
+    if calibration_data and not calibration_requested():
+        apply_calibration(calibration_data)
+        print(f"Calibration loaded ({calibration_data.get('last_calibration', '?')}): "
+              f"R={calibration_factors[0]:.2f}, G={calibration_factors[1]:.2f}, "
+              f"B={calibration_factors[2]:.2f}")
+    else:
+        calibrate_sensor(10)
+
+# ===== Color Profiles =====
+lut = None
+stability_filter = None  # color_filter.ColorFilter, created with the tasks
+
+def load_profile(name):
+    """Switch classifier tables at runtime (lut_<name>.bin from lut_generator.py)"""
+    global lut, CONFIDENCE_THRESHOLD
+    try:
+        lut = color_lut.ColorLUT.load(f"lut_{name}.bin")
+    except Exception as e:
+        print(f"Profile '{name}' not loaded ({e}), building default table")
+        lut = color_lut.ColorLUT.from_profile(color_lut.DEFAULT_PROFILE)
+    # The profile's threshold replaces sensor.confidence_threshold
+    threshold = lut.confidence_threshold / 255
+    if int(CONFIDENCE_THRESHOLD * 255 + 0.5) != lut.confidence_threshold:
+        print(f"Profile '{name}': confidence threshold {threshold:.2f} "
+              f"(was {CONFIDENCE_THRESHOLD:.2f})")
+    CONFIDENCE_THRESHOLD = threshold
+    if stability_filter:
+        stability_filter.threshold = lut.confidence_threshold
+    if fixed_classifier:
+        fixed_classifier.set_table(lut)
+    return lut
+
+load_profile(PROFILE)
+
+# Named palette (hundreds of colors, CIELAB nearest neighbour, see palette.py)
+named_palette = None
+if CLASSIFIER == "palette":
+    import palette
+    named_palette = palette.Palette.load("palette.bin")
+    print(f"Palette loaded: {named_palette.count} colors")
+elif FIXED_POINT:
+    fixed_classifier = classifier.FixedClassifier(lut, calibration_factors, MIN_INTENSITY)
+
 # ===== Enhanced Color Detection =====
 def detect_rgb_color_enhanced(r, g, b):
-    # Apply calibration
-    r = int(r * calibration_factors[0])
-    g = int(g * calibration_factors[1])
-    b = int(b * calibration_factors[2])
-    
-    # Normalize to 0-255 if needed
-    max_val = max(r, g, b)
-    if max_val > 255:
-        scale = 255 / max_val
-        r, g, b = int(r * scale), int(g * scale), int(b * scale)
-    
-    total = r + g + b
-    MIN_TOTAL = MIN_INTENSITY * 3
-    MAX_TOTAL = 700
-    
-    # Black detection
-    if total < MIN_TOTAL:
-        return "Black", 0.9
-    
-    # White detection
-    if total > MAX_TOTAL and abs(r-g) < 50 and abs(g-b) < 50 and abs(r-b) < 50:
-        return "White", 0.9
-    
-    # Calculate percentages
-    if total == 0:
-        return "Unknown", 0.0
-    
-    r_pct = r / total
-    g_pct = g / total
-    b_pct = b / total
-    
-    # Primary colors
-    if r_pct > 0.5 and g_pct < 0.3 and b_pct < 0.3:
-        return "Red", min(r_pct * 1.5, 0.95)
-    if g_pct > 0.5 and r_pct < 0.3 and b_pct < 0.3:
-        return "Green", min(g_pct * 1.5, 0.95)
-    if b_pct > 0.5 and r_pct < 0.3 and g_pct < 0.3:
-        return "Blue", min(b_pct * 1.5, 0.95)
-    
-    # Secondary colors
-    if r_pct > 0.35 and g_pct > 0.35 and b_pct < 0.25:
-        return "Yellow", 0.8
-    if r_pct > 0.35 and b_pct > 0.35 and g_pct < 0.25:
-        return "Magenta", 0.8
-    if g_pct > 0.35 and b_pct > 0.35 and r_pct < 0.25:
-        return "Cyan", 0.8
-    
-    # Orange
-    if r_pct > 0.45 and g_pct > 0.25 and g_pct < 0.40 and b_pct < 0.2:
-        return "Orange", 0.75
-    
-    # Purple
-    if b_pct > 0.35 and r_pct > 0.30 and g_pct < 0.25:
-        return "Purple", 0.75
-    
-    return "Unknown", 0.3
+    return classifier.detect(r, g, b, calibration_factors, MIN_INTENSITY, lut, named_palette)
+
+def color_id_of(color):
+    """Wire color ID (= receiver track number) for a detected color name"""
+    if named_palette:
+        return named_palette.find(color)
+    return lut.names.index(color)
+
+def color_name(color_id):
+    return named_palette.name(color_id) if named_palette else lut.name(color_id)
 
 # ===== UDP with Acknowledgment =====
-def send_with_ack(sock, message, addr, port, timeout=0.5, retries=3):
-    for attempt in range(retries):
-        try:
-            sock.sendto(message, (addr, port))
-            sock.settimeout(timeout)
-            ack, _ = sock.recvfrom(64)
-            if ack == b"ACK":
-                return True
-        except:
-            if attempt < retries - 1:
-                print(f"  Retry {attempt + 1}...")
-                continue
-    return False
+msg_buf = bytearray(protocol.COLOR_SIZE)
+msg_seq = protocol.seq_start()
+
+def build_message(color, confidence):
+    """Next datagram for a color, in the configured wire format"""
+    global msg_seq
+    msg_seq = protocol.seq_next(msg_seq)
+    if PROTOCOL == "text":
+        return f"{color}:{confidence:.2f}".encode('utf-8')
+    return protocol.pack_color(msg_buf, SENDER_ID, msg_seq, color_id_of(color),
+                               int(confidence * 255), time.ticks_ms())
+
+
+REDISCOVER_AFTER = 3  # Consecutive failed sends before probing for a receiver again
+ack_failures = 0
+
+def on_ack(seq, color):
+    global ack_failures
+    ack_failures = 0
+    telemetry.add(T_RTT, outbox.last_rtt_us)
+    print(f"✓ Sent: {color} (ACK received)")
+    led_signal(1, 0.05)
+
+def on_send_failed(seq, color):
+    global ack_failures
+    ack_failures += 1
+    print(f"✗ Send failed: {color} (no ACK)")
+    led_signal(3, 0.05)
+    if ack_failures >= REDISCOVER_AFTER:
+        rediscover.set()
+
+# ===== Receiver Discovery =====
+def boot_receiver():
+    """Receiver IP at boot: configured, else cached, else discovered (None if none answer)"""
+    if RECEIVER_IP != "auto":
+        return RECEIVER_IP
+    cached = discovery.load_cache()
+    if cached and (RECEIVER_ID is None or cached["id"] == RECEIVER_ID):
+        print(f"Receiver (cached): {cached['ip']} #{cached['id']}")
+        return cached["ip"]
+    print("Searching for receiver...")
+    receiver = finder.find()
+    if receiver is None:
+        return None
+    print(f"Receiver found: {receiver['ip']} #{receiver['id']}")
+    discovery.save_cache(receiver)
+    return receiver["ip"]
 
 # ===== Main Initialization =====
 print("\n" + "="*40)
@@ -192,71 +383,269 @@ if not wlan:
 print(f"WiFi connected! IP: {wlan.ifconfig()[0]}")
 blink_led(3, 0.1)
 
+# Find the receiver
+ip, netmask = wlan.ifconfig()[:2]
+finder = discovery.Discovery(UDP_PORT, SENDER_ID, discovery.broadcast_address(ip, netmask),
+                             receiver_id=RECEIVER_ID)
+rediscover = asyncio.Event()
+receiver_ip = boot_receiver()
+if receiver_ip is None:
+    print("No receiver answered; probing in the background")
+    rediscover.set()
+
 # Create UDP socket
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(2)
+# Non-blocking delivery: ACKs and retransmits are serviced between samples
+outbox = reliable.Outbox(sock, (receiver_ip, UDP_PORT) if receiver_ip else None,
+                         on_ack=on_ack, on_fail=on_send_failed)
+send_event(protocol.EVT_BOOT, machine.reset_cause())
 
-# Run calibration
-calibrate_sensor(10)
+# Raw sample capture
+sample_capture = None
+capture_label = protocol.CAPTURE_UNLABELLED
+if CAPTURE_MODE == "flash":
+    sample_capture = capture.FlashRing(SENDER_ID, CAPTURE.get("records", 4096))
+    print(f"Capturing samples to {capture.CAPTURE_FILE} ({sample_capture.total} so far)")
+elif CAPTURE_MODE == "udp":
+    sample_capture = capture.UdpCapture(sock, (CAPTURE["host"], CAPTURE.get("port", 4212)), SENDER_ID)
+    print(f"Capturing samples to {CAPTURE['host']}")
+if sample_capture and CAPTURE_LABEL:
+    try:
+        capture_label = color_id_of(CAPTURE_LABEL)
+    except ValueError:
+        capture_label = 0
+    if capture_label == 0 and CAPTURE_LABEL != "Unknown":
+        print(f"Unknown capture label '{CAPTURE_LABEL}', samples stay unlabelled")
+        capture_label = protocol.CAPTURE_UNLABELLED
 
-# ===== Main Loop =====
-print("\nStarting color detection loop...")
-print("="*40 + "\n")
+# Stored calibration, or a white calibration when there is none
+boot_calibration()
+drift = None
+if DRIFT_CORRECTION and calibration_data:
+    drift = calibration.DriftEstimator(calibration_factors, calibration.white_of(calibration_data))
 
-last_wifi_check = time.time()
-last_color = None
-color_stable_count = 0
+# ===== Tasks =====
+# sample_task -> samples -> classify_task -> outgoing -> transmit_task
+# LED feedback, receiver discovery and Wi-Fi supervision run alongside,
+# so sampling cadence never depends on network or LED timing. Queues drop
+# their oldest entry when full: a backed-up consumer always gets the
+# freshest data.
 WIFI_CHECK_INTERVAL = 10
-STABILITY_THRESHOLD = 2  # Same color must appear 2 times
+WIFI_TIMEOUT = 20
+DISCOVERY_TIMEOUT_MS = 1000  # Wait for answers to one probe
+DISCOVERY_RETRY = 5  # seconds between unanswered probes
 
-while True:
-    try:
-        # WiFi monitoring
-        if time.time() - last_wifi_check > WIFI_CHECK_INTERVAL:
-            wlan = monitor_wifi(wlan)
-            last_wifi_check = time.time()
-        
-        # Read sensor
+stability_filter = color_filter.ColorFilter(FILTER_WINDOW, int(CONFIDENCE_THRESHOLD * 255))
+
+samples = aqueue.Queue(4)       # (r, g, b, clear)
+outgoing = aqueue.Queue(4)      # (color, confidence)
+led_patterns = aqueue.Queue(4)  # (times, duration)
+
+def led_signal(times=1, duration=0.1):
+    """Non-blocking blink_led(): queue a pattern for led_task"""
+    led_patterns.put_nowait((times, duration))
+
+async def led_task():
+    while True:
+        times, duration = await led_patterns.get()
+        for _ in range(times):
+            led.on()
+            await asyncio.sleep(duration)
+            led.off()
+            await asyncio.sleep(duration)
+
+async def scene_change():
+    """Wait for INT, at most MAX_IDLE; light-sleep until it (or the wake
+    button) in low-power mode"""
+    if power_manager is None:
+        if MAX_IDLE is None:
+            await scene_flag.wait()
+            return
+        try:
+            await asyncio.wait_for(scene_flag.wait(), MAX_IDLE)
+        except asyncio.TimeoutError:
+            pass  # Fallback resample
+        return
+    start = time.ticks_ms()
+    while not woken():
+        left = IDLE_DELAY * 1000 if MAX_IDLE is None else \
+            MAX_IDLE * 1000 - time.ticks_diff(time.ticks_ms(), start)
+        if left <= 0:
+            return  # Fallback resample
+        power_manager.check()
+        if quiet():
+            power_manager.sleep(int(min(IDLE_DELAY * 1000, left)))
+            await asyncio.sleep_ms(0)  # Run whatever came due while asleep
+        else:
+            await asyncio.sleep_ms(QUIET_POLL_MS)
+    scene_flag.clear()
+    power_manager.activity()
+
+async def rest():
+    """Pause between samples; in low-power mode light-sleep through it when
+    nothing is pending, for IDLE_DELAY instead once a polled unit is idle"""
+    if power_manager is None:
+        await asyncio.sleep(SAMPLE_DELAY)
+        return
+    if wake_button is not None and wake_button.value() == 0:
+        power_manager.activity()
+    await asyncio.sleep_ms(0)  # Let classify_task take the sample first
+    delay = IDLE_DELAY if INT_PIN is None and power_manager.check() else SAMPLE_DELAY
+    if quiet():
+        power_manager.sleep(int(delay * 1000))
+        return
+    await asyncio.sleep(SAMPLE_DELAY)
+
+async def sample_task():
+    global scene_idle
+    while True:
+        # Scene static: no sampling until the sensor raises INT
+        if INT_PIN is not None and scene_idle:
+            await scene_change()
+            scene_idle = False
         try:
-            r, g, b, _ = sensor.get_raw_data()
+            # Await the integration instead of busy-waiting in the driver
+            while not sensor.data_ready():
+                await asyncio.sleep_ms(2)
+            start = time.ticks_us()
+            sensor.read_scaled_into(raw)
+            telemetry.since(T_READ, start)
+            if power_manager:
+                wake_us = power_manager.sampled()
+                if wake_us is not None:
+                    telemetry.add(T_WAKE, wake_us)
+            if sample_capture:
+                sample_capture.add(time.ticks_ms(), sensor.last_raw, sensor.integration_time(),
+                                   sensor.gain(), capture_label)
         except Exception as e:
+            telemetry.count(C_SENSOR_ERRORS)
             print("Sensor read error:", e)
-            time.sleep(1)
+            await asyncio.sleep(1)
             continue
-        
-        # Detect color
-        color, confidence = detect_rgb_color_enhanced(r, g, b)
-        
-        print(f"Raw: R={r:4d} G={g:4d} B={b:4d} | {color:8s} ({confidence:.1%})")
-        
-        # Stability check - only send if color is stable
-        if color == last_color:
-            color_stable_count += 1
-        else:
-            color_stable_count = 0
-            last_color = color
-        
-        # Send if stable and confident
-        if (color_stable_count >= STABILITY_THRESHOLD and 
-            confidence >= CONFIDENCE_THRESHOLD and 
-            color != "Unknown"):
+        samples.put_nowait((raw[0], raw[1], raw[2], raw[3]))
+        telemetry.count(C_SAMPLES)
+        telemetry.peak(G_SAMPLES_DEPTH, len(samples))
+        await rest()
+
+def check_drift(r, g, b, clear):
+    """Apply and store a correction once the white statistics have drifted"""
+    white = drift.observe(r, g, b, clear)
+    if white is None:
+        return
+    apply_calibration(calibration.update(calibration_data, white, "drift"))
+    calibration.save(calibration_data)
+    send_event(protocol.EVT_CALIBRATED, 1)
+    print(f"Calibration drift corrected: R={calibration_factors[0]:.2f}, "
+          f"G={calibration_factors[1]:.2f}, B={calibration_factors[2]:.2f}")
+
+async def classify_task():
+    while True:
+        r, g, b, clear = await samples.get()
+        if drift:
+            check_drift(r, g, b, clear)
+        try:
+            # Detect color
+            start = time.ticks_us()
+            if fixed_classifier:
+                packed = fixed_classifier.classify(r, g, b)
+                color_id, confidence = packed >> 8, packed & 0xFF
+            else:
+                color, conf = detect_rgb_color_enhanced(r, g, b)
+                color_id, confidence = color_id_of(color), int(conf * 255)
+            confirmed = stability_filter.push(color_id, confidence)
+            telemetry.since(T_CLASSIFY, start)
             
-            msg = f"{color}:{confidence:.2f}".encode('utf-8')
-            success = send_with_ack(sock, msg, RECEIVER_IP, UDP_PORT)
+            print(f"Raw: R={r:4d} G={g:4d} B={b:4d} | {color_name(color_id):8s} ({confidence / 255:.1%})")
             
-            if success:
-                print(f"✓ Sent: {color} (ACK received)")
-                blink_led(1, 0.05)
-            else:
-                print(f"✗ Send failed (no ACK)")
-                blink_led(3, 0.05)
+            if power_manager and (confirmed or not stability_filter.settled()):
+                power_manager.activity()  # Scene is changing: stay awake
             
-            # Reset to avoid spam
-            color_stable_count = 0
-            time.sleep(2)  # Cooldown after successful send
-        
-    except Exception as e:
-        print("Loop error:", e)
-        blink_led(5, 0.05)
-    
-    time.sleep(SAMPLE_DELAY)
\ No newline at end of file
+            # Announce only when the filter confirms a change of color
+            if confirmed:
+                outgoing.put_nowait((color_name(color_id), stability_filter.confidence / 255))
+                telemetry.peak(G_OUTGOING_DEPTH, len(outgoing))
+                if INT_PIN is not None:
+                    arm_scene_interrupt()  # Announced: wait for the next change
+            elif INT_PIN is not None and stability_filter.settled():
+                arm_scene_interrupt()  # Settled on something we don't announce
+        except Exception as e:
+            print("Classify error:", e)
+            led_signal(5, 0.05)
+
+async def transmit_task():
+    while True:
+        # Service ACKs/retransmits while anything is in flight
+        if outbox.pending:
+            await asyncio.sleep_ms(10)
+            outbox.poll()
+            if not len(outgoing):
+                continue
+        color, confidence = await outgoing.get()
+        if not wlan.isconnected():
+            print(f"✗ Not sent: {color} (WiFi down)")
+            continue
+        if outbox.addr is None:
+            print(f"✗ Not sent: {color} (no receiver yet)")
+            continue
+        msg = build_message(color, confidence)
+        outbox.send(msg_seq, msg, color)
+        telemetry.count(C_SENT)
+        telemetry.peak(G_IN_FLIGHT, len(outbox.pending))
+
+async def discovery_task():
+    """Probe for a receiver whenever sends keep failing (or none is known)"""
+    global ack_failures
+    while True:
+        await rediscover.wait()
+        print("Searching for receiver...")
+        receiver = None
+        while receiver is None:
+            finder.probe()
+            deadline = time.ticks_add(time.ticks_ms(), DISCOVERY_TIMEOUT_MS)
+            while receiver is None and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+                await asyncio.sleep_ms(50)
+                receiver = finder.poll()
+            if receiver is None:
+                await asyncio.sleep(DISCOVERY_RETRY)
+        if outbox.addr is None or receiver["ip"] != outbox.addr[0]:
+            print(f"Receiver found: {receiver['ip']} #{receiver['id']}")
+            discovery.save_cache(receiver)
+            send_event(protocol.EVT_RECEIVER_CHANGED, receiver["id"])
+        outbox.addr = (receiver["ip"], UDP_PORT)
+        ack_failures = 0
+        rediscover.clear()
+
+async def telemetry_task():
+    """Send a stats datagram every TELEMETRY_INTERVAL seconds"""
+    addr = (TELEMETRY_HOST, TELEMETRY_PORT)
+    while True:
+        await asyncio.sleep(TELEMETRY_INTERVAL)
+        # Collect here, between samples, and time it: the pause an
+        # automatic collection would otherwise add to a hot path
+        start = time.ticks_us()
+        gc.collect()
+        telemetry.since(T_GC, start)
+        telemetry.gauges[G_FREE_HEAP] = gc.mem_free()
+        telemetry.counters[C_RETRIES] = outbox.retransmits
+        telemetry.counters[C_ACK_LOST] = outbox.failures
+        telemetry.counters[C_QUEUE_DROPS] = samples.dropped + outgoing.dropped
+        if power_manager:
+            telemetry.counters[C_SLEEP_MS] = power_manager.slept_ms
+            telemetry.counters[C_AWAKE_MS] = power_manager.awake_ms()
+        report = telemetry.pack()
+        if wlan.isconnected():
+            try:
+                sock.sendto(report, addr)
+            except OSError as e:
+                print("Telemetry send error:", e)
+
+async def main():
+    print("\nStarting color detection loop...")
+    print("="*40 + "\n")
+    tasks = [sample_task(), classify_task(), transmit_task(), discovery_task(),
+             wifi_task(), led_task()]
+    if TELEMETRY_HOST:
+        tasks.append(telemetry_task())
+    await asyncio.gather(*tasks)
+
+asyncio.run(main())
@@ -6,6 +6,11 @@ import time
 _COMMAND_BIT = const(0x80)
 _ENABLE = const(0x00)
 _ATIME = const(0x01)
+_WTIME = const(0x03)
+_AILTL = const(0x04)
+_AIHTL = const(0x06)
+_PERS = const(0x0C)
+_CONFIG = const(0x0D)
 _CONTROL = const(0x0F)
 _ID = const(0x12)
 _STATUS = const(0x13)
@@ -14,9 +19,23 @@ _RDATAL = const(0x16)
 _GDATAL = const(0x18)
 _BDATAL = const(0x1A)
 
+# Command register: auto-increment protocol for multi-byte reads
+_COMMAND_AUTO_INCREMENT = const(0x20)
+# Special function: clear-channel interrupt clear
+_COMMAND_CLEAR_INT = const(0xE6)
+
+# Status register bits
+_STATUS_AVALID = const(0x01)
+_STATUS_AINT = const(0x10)
+
 # Enable register bits
 _ENABLE_PON = const(0x01)
 _ENABLE_AEN = const(0x02)
+_ENABLE_WEN = const(0x08)
+_ENABLE_AIEN = const(0x10)
+
+# Config register bits
+_CONFIG_WLONG = const(0x02)  # Wait steps 12x longer (28.8ms)
 
 # Integration time settings (longer = more accurate but slower)
 _INTEGRATION_TIME_2_4MS = const(0xFF)
@@ -32,11 +51,48 @@ _GAIN_4X = const(0x01)
 _GAIN_16X = const(0x02)
 _GAIN_60X = const(0x03)
 
+_GAIN_MULTIPLIER = (1, 4, 16, 60)  # Indexed by gain register value
+
+# Auto-range ladder: (ATIME, gain, sensitivity) ordered from least to most
+# sensitive, preferring the shortest integration at each step.
+# Sensitivity = integration cycles * gain multiplier, derived so it always
+# matches sensitivity().
+_RANGES = tuple((atime, gain, (256 - atime) * _GAIN_MULTIPLIER[gain]) for atime, gain in (
+    (_INTEGRATION_TIME_2_4MS, _GAIN_1X),
+    (_INTEGRATION_TIME_2_4MS, _GAIN_4X),
+    (_INTEGRATION_TIME_2_4MS, _GAIN_16X),
+    (_INTEGRATION_TIME_24MS, _GAIN_4X),
+    (_INTEGRATION_TIME_24MS, _GAIN_16X),
+    (_INTEGRATION_TIME_50MS, _GAIN_16X),
+    (_INTEGRATION_TIME_50MS, _GAIN_60X),
+    (_INTEGRATION_TIME_101MS, _GAIN_60X),
+    (_INTEGRATION_TIME_154MS, _GAIN_60X),
+    (_INTEGRATION_TIME_700MS, _GAIN_60X),
+))
+
+# Scaled counts are reported as if read at 50ms / 4x (the fixed default),
+# so thresholds tuned for the old setting keep working.
+_REFERENCE_SENSITIVITY = const(84)
+
 class TCS34725:
     def __init__(self, i2c, address=0x29):
         self.i2c = i2c
         self.address = address
         
+        # Preallocated I2C buffers so reads do not allocate
+        self._status_buf = bytearray(1)
+        self._data_buf = bytearray(8)  # CDATAL..BDATAH, little-endian words
+        self._data = [0, 0, 0, 0]      # r, g, b, c
+        self.last_raw = [0, 0, 0, 0]   # Unscaled counts behind the last read_scaled_into()
+        self._auto_range = False
+        self._range = 0
+        self._aien = 0
+        self._wen = 0
+        self._wait_ms = 0
+        self._clear_ref = 0            # Last clear reading at reference scale
+        self._threshold_buf = bytearray(4)
+        self._cmd_buf = bytearray((_COMMAND_CLEAR_INT,))
+        
         # Check sensor ID
         sensor_id = self._read_byte(_ID)
         if sensor_id not in (0x44, 0x4D):
@@ -63,31 +119,193 @@ class TCS34725:
         data = self.i2c.readfrom_mem(self.address, _COMMAND_BIT | register, 2)
         return data[0] | (data[1] << 8)
     
+    def _restart_cycle(self):
+        # Toggling AEN restarts integration and clears a stale AVALID
+        self._write_byte(_ENABLE, _ENABLE_PON | self._aien | self._wen)
+        self._write_byte(_ENABLE, _ENABLE_PON | _ENABLE_AEN | self._aien | self._wen)
+    
+    def sensitivity(self):
+        """Integration cycles * gain for the current settings"""
+        return (256 - self._integration_time) * _GAIN_MULTIPLIER[self._gain]
+    
+    def max_count(self):
+        """Clear-channel full-scale count for the current integration time"""
+        return min(65535, (256 - self._integration_time) * 1024)
+    
+    def auto_range(self, enable=None):
+        """Get or set automatic gain / integration-time ranging"""
+        if enable is None:
+            return self._auto_range
+        self._auto_range = enable
+        if enable:
+            # Start from the range closest to the current settings
+            sens = self.sensitivity()
+            self._range = 0
+            for i in range(len(_RANGES)):
+                if _RANGES[i][2] <= sens:
+                    self._range = i
+            self._set_range(self._range)
+    
+    def _set_range(self, index):
+        self._range = index
+        atime, gain, _ = _RANGES[index]
+        self.integration_time(atime)
+        self.gain(gain)
+        self._restart_cycle()
+    
+    def _step_range(self, clear):
+        """Pick the next range from a clear reading; True if it changed"""
+        index = self._range
+        if clear >= self.max_count() * 9 // 10:
+            if index > 0:
+                self._set_range(index - 1)
+                return True
+        elif index < len(_RANGES) - 1:
+            atime, _, sens = _RANGES[index + 1]
+            # Step up only if the next range would stay under half scale,
+            # so a reading can never bounce between two neighbours
+            next_max = min(65535, (256 - atime) * 1024)
+            if clear * sens < (next_max // 2) * _RANGES[index][2]:
+                self._set_range(index + 1)
+                return True
+        return False
+    
+    def read_scaled_into(self, out):
+        """Read RGBC into out[0..3] scaled to the 50ms / 4x reference.
+        
+        With auto-ranging enabled, a saturated reading is retaken at the
+        next less sensitive range; underflow moves to a more sensitive
+        range for the following read.
+        """
+        self.read_raw_into(out)
+        sens = self.sensitivity()
+        if self._auto_range:
+            for _ in range(len(_RANGES)):
+                saturated = out[3] >= self.max_count() * 9 // 10
+                if not self._step_range(out[3]) or not saturated:
+                    break
+                self.read_raw_into(out)
+                sens = self.sensitivity()
+        raw = self.last_raw
+        for i in range(4):
+            raw[i] = out[i]
+            out[i] = out[i] * _REFERENCE_SENSITIVITY // sens
+        self._clear_ref = out[3]
+        return out
+    
+    # ===== Clear-channel interrupt =====
+    def interrupt(self, enable=None):
+        """Get or set the clear-channel interrupt (AIEN) on the INT pin"""
+        if enable is None:
+            return bool(self._aien)
+        self._aien = _ENABLE_AIEN if enable else 0
+        self._write_byte(_ENABLE, _ENABLE_PON | _ENABLE_AEN | self._aien | self._wen)
+    
+    def thresholds(self, low, high):
+        """Set the AILT/AIHT window; INT asserts when clear leaves it"""
+        buf = self._threshold_buf
+        low = max(0, min(65535, low))
+        high = max(0, min(65535, high))
+        buf[0] = low & 0xFF
+        buf[1] = low >> 8
+        buf[2] = high & 0xFF
+        buf[3] = high >> 8
+        self.i2c.writeto_mem(
+            self.address, _COMMAND_BIT | _COMMAND_AUTO_INCREMENT | _AILTL, buf)
+    
+    def persistence(self, value):
+        """Set PERS (0-15): 0 = every cycle, 1-3 = that many out-of-range
+        cycles, 4-15 = 5, 10, 15 ... 60 consecutive cycles"""
+        self._write_byte(_PERS, value & 0x0F)
+    
+    def interrupt_pending(self):
+        """True if the AINT status bit is set"""
+        self.i2c.readfrom_mem_into(self.address, _COMMAND_BIT | _STATUS, self._status_buf)
+        return bool(self._status_buf[0] & _STATUS_AINT)
+    
+    def clear_interrupt(self):
+        """Clear AINT and release the INT pin"""
+        self.i2c.writeto(self.address, self._cmd_buf)
+    
+    def arm_change_interrupt(self, band=10):
+        """Arm INT to fire when clear moves more than band percent from the
+        last scaled reading, in the units of the current range"""
+        base = self._clear_ref * self.sensitivity() // _REFERENCE_SENSITIVITY
+        delta = max(base * band // 100, 8)
+        self.thresholds(base - delta, base + delta)
+        self.clear_interrupt()
+    
+    def integration_ms(self):
+        """Integration period in ms for the current ATIME setting"""
+        return (256 - self._integration_time) * 2.4
+    
     def integration_time(self, value=None):
         if value is None:
             return self._integration_time
         self._integration_time = value
         self._write_byte(_ATIME, value)
     
+    def wait_time(self, ms=None):
+        """Get or set the wait state between cycles (WEN/WTIME), in ms.
+        
+        The sensor idles at ~65uA there instead of integrating at ~235uA;
+        the interrupt is still checked every cycle. 0 = no wait; up to
+        614ms in 2.4ms steps, then up to 7.4s in 28.8ms steps (WLONG).
+        """
+        if ms is None:
+            return self._wait_ms
+        wlong = ms > 614
+        step = 28.8 if wlong else 2.4
+        steps = max(1, min(256, int(ms / step + 0.5)))
+        self._write_byte(_CONFIG, _CONFIG_WLONG if wlong else 0)
+        self._write_byte(_WTIME, 256 - steps)
+        self._wen = _ENABLE_WEN if ms else 0
+        self._wait_ms = steps * step if ms else 0
+        self._write_byte(_ENABLE, _ENABLE_PON | _ENABLE_AEN | self._aien | self._wen)
+    
     def gain(self, value=None):
         if value is None:
             return self._gain
         self._gain = value
         self._write_byte(_CONTROL, value)
     
+    def data_ready(self):
+        """True once a full RGBC integration cycle has completed"""
+        self.i2c.readfrom_mem_into(self.address, _COMMAND_BIT | _STATUS, self._status_buf)
+        return bool(self._status_buf[0] & _STATUS_AVALID)
+    
+    def wait_ready(self, timeout_ms=None):
+        """Poll AVALID until set or the timeout (default: one cycle + margin) expires"""
+        if timeout_ms is None:
+            timeout_ms = int(self.integration_ms() + self._wait_ms) + 5
+        start = time.ticks_ms()
+        while not self.data_ready():
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                return False
+            time.sleep_ms(1)
+        return True
+    
+    def read_raw_into(self, out):
+        """Burst-read RGBC into out[0..3] as (r, g, b, clear) without allocating.
+        
+        All eight data registers are fetched in one auto-increment
+        transaction so the channels always come from the same cycle.
+        """
+        if not self.wait_ready():
+            raise RuntimeError("TCS34725 data not ready")
+        buf = self._data_buf
+        self.i2c.readfrom_mem_into(
+            self.address, _COMMAND_BIT | _COMMAND_AUTO_INCREMENT | _CDATAL, buf)
+        out[3] = buf[0] | (buf[1] << 8)
+        out[0] = buf[2] | (buf[3] << 8)
+        out[1] = buf[4] | (buf[5] << 8)
+        out[2] = buf[6] | (buf[7] << 8)
+        return out
+    
     def get_raw_data(self):
         """Read RGBC values. Returns tuple (r, g, b, clear)"""
-        # Check if data is ready
-        status = self._read_byte(_STATUS)
-        if not (status & 0x01):
-            time.sleep(0.003)  # Wait a bit if not ready
-        
-        c = self._read_word(_CDATAL)
-        r = self._read_word(_RDATAL)
-        g = self._read_word(_GDATAL)
-        b = self._read_word(_BDATAL)
-        
-        return (r, g, b, c)
+        data = self.read_raw_into(self._data)
+        return (data[0], data[1], data[2], data[3])
     
     def read_rgb(self):
         """Simplified RGB read (without clear channel)"""
@@ -95,7 +313,10 @@ class TCS34725:
         return (r, g, b)
     
     def enable(self, enable=True):
+        """Power up (2.4ms warm-up, then a new cycle) or sleep at ~2.5uA"""
         if enable:
-            self._write_byte(_ENABLE, _ENABLE_PON | _ENABLE_AEN)
+            self._write_byte(_ENABLE, _ENABLE_PON)
+            time.sleep_ms(3)  # Warm-up before AEN
+            self._write_byte(_ENABLE, _ENABLE_PON | _ENABLE_AEN | self._aien | self._wen)
         else:
             self._write_byte(_ENABLE, 0x00)
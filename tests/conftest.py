@@ -0,0 +1,20 @@
+import pytest
+
+# The other scripts in tests/ are hardware checks that run on the ESP32
+# (or under utils/emulator.py run), not under pytest
+collect_ignore = ["test_sensor.py", "test_dfplayer.py", "test_communication.py"]
+
+def pytest_addoption(parser):
+    parser.addoption("--bench", action="store_true",
+                     help="Also run the timing checks (@pytest.mark.bench)")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "bench: timing check, only run with --bench")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--bench"):
+        return
+    skip = pytest.mark.skip(reason="timing check: run with --bench")
+    for item in items:
+        if "bench" in item.keywords:
+            item.add_marker(skip)
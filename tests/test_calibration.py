@@ -0,0 +1,73 @@
+"""
+Drift Estimator Tests
+calibration.DriftEstimator against the stored white in
+config/calibration_data.json: a drifted white is corrected, an off-white
+surface or a short glimpse of white is not.
+"""
+import json
+import os
+import random
+import sys
+
+sys.modules.setdefault("ujson", json)  # MicroPython's name for it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import calibration  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def stored():
+    with open(os.path.join(ROOT, "config", "calibration_data.json")) as f:
+        data = json.load(f)
+    return calibration.factors_of(data), calibration.white_of(data)
+
+def feed(estimator, reading, n, noise=0.01, seed=0):
+    """Observe n noisy copies of reading; returns the first correction or None"""
+    rng = random.Random(seed)
+    for _ in range(n):
+        white = estimator.observe(*(int(v * (1 + rng.gauss(0, noise))) for v in reading))
+        if white:
+            return white
+    return None
+
+def test_drifted_white_is_corrected():
+    factors, white = stored()
+    estimator = calibration.DriftEstimator(factors, white)
+    drifted = (white[0], white[1], int(white[2] * 0.96), white[3])  # LED blue fading by 4%
+    new = feed(estimator, drifted, estimator.window * 3)  # A noisy sample may restart the run
+    assert new is not None
+    assert abs(new[2] / drifted[2] - 1) < 0.02
+    assert estimator.corrections == 1
+
+def test_off_white_is_not_white():
+    factors, white = stored()
+    estimator = calibration.DriftEstimator(factors, white)
+    beige = (1800, 1580, 1350, 4730)
+    assert feed(estimator, beige, estimator.window * 10) is None
+    assert estimator.factors == factors
+
+def test_white_must_stay_in_view():
+    factors, white = stored()
+    estimator = calibration.DriftEstimator(factors, white)
+    drifted = (white[0], white[1], int(white[2] * 0.96), white[3])
+    red = (white[0], white[1] // 4, white[2] // 4, white[3] // 2)
+    for seed in range(10):  # Never window white readings in a row
+        assert feed(estimator, drifted, estimator.window // 2, seed=seed) is None
+        assert feed(estimator, red, 1) is None
+
+def test_dim_white_is_ignored():
+    factors, white = stored()
+    estimator = calibration.DriftEstimator(factors, white)
+    grey = tuple(int(v * 0.6) for v in white[:3]) + (int(white[3] * 0.6),)
+    assert feed(estimator, grey, estimator.window * 2) is None
+
+def test_old_white_key_still_loads(tmp_path):
+    path = tmp_path / "calibration.json"
+    with open(os.path.join(ROOT, "config", "calibration_data.json")) as f:
+        data = json.load(f)
+    data["raw_white_reference"] = data.pop("white_reference")
+    path.write_text(json.dumps(data))
+    loaded = calibration.load(str(path))
+    white = calibration.white_of(loaded)
+    updated = calibration.update(loaded, white, "drift")
+    assert "raw_white_reference" not in updated
+    assert calibration.white_of(updated) == white
@@ -0,0 +1,65 @@
+"""
+Classifier Regression Suite
+Runs utils/classifier_bench.py under pytest: accuracy on the labelled
+dataset, and with --bench cost and heap per call, must stay within the
+tolerances of tests/classifier_baseline.json (refresh it with
+python utils/classifier_bench.py --update-baseline after a deliberate change).
+Timings are left out by default: on a shared machine they are too noisy
+for a pass/fail check.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils"))
+import classifier_bench as bench  # noqa: E402
+
+@pytest.fixture(scope="module")
+def samples():
+    return bench.load_dataset(names=bench.build_detect()[1])
+
+@pytest.fixture(scope="module")
+def baseline():
+    return bench.load_baseline()
+
+def test_dataset_covers_every_documented_color(samples):
+    colors = {name for _, _, _, accepted, _ in samples for name in accepted}
+    assert {"Red", "Green", "Blue", "Yellow", "Cyan", "Magenta", "Orange", "Purple",
+            "White", "Black"} <= colors
+    assert len(samples) > 1000
+
+@pytest.mark.parametrize("name", sorted(bench.CLASSIFIERS))
+def test_classifier_has_baseline(name, baseline):
+    assert name in baseline.get("classifiers", {}), "run classifier_bench.py --update-baseline"
+
+@pytest.mark.parametrize("name", sorted(bench.CLASSIFIERS))
+def test_accuracy_no_regression(name, samples, baseline):
+    result, _ = bench.measure(bench.CLASSIFIERS[name], samples, timing=False)
+    assert bench.regressions(name, result, baseline) == []
+
+@pytest.mark.bench
+@pytest.mark.parametrize("name", sorted(bench.CLASSIFIERS))
+def test_cost_no_regression(name, samples, baseline):
+    result, _ = bench.measure(bench.CLASSIFIERS[name], samples)
+    assert bench.regressions(name, result, baseline) == []
+
+def test_batch_matches_single(samples):
+    batch = bench.build_detect_batch()
+    if batch is None:
+        pytest.skip("numpy not installed")
+    detect, names = bench.build_detect()
+    prepare, run = batch
+    ids = run(prepare([(r, g, b) for r, g, b, _, _ in samples]))
+    assert [names[i] for i in ids.tolist()] == [detect(r, g, b)[0] for r, g, b, _, _ in samples]
+
+def test_fixed_point_matches_detect(samples):
+    """Integer-only path against the float one: same color for nearly every sample"""
+    detect, names = bench.build_detect()
+    fixed, _ = bench.build_detect_fixed()
+    inputs = [(r, g, b) for r, g, b, _, _ in samples]
+    same = sum(names[fixed(r, g, b) >> 8] == detect(r, g, b)[0] for r, g, b in inputs)
+    assert same / len(inputs) > 0.99
+    for r, g, b in inputs:
+        packed = fixed(r, g, b)
+        assert 0 <= packed & 0xFF <= 255 and packed >> 8 < len(names)
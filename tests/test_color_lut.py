@@ -0,0 +1,39 @@
+"""
+Color LUT Tests
+The compiled table against the rules it was built from: r% and g%
+thresholds sit on cell edges, b% thresholds only to within one cell.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import color_lut  # noqa: E402
+
+THRESHOLDS = (0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5)  # Every cut in rule_classify()
+
+def readings(n=50000, seed=0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        r, g, b = rng.randint(0, 2000), rng.randint(0, 2000), rng.randint(0, 2000)
+        if r + g + b:
+            yield r, g, b
+
+def near_threshold(value, within):
+    return any(abs(value - t) < within for t in THRESHOLDS)
+
+def test_lut_matches_rules_except_near_b_thresholds():
+    lut = color_lut.ColorLUT.from_profile(color_lut.DEFAULT_PROFILE)
+    levels = lut.levels
+    total = mismatched = 0
+    for r, g, b in readings():
+        s = r + g + b
+        total += 1
+        expected, _ = color_lut.rule_classify(r / s, g / s, b / s, color_lut.DEFAULT_PROFILE)
+        got, _ = lut.classify(r, g, b)
+        if got == expected:
+            continue
+        mismatched += 1
+        on_edge = (r * levels) % s == 0 or (g * levels) % s == 0  # r%/g% exactly on a threshold
+        assert on_edge or near_threshold(b / s, 1 / levels), (r, g, b, expected, got)
+    assert mismatched / total < 0.05
@@ -1,43 +1,295 @@
 """
 Audio Generator for Sensory Spectrum
-Generates 10 MP3 files with color names using gTTS (Google Text-to-Speech)
+Generates one clip per color in config/palette.json (track = palette position)
+
+Usage:
+  python utils/audio_generator.py                          # gTTS, English
+  python utils/audio_generator.py --backend espeak         # offline (espeak-ng)
+  python utils/audio_generator.py --lang en --lang de --workers 16
+  python utils/audio_generator.py --backend stub           # placeholder tones, no TTS
+  python utils/audio_generator.py --process                # trimmed, normalized MP3s
+
+Clips are cached by content (text, language, voice, backend) in
+.audio_cache/, so a run only synthesizes new or changed entries and
+unchanged tracks are skipped. Synthesis runs on a worker pool. With
+--process, clips also go through audio_processor.py (silence trim,
+loudness normalization, small MP3), cached the same way.
+
+A palette entry may give the spoken text per language:
+  {"name": "Red", "rgb": [255, 0, 0], "speech": {"de": "Rot"}}
+otherwise the color name is spoken.
+
+With one language the clips go to audio_files/, with several to
+audio_files/<lang>/. Each output folder gets track_map.json (color name ->
+track number) for the receiver's audio.track_map. WAV output (stub and
+espeak without --process) goes to audio_files_wav/ instead: the DFPlayer
+numbers tracks by the order they were copied to the card, so one folder
+must never mix formats, and a folder holding tracks in another format is
+refused.
 """
 
-from gtts import gTTS
+import argparse
+import hashlib
+import json
+import math
 import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def generate_audio_files():
-    """Generate all 10 color audio files"""
-    colors = [
-        ("Red", 1),
-        ("Green", 2),
-        ("Blue", 3),
-        ("Yellow", 4),
-        ("Cyan", 5),
-        ("Magenta", 6),
-        ("Orange", 7),
-        ("Purple", 8),
-        ("White", 9),
-        ("Black", 10)
-    ]
-
-    audio_dir = "audio_files"
-    os.makedirs(audio_dir, exist_ok=True)
-
-    for color_name, track_num in colors:
+import audio_processor
+from palette_builder import load_palette, track_map, update_track_map
+
+MAX_TRACKS = 3000  # DFPlayer limit
+TRACK_EXTS = ("mp3", "wav")  # Formats the DFPlayer plays
+CACHE_DIR = ".audio_cache"
+MANIFEST_FILE = "manifest.json"
+
+# ===== Synthesis backends =====
+# A backend turns text into one audio file. `version` is part of the cache
+# key: bump it when a backend's output changes for the same input.
+class GTTSBackend:
+    """Google Text-to-Speech (network); voice = accent TLD, e.g. "co.uk" """
+    name = "gtts"
+    version = 1
+    ext = "mp3"
+
+    def __init__(self):
         try:
-            print(f"Generating {track_num:04d}.mp3 - '{color_name}'...")
-            tts = gTTS(text=color_name, lang='en', slow=False)
-            filename = f"{track_num:04d}.mp3"
-            filepath = os.path.join(audio_dir, filename)
-            tts.save(filepath)
-            print(f"✅ {filename} created!")
-        except Exception as e:
-            print(f"❌ Error creating {filename}: {e}")
-
-    print("\n🎉 All 10 audio files ready!")
-    print(f"📁 Copy '{audio_dir}/*.mp3' to SD card root (FAT32)")
+            from gtts import gTTS
+        except ImportError:
+            sys.exit("❌ gTTS not installed: pip install gTTS (or use --backend espeak/stub)")
+        self.gTTS = gTTS
+
+    def synthesize(self, text, lang, voice, path):
+        self.gTTS(text=text, lang=lang, tld=voice or "com", slow=False).save(path)
+
+class EspeakBackend:
+    """espeak-ng / espeak (offline); voice = variant, e.g. "f3" """
+    name = "espeak"
+    version = 1
+    ext = "wav"
+
+    def __init__(self):
+        self.exe = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.exe:
+            sys.exit("❌ espeak-ng not found (apt install espeak-ng, or use --backend stub)")
+
+    def synthesize(self, text, lang, voice, path):
+        subprocess.run([self.exe, "-v", f"{lang}+{voice}" if voice else lang, "-w", path, text],
+                       check=True, capture_output=True)
+
+class StubBackend:
+    """Offline placeholder: a short tone per clip, longer for longer text"""
+    name = "stub"
+    version = 1
+    ext = "wav"
+    rate = 22050
+
+    def synthesize(self, text, lang, voice, path):
+        seconds = min(2.0, 0.25 + 0.05 * len(text))
+        pitch = 440 + (sum(text.encode()) % 24) * 20  # Tell clips apart by ear
+        frames = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * pitch * i / self.rate)))
+                          for i in range(int(seconds * self.rate)))
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.rate)
+            w.writeframes(frames)
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend, EspeakBackend, StubBackend)}
+
+# ===== Cache =====
+def cache_key(backend, text, lang, voice):
+    spec = json.dumps([backend.name, backend.version, text, lang, voice or ""], ensure_ascii=False)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+def cache_path(backend, key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[:2], f"{key}.{backend.ext}")
+
+def synthesize_cached(backend, text, lang, voice, cache_dir=CACHE_DIR):
+    """Path of the cached clip, synthesizing it first on a miss; returns (path, hit)"""
+    key = cache_key(backend, text, lang, voice)
+    path = cache_path(backend, key, cache_dir)
+    if os.path.exists(path):
+        return path, True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Synthesize beside the final name, then rename: a crash never leaves
+    # a truncated clip in the cache
+    fd, tmp = tempfile.mkstemp(suffix=f".{backend.ext}", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        backend.synthesize(text, lang, voice, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path, False
+
+def build_clip(backend, text, lang, voice, cache_dir=CACHE_DIR, process=None):
+    """Cached clip, post-processed when `process` settings are given;
+    returns (path, hit, processing stats or None)"""
+    path, hit = synthesize_cached(backend, text, lang, voice, cache_dir)
+    if process is None:
+        return path, hit, None
+    key = audio_processor.settings_key(cache_key(backend, text, lang, voice), process)
+    out = os.path.join(cache_dir, key[:2], f"{key}.mp3")
+    if os.path.exists(out):
+        return out, True, None
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(out))  # Unique per thread too
+    os.close(fd)
+    try:
+        stats = audio_processor.process_clip(path, tmp, process)
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return out, False, stats
+
+# ===== Palette =====
+def load_entries(palette_path="config/palette.json"):
+    """[(name, {lang: text}), ...] in track order"""
+    return [(entry["name"], entry.get("speech", {})) for entry in load_palette(palette_path)]
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# ===== Generation =====
+def foreign_tracks(out_dir, ext):
+    """Track files (NNNN.<ext>) in out_dir in a format other than ext"""
+    try:
+        names = os.listdir(out_dir)
+    except OSError:
+        return []
+    return sorted(name for name in names
+                  if len(name) > 5 and name[:4].isdigit() and name[4] == "."
+                  and name[5:] in TRACK_EXTS and name[5:] != ext)
+
+def generate_language(entries, lang, backend, out_dir, voice=None, workers=8, cache_dir=CACHE_DIR,
+                      process=None):
+    """Build out_dir/NNNN.<ext> for one language; returns (created, skipped, failed)"""
+    os.makedirs(out_dir, exist_ok=True)
+    old = load_manifest(out_dir)
+    manifest, jobs = {}, []
+    for track, (name, speech) in enumerate(entries, 1):
+        text = speech.get(lang, name)
+        filename = f"{track:04d}.{'mp3' if process else backend.ext}"
+        key = cache_key(backend, text, lang, voice)
+        if process:
+            key = audio_processor.settings_key(key, process)
+        manifest[filename] = {"name": name, "text": text, "key": key}
+        previous = old.get(filename)
+        if previous and previous["key"] == key and os.path.exists(os.path.join(out_dir, filename)):
+            continue  # Unchanged track
+        jobs.append((filename, text))
+
+    # Tracks the palette no longer has would still be copied to the SD card
+    for filename in old:
+        if filename not in manifest and os.path.exists(os.path.join(out_dir, filename)):
+            os.remove(os.path.join(out_dir, filename))
+
+    print(f"🗣️ [{lang}] {len(jobs)} to build, {len(entries) - len(jobs)} unchanged "
+          f"({backend.name}, {workers} workers)")
+    created, failed, processed = 0, [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_clip, backend, text, lang, voice, cache_dir, process): (filename, text)
+                   for filename, text in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            filename, text = futures[future]
+            try:
+                path, hit, stats = future.result()
+                shutil.copyfile(path, os.path.join(out_dir, filename))
+                created += 1
+                if stats:
+                    processed.append(stats)
+                if len(jobs) <= 20 or done % 100 == 0 or done == len(jobs):
+                    note = " (cached)" if hit else f" ({audio_processor.describe(stats)})" if stats else ""
+                    print(f"✅ {done}/{len(jobs)} {filename} - '{text}'{note}")
+            except Exception as e:
+                failed.append(filename)
+                del manifest[filename]  # Retried on the next run
+                print(f"❌ Error creating {filename} ('{text}'): {e}")
+    audio_processor.print_totals(processed)
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+    with open(os.path.join(out_dir, "track_map.json"), "w") as f:
+        json.dump(track_map([(name, None) for name, _ in entries]), f, indent=2, ensure_ascii=False)
+    return created, len(entries) - len(jobs), failed
+
+def generate_audio_files(palette_path="config/palette.json", langs=("en",), backend="gtts",
+                         voice=None, workers=8, audio_dir=None, cache_dir=CACHE_DIR,
+                         process=None):
+    """Generate an audio file per palette color and language; returns True when all succeeded
+    (process: audio_processor settings to post-process clips, None = as synthesized;
+    audio_dir: None = audio_files/ for MP3, audio_files_<ext>/ otherwise)"""
+    entries = load_entries(palette_path)
+    if len(entries) > MAX_TRACKS:
+        print(f"❌ DFPlayer supports at most {MAX_TRACKS} tracks")
+        return False
+    synth = BACKENDS[backend]()
+    if process is not None:
+        audio_processor.require_pydub()
+
+    ext = "mp3" if process else synth.ext
+    if audio_dir is None:
+        audio_dir = "audio_files" if ext == "mp3" else f"audio_files_{ext}"
+    out_dirs = [audio_dir] if len(langs) == 1 else [os.path.join(audio_dir, lang) for lang in langs]
+    for out_dir in out_dirs:
+        foreign = foreign_tracks(out_dir, ext)
+        if foreign:
+            print(f"❌ {out_dir} already holds {foreign[0]} ({len(foreign)} tracks in another format):")
+            print("   mixing formats breaks the DFPlayer track order; use --out, or remove them")
+            return False
+
+    start = time.monotonic()
+    ok = True
+    for lang, out_dir in zip(langs, out_dirs):
+        created, skipped, failed = generate_language(entries, lang, synth, out_dir, voice,
+                                                     workers, cache_dir, process)
+        ok = ok and not failed
+        print(f"📁 {out_dir}: {created} written, {skipped} unchanged, {len(failed)} failed")
+
+    print(f"\n🎉 {len(entries)} tracks x {len(langs)} language(s) in {time.monotonic() - start:.1f}s")
+    source = audio_dir if len(langs) == 1 else os.path.join(audio_dir, "<lang>")
+    print(f"📁 Copy '{source}/*.{ext}' to SD card root (FAT32)")
     print("💡 Tip: Test files on computer first!")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate color announcement clips")
+    parser.add_argument("--palette", default="config/palette.json", help="Palette source")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="gtts")
+    parser.add_argument("--lang", action="append", help="Language code (repeatable, default en)")
+    parser.add_argument("--voice", help="Backend voice (gTTS accent TLD, espeak variant)")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel synthesis jobs")
+    parser.add_argument("--out", help="Output folder (default audio_files, audio_files_wav for WAV)")
+    parser.add_argument("--cache", default=CACHE_DIR, help="Clip cache folder")
+    parser.add_argument("--update-config", action="store_true",
+                        help="Also write the track_map into receiver/config.json")
+    parser.add_argument("--process", action="store_true",
+                        help="Trim, normalize and re-encode clips (audio_processor.py)")
+    audio_processor.add_arguments(parser)
+    args = parser.parse_args()
+
+    process = audio_processor.settings_from_args(args) if args.process else None
+    ok = generate_audio_files(args.palette, args.lang or ["en"], args.backend, args.voice,
+                              args.workers, args.out, args.cache, process)
+    if args.update_config:
+        tracks = track_map([(name, None) for name, _ in load_entries(args.palette)])
+        update_track_map("receiver/config.json", tracks, 4)
+    if not ok:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    generate_audio_files()
+    main()
@@ -0,0 +1,178 @@
+"""
+Audio Processor for Sensory Spectrum
+Prepares announcement clips for the DFPlayer: trims leading and trailing
+silence (the leading part is pure delay before the color is heard),
+normalizes loudness across clips and re-encodes everything to one small
+MP3 format (mono, fixed sample rate and bitrate, no tags).
+
+Usage:
+  python utils/audio_processor.py                          # audio_files/ -> audio_files/processed/
+  python utils/audio_processor.py --src audio_files --out sd_card --workers 8
+  python utils/audio_processor.py --target-dbfs -14 --bitrate 32k --rate 16000
+
+audio_generator.py --process runs the same stage on its cached clips.
+Needs pydub and ffmpeg (pip install pydub; ffmpeg on PATH).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pydub import AudioSegment
+    from pydub.silence import detect_leading_silence
+except ImportError:
+    AudioSegment = None
+
+# Defaults for DFPlayer announcement clips: short speech decodes fine at
+# 22.05 kHz mono, and a low bitrate keeps files (and SD images) small
+SETTINGS = {
+    "silence_dbfs": -45.0,  # Quieter than this counts as silence
+    "keep_ms": 20,          # Silence left at each end so onsets are not clipped
+    "target_dbfs": -16.0,   # Average loudness of every clip
+    "peak_dbfs": -1.0,      # Gain is limited so peaks stay below this
+    "rate": 22050,
+    "bitrate": "48k",
+}
+EXTENSIONS = (".mp3", ".wav")
+
+def require_pydub():
+    if AudioSegment is None:
+        sys.exit("❌ pydub not installed: pip install pydub (and ffmpeg on PATH)")
+
+def settings_key(key, settings):
+    """Cache key of a processed clip: source clip key plus the settings"""
+    spec = json.dumps([key, sorted(settings.items())])
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+def trim_silence(segment, silence_dbfs, keep_ms):
+    """Returns (trimmed segment, leading ms removed, trailing ms removed)"""
+    lead = detect_leading_silence(segment, silence_threshold=silence_dbfs)
+    tail = detect_leading_silence(segment.reverse(), silence_threshold=silence_dbfs)
+    if lead + tail >= len(segment):
+        return segment, 0, 0  # All silence: leave it for the report to flag
+    lead = max(0, lead - keep_ms)
+    tail = max(0, tail - keep_ms)
+    return segment[lead:len(segment) - tail], lead, tail
+
+def normalize_loudness(segment, target_dbfs, peak_dbfs):
+    """Gain to the target average level, limited by peak headroom; returns (segment, gain dB)"""
+    if segment.dBFS == float("-inf"):
+        return segment, 0.0
+    gain = min(target_dbfs - segment.dBFS, peak_dbfs - segment.max_dBFS)
+    return segment.apply_gain(gain), gain
+
+def process_clip(src, dst, settings=None):
+    """Process one clip into dst (MP3); returns its stats dict"""
+    require_pydub()
+    s = dict(SETTINGS, **(settings or {}))
+    segment = AudioSegment.from_file(src)
+    before_ms = len(segment)
+    segment, lead, tail = trim_silence(segment, s["silence_dbfs"], s["keep_ms"])
+    segment, gain = normalize_loudness(segment, s["target_dbfs"], s["peak_dbfs"])
+    segment = segment.set_channels(1).set_frame_rate(s["rate"])
+    # No ID3/Xing headers: the player starts decoding at the first frame
+    segment.export(dst, format="mp3", bitrate=s["bitrate"],
+                   parameters=["-map_metadata", "-1", "-id3v2_version", "0",
+                               "-write_id3v1", "0", "-write_xing", "0"])
+    return {
+        "lead_ms": lead,
+        "tail_ms": tail,
+        "gain_db": gain,
+        "before_ms": before_ms,
+        "after_ms": len(segment),
+        "before_bytes": os.path.getsize(src),
+        "after_bytes": os.path.getsize(dst),
+    }
+
+def describe(stats):
+    """One-line saving summary of a clip"""
+    saved = stats["before_bytes"] - stats["after_bytes"]
+    return (f"-{stats['lead_ms']} ms to first sound, {stats['before_ms']}->{stats['after_ms']} ms, "
+            f"{stats['before_bytes'] // 1024}->{stats['after_bytes'] // 1024} KB "
+            f"({saved * 100 // max(1, stats['before_bytes'])}% smaller), {stats['gain_db']:+.1f} dB")
+
+def print_totals(results):
+    """Summary over a list of stats dicts"""
+    if not results:
+        return
+    lead = [r["lead_ms"] for r in results]
+    before = sum(r["before_bytes"] for r in results)
+    after = sum(r["after_bytes"] for r in results)
+    print(f"⏱️ First sound: {sum(lead) / len(lead):.0f} ms earlier on average (max {max(lead)} ms)")
+    print(f"💾 Size: {before / 1048576:.2f} MB -> {after / 1048576:.2f} MB "
+          f"({(before - after) * 100 // max(1, before)}% smaller)")
+
+def process_folder(src_dir="audio_files", out_dir=None, settings=None, workers=4):
+    """Process every NNNN clip of src_dir into out_dir/NNNN.mp3; returns the stats list"""
+    require_pydub()
+    out_dir = out_dir or os.path.join(src_dir, "processed")
+    os.makedirs(out_dir, exist_ok=True)
+    names = sorted(n for n in os.listdir(src_dir)
+                   if n.lower().endswith(EXTENSIONS) and os.path.splitext(n)[0].isdigit())
+    if not names:
+        print(f"❌ No clips in {src_dir}")
+        return []
+
+    def job(name):
+        dst = os.path.join(out_dir, os.path.splitext(name)[0] + ".mp3")
+        if os.path.abspath(dst) == os.path.abspath(os.path.join(src_dir, name)):
+            dst += ".tmp"  # Same file: process beside it, then replace
+        stats = process_clip(os.path.join(src_dir, name), dst, settings)
+        if dst.endswith(".tmp"):
+            os.replace(dst, dst[:-4])
+        return stats
+
+    print(f"🎚️ Processing {len(names)} clips from {src_dir} into {out_dir}...")
+    start = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(name, pool.submit(job, name)) for name in names]
+        for name, future in futures:
+            try:
+                stats = future.result()
+                results.append(stats)
+                print(f"✅ {name}: {describe(stats)}")
+            except Exception as e:
+                print(f"❌ {name}: {e}")
+    print(f"\n🎉 {len(results)}/{len(names)} clips in {time.monotonic() - start:.1f}s")
+    print_totals(results)
+    return results
+
+def settings_from_args(args):
+    return {"silence_dbfs": args.silence_dbfs, "keep_ms": args.keep_ms,
+            "target_dbfs": args.target_dbfs, "peak_dbfs": args.peak_dbfs,
+            "rate": args.rate, "bitrate": args.bitrate}
+
+def add_arguments(parser):
+    """Processing options, shared with audio_generator.py"""
+    parser.add_argument("--silence-dbfs", type=float, default=SETTINGS["silence_dbfs"],
+                        help="Level below which audio counts as silence")
+    parser.add_argument("--keep-ms", type=int, default=SETTINGS["keep_ms"],
+                        help="Silence kept at each end")
+    parser.add_argument("--target-dbfs", type=float, default=SETTINGS["target_dbfs"],
+                        help="Average loudness of every clip")
+    parser.add_argument("--peak-dbfs", type=float, default=SETTINGS["peak_dbfs"],
+                        help="Peak ceiling when raising the level")
+    parser.add_argument("--rate", type=int, default=SETTINGS["rate"], help="Output sample rate")
+    parser.add_argument("--bitrate", default=SETTINGS["bitrate"], help="Output MP3 bitrate")
+
+def main():
+    parser = argparse.ArgumentParser(description="Trim, normalize and re-encode announcement clips")
+    parser.add_argument("--src", default="audio_files", help="Folder with NNNN.mp3/.wav clips")
+    parser.add_argument("--out", help="Output folder (default: <src>/processed)")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel ffmpeg jobs")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = process_folder(args.src, args.out, settings_from_args(args), args.workers)
+    if not results:
+        sys.exit(1)
+    print("📁 Copy the processed clips to SD card root (FAT32)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Capture Replay for Sensory Spectrum
+Receives raw RGBC captures from senders (capture.mode "udp") and replays
+capture files through the classifier: accuracy, Unknown rate, per-color
+recall and the confusion matrix, over millions of samples in seconds.
+
+Usage:
+  python utils/capture_replay.py receive --out captures/red.cap --label Red
+  python utils/capture_replay.py replay captures/*.cap
+  python utils/capture_replay.py replay capture.bin --label Blue --calibration calibration.json
+  python utils/capture_replay.py replay captures/*.cap --lut sender/lut_low_light.bin --check 20000
+  python utils/capture_replay.py replay captures/*.cap --palette sender/palette.bin
+  python utils/capture_replay.py replay captures/*.cap --classifier my_rules:classify
+
+Files are memory-mapped and classified in NumPy batches. The default
+"vector" classifier is sender/classifier.py's detect() (the sender's
+detect_rgb_color_enhanced) written with array operations; "reference"
+calls detect() itself per sample, and --check N compares the two. Any
+other classifier is "module:function", called per batch with the scaled
+r, g, b, clear arrays and returning (color IDs, confidences 0-1).
+
+Flash captures (capture.mode "flash") are fetched with
+  ampy --port /dev/ttyUSB0 get capture.bin captures/unit3.bin
+Needs numpy (pip install numpy).
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "common"))
+sys.path.insert(0, os.path.join(ROOT, "sender"))
+import protocol  # noqa: E402
+import capture  # noqa: E402
+import classifier  # noqa: E402
+from color_lut import ColorLUT  # noqa: E402
+
+UDP_PORT = 4212
+BATCH = 1 << 20
+
+# tcs34725.py scaling: counts as if read at 50 ms / 4x
+GAIN_MULTIPLIER = (1, 4, 16, 60)
+REFERENCE_SENSITIVITY = 84
+
+def require_numpy():
+    if np is None:
+        sys.exit("❌ numpy not installed: pip install numpy")
+
+def record_dtype():
+    return np.dtype([("t", "<u4"), ("r", "<u2"), ("g", "<u2"), ("b", "<u2"), ("c", "<u2"),
+                     ("atime", "u1"), ("gain", "u1"), ("label", "<u2")])
+
+# ===== Capture files =====
+def open_capture(path):
+    """(header dict, [record arrays in time order]); arrays are views of the mapped file"""
+    with open(path, "rb") as f:
+        head = f.read(capture.FILE_HEADER_SIZE)
+        if len(head) < capture.FILE_HEADER_SIZE:
+            raise ValueError(f"{path}: not a capture file")
+        magic, version, size, sender_id, capacity, total = struct.unpack(capture.FILE_HEADER_FORMAT, head)
+        if magic != capture.FILE_MAGIC or version != capture.FILE_VERSION or size != capture.RECORD_SIZE:
+            raise ValueError(f"{path}: not a capture file (or another version)")
+        available = (os.fstat(f.fileno()).st_size - capture.FILE_HEADER_SIZE) // size
+        if available == 0:
+            return {"sender_id": sender_id, "capacity": capacity, "records": 0}, []
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    records = np.frombuffer(data, dtype=record_dtype(), count=available, offset=capture.FILE_HEADER_SIZE)
+    if capacity == 0:      # Append-only host file
+        segments = [records]
+    elif total <= capacity:
+        segments = [records[:total]]
+    else:                  # Wrapped ring: oldest record sits at the write position
+        split = total % capacity
+        segments = [records[split:capacity], records[:split]]
+    header = {"sender_id": sender_id, "capacity": capacity,
+              "records": sum(len(s) for s in segments)}
+    return header, [s for s in segments if len(s)]
+
+def scaled(records):
+    """Scaled r, g, b, clear (int64 arrays), exactly as read_scaled_into() returns them"""
+    sens = (256 - records["atime"].astype(np.int64)) * np.take(GAIN_MULTIPLIER, records["gain"] & 3)
+    return tuple(records[ch].astype(np.int64) * REFERENCE_SENSITIVITY // sens for ch in "rgbc")
+
+# ===== Classifiers =====
+class VectorDetect:
+    """classifier.detect() over arrays (chromaticity table path)"""
+
+    def __init__(self, lut, factors, min_intensity):
+        self.lut = lut
+        self.factors = factors
+        self.min_intensity = min_intensity
+        table = np.frombuffer(lut.table, dtype=np.uint8).reshape(-1, 2)
+        self.table_ids = table[:, 0].astype(np.int64)
+        self.table_conf = table[:, 1]
+        self.black = lut.names.index("Black")
+        self.white = lut.names.index("White")
+
+    def __call__(self, r, g, b, clear):
+        # Same float operations as the scalar code, so results match exactly
+        r = (r * self.factors[0]).astype(np.int64)
+        g = (g * self.factors[1]).astype(np.int64)
+        b = (b * self.factors[2]).astype(np.int64)
+        black = r + g + b < self.min_intensity * 3
+        top = np.maximum(np.maximum(r, g), b)
+        over = top > 255
+        if over.any():
+            scale = 255 / top[over]
+            r[over] = (r[over] * scale).astype(np.int64)
+            g[over] = (g[over] * scale).astype(np.int64)
+            b[over] = (b[over] * scale).astype(np.int64)
+        total = r + g + b
+
+        levels = self.lut.levels
+        safe = np.maximum(total, 1)
+        ri = np.minimum(r * levels // safe, levels - 1)
+        gi = np.minimum(g * levels // safe, levels - 1)
+        cell = ri * levels + gi
+        ids = np.where(total > 0, self.table_ids[cell], 0)
+        conf = np.where(total > 0, self.table_conf[cell] / 255, 0.0)
+
+        white = ((total > classifier.MAX_TOTAL) & (np.abs(r - g) < 50) & (np.abs(g - b) < 50)
+                 & (np.abs(r - b) < 50))
+        ids[white] = self.white
+        conf[white] = 0.9
+        ids[black] = self.black
+        conf[black] = 0.9
+        return ids, conf
+
+class ReferenceDetect:
+    """classifier.detect() itself, one sample at a time"""
+
+    def __init__(self, names, lut, factors, min_intensity, palette=None):
+        self.args = (factors, min_intensity, lut, palette)
+        self.index = {name: i for i, name in enumerate(names)}.__getitem__
+
+    def __call__(self, r, g, b, clear):
+        ids = np.empty(len(r), dtype=np.int64)
+        conf = np.empty(len(r))
+        detect, args, index = classifier.detect, self.args, self.index
+        for i, (ri, gi, bi) in enumerate(zip(r.tolist(), g.tolist(), b.tolist())):
+            name, conf[i] = detect(ri, gi, bi, *args)
+            ids[i] = index(name)
+        return ids, conf
+
+def load_plugin(spec):
+    module, _, function = spec.partition(":")
+    sys.path.insert(0, os.getcwd())
+    return getattr(importlib.import_module(module), function)
+
+def load_factors(path):
+    if not path:
+        return (1.0, 1.0, 1.0)
+    with open(path) as f:
+        data = json.load(f)
+    return tuple(data["calibration_factors"][k] for k in ("red_factor", "green_factor", "blue_factor"))
+
+# ===== Replay =====
+def replay(paths, classify, names, label=None, batch=BATCH, check=None):
+    """Classify every record; returns the results dict"""
+    k = len(names)
+    pairs = np.zeros(0, dtype=np.int64)  # label * k + predicted, unique
+    counts = np.zeros(0, dtype=np.int64)
+    total = labelled = unknown = 0
+    start = time.perf_counter()
+    for path in paths:
+        header, segments = open_capture(path)
+        kind = f"ring of {header['capacity']}" if header["capacity"] else "file"
+        print(f"📂 {path}: {header['records']} records ({kind}, sender {header['sender_id']})")
+        for records in segments:
+            for i in range(0, len(records), batch):
+                chunk = records[i:i + batch]
+                ids, _ = classify(*scaled(chunk))
+                truth = chunk["label"].astype(np.int64) if label is None else np.full(len(chunk), label)
+                known = truth != protocol.CAPTURE_UNLABELLED
+                total += len(chunk)
+                labelled += int(known.sum())
+                unknown += int((ids == 0).sum())
+                merged = np.concatenate((pairs, truth[known] * k + ids[known]))
+                weights = np.concatenate((counts, np.ones(int(known.sum()), dtype=np.int64)))
+                pairs, inverse = np.unique(merged, return_inverse=True)
+                counts = np.bincount(inverse, weights=weights).astype(np.int64)
+    elapsed = time.perf_counter() - start
+    confusion = {(int(p) // k, int(p) % k): int(n) for p, n in zip(pairs, counts)}
+    correct = sum(n for (t, p), n in confusion.items() if t == p)
+    result = {"samples": total, "labelled": labelled, "seconds": round(elapsed, 3),
+              "samples_per_s": int(total / elapsed) if elapsed else None,
+              "accuracy": correct / labelled if labelled else None,
+              "unknown_rate": unknown / total if total else None,
+              "confusion": confusion}
+    if check:
+        result["check_mismatches"] = check(paths)
+    return result
+
+def compare(paths, classify, reference, n):
+    """Records (of the first n) where classify and reference disagree"""
+    mismatches, seen = 0, 0
+    for path in paths:
+        for records in open_capture(path)[1]:
+            chunk = records[:n - seen]
+            values = scaled(chunk)
+            mismatches += int((classify(*values)[0] != reference(*values)[0]).sum())
+            seen += len(chunk)
+            if seen >= n:
+                return mismatches
+    return mismatches
+
+def print_result(result, names):
+    print(f"\n⏱️ {result['samples']} samples in {result['seconds']:.2f}s "
+          f"({result['samples_per_s'] or 0:,} samples/s)")
+    if result["unknown_rate"] is not None:
+        print(f"❓ Unknown rate: {result['unknown_rate']:.2%}")
+    if "check_mismatches" in result:
+        state = "✅" if result["check_mismatches"] == 0 else "❌"
+        print(f"{state} Check against reference: {result['check_mismatches']} mismatches")
+    if not result["labelled"]:
+        print("💡 No labels: capture with capture.label / receive --label, or replay with --label")
+        return
+    print(f"🎯 Accuracy: {result['accuracy']:.2%} of {result['labelled']} labelled samples")
+
+    confusion = result["confusion"]
+    classes = sorted({c for pair in confusion for c in pair})
+    print("\nPer color (recall):")
+    for t in sorted({t for t, _ in confusion}):
+        row = sum(n for (tt, _), n in confusion.items() if tt == t)
+        print(f"  {names[t]:<16} {confusion.get((t, t), 0) / row:7.2%}  of {row}")
+    if len(classes) <= 12:
+        width = max(6, max(len(names[c][:10]) for c in classes) + 1)
+        print("\nConfusion (rows: label, columns: detected):")
+        print(" " * 12 + "".join(names[c][:10].rjust(width) for c in classes))
+        for t in classes:
+            if any(tt == t for tt, _ in confusion):
+                print(f"  {names[t][:10]:<10}" +
+                      "".join(str(confusion.get((t, p), 0)).rjust(width) for p in classes))
+    else:
+        print("\nMost frequent confusions:")
+        errors = sorted(((n, t, p) for (t, p), n in confusion.items() if t != p), reverse=True)
+        for n, t, p in errors[:15]:
+            print(f"  {names[t]} -> {names[p]}: {n}")
+
+# ===== Receive =====
+RESTART_GAP = 64  # Batch numbers further off than this: the sender restarted
+
+class CaptureReceiver(asyncio.DatagramProtocol):
+    def __init__(self, out, label):
+        self.out = out
+        self.label = label
+        self.records = 0
+        self.lost = 0
+        self.last_seq = {}
+
+    def datagram_received(self, data, addr):
+        batch = protocol.unpack_capture(data)
+        if not batch:
+            return
+        sender_id, seq, count, offset = batch
+        last = self.last_seq.get(sender_id)
+        if last is not None:
+            gap = protocol.seq_diff(seq, last)
+            if not -RESTART_GAP < gap <= RESTART_GAP:
+                print(f"🔄 Sender {sender_id} restarted its batch numbers ({last} -> {seq})")
+            elif gap <= 0:
+                return  # Duplicate or reordered
+            else:
+                self.lost += gap - 1
+        self.last_seq[sender_id] = seq
+        body = bytearray(data[offset:offset + count * capture.RECORD_SIZE])
+        if self.label is not None:
+            for i in range(count):
+                struct.pack_into("<H", body, i * capture.RECORD_SIZE + 14, self.label)
+        self.out.write(body)
+        self.records += count
+
+def open_output(path):
+    """Append-only capture file, created with its header when new"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, "wb") as f:
+            f.write(struct.pack(capture.FILE_HEADER_FORMAT, capture.FILE_MAGIC, capture.FILE_VERSION,
+                                capture.RECORD_SIZE, 0, 0, 0))
+    return open(path, "ab")
+
+async def receive(path, port, label):
+    out = open_output(path)
+    loop = asyncio.get_running_loop()
+    transport, proto = await loop.create_datagram_endpoint(lambda: CaptureReceiver(out, label),
+                                                           local_addr=("0.0.0.0", port))
+    print(f"📡 Receiving captures on UDP {port} into {path} (Ctrl+C to stop)")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            out.flush()
+            print(f"📥 {proto.records} records from {len(proto.last_seq)} sender(s), "
+                  f"{proto.lost} batches lost")
+    finally:
+        transport.close()
+        out.close()
+
+def names_for(args):
+    """(names by wire color ID, lut, palette)"""
+    lut = ColorLUT.load(args.lut)
+    if not args.palette:
+        return list(lut.names), lut, None
+    import palette as palette_module
+    named = palette_module.Palette.load(args.palette)
+    return ["Unknown"] + [named.name(i) for i in range(1, named.count + 1)], lut, named
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive and replay raw RGBC captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("receive", help="Store MSG_CAPTURE datagrams in a capture file")
+    p.add_argument("--out", required=True, help="Capture file (appended)")
+    p.add_argument("--port", type=int, default=UDP_PORT)
+    p.add_argument("--label", help="Color name of the surface, stored with every record")
+    p.add_argument("--lut", default="sender/lut_default.bin", help="Names for --label")
+    p.add_argument("--palette", help="Palette for --label names (palette classifier)")
+
+    p = commands.add_parser("replay", help="Classify captures and report accuracy")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--classifier", default="vector", help="vector, reference or module:function")
+    p.add_argument("--lut", default="sender/lut_default.bin", help="Chromaticity table")
+    p.add_argument("--palette", help="palette.bin: named palette classifier (reference only)")
+    p.add_argument("--calibration", help="calibration.json / calibration_data.json (default: none)")
+    p.add_argument("--min-intensity", type=int, default=200)
+    p.add_argument("--label", help="Color of every sample (overrides stored labels)")
+    p.add_argument("--batch", type=int, default=BATCH, help="Records per NumPy batch")
+    p.add_argument("--check", type=int, help="Compare with the reference on the first N samples")
+    p.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    names, lut, named = names_for(args)
+    label = None
+    if args.label:
+        if args.label not in names:
+            sys.exit(f"❌ Unknown color '{args.label}'")
+        label = names.index(args.label)
+
+    if args.command == "receive":
+        try:
+            asyncio.run(receive(args.out, args.port, label))
+        except KeyboardInterrupt:
+            print("\n💾 Saved")
+        return
+
+    require_numpy()
+    factors = load_factors(args.calibration)
+    reference = ReferenceDetect(names, lut, factors, args.min_intensity, named)
+    if args.classifier == "reference" or (args.classifier == "vector" and named):
+        if named:
+            print("💡 The palette classifier runs per sample (reference)")
+        classify = reference
+    elif args.classifier == "vector":
+        classify = VectorDetect(lut, factors, args.min_intensity)
+    else:
+        classify = load_plugin(args.classifier)
+    check = (lambda paths: compare(paths, classify, reference, args.check)) if args.check else None
+
+    result = replay(args.files, classify, names, label, args.batch, check)
+    if args.json:
+        result["confusion"] = [{"label": names[t], "detected": names[p], "count": n}
+                               for (t, p), n in sorted(result["confusion"].items())]
+        print(json.dumps(result, indent=1))
+    else:
+        print_result(result, names)
+
+if __name__ == "__main__":
+    main()
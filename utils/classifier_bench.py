@@ -0,0 +1,343 @@
+"""
+Classifier Benchmark for Sensory Spectrum
+Measures what a classification costs on CPython (per sample, per sample in
+a batch, heap per call) and how accurate it is on a labelled dataset, and
+fails when a classifier regresses past the stored baseline.
+
+Usage:
+  python utils/classifier_bench.py                         # all classifiers vs the baseline
+  python utils/classifier_bench.py --classifier detect --captures captures/*.cap
+  python utils/classifier_bench.py --classifier detect_fixed
+  python utils/classifier_bench.py --update-baseline       # accept the current numbers
+  python utils/classifier_bench.py --classifier my_rules:detect
+
+Dataset: every "Expected Sensor Reading" raw range in Docs/example_colors.md
+sampled on a grid, plus its "Common Variations" (8-bit colors scaled to
+the white reading; any of the quoted colors counts as right), plus any
+labelled capture files (utils/capture_replay.py format).
+
+Classifiers run with the shipped sensor.min_intensity (sender/config.json).
+Timings are stored relative to a fixed pure-Python loop timed in the same
+run, so a baseline taken on one machine holds on another. The tests in
+tests/test_classifier_bench.py check accuracy under plain pytest; the cost
+and heap checks only run with pytest --bench.
+"""
+
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+sys.path.insert(0, os.path.join(ROOT, "sender"))
+import classifier  # noqa: E402
+from color_lut import ColorLUT  # noqa: E402
+
+EXAMPLES = os.path.join(ROOT, "Docs", "example_colors.md")
+BASELINE = os.path.join(ROOT, "tests", "classifier_baseline.json")
+CALIBRATION = os.path.join(ROOT, "config", "calibration_data.json")
+SENDER_CONFIG = os.path.join(ROOT, "sender", "config.json")
+GRID = 5  # Points per channel across each documented raw range
+
+with open(SENDER_CONFIG) as f:
+    MIN_INTENSITY = json.load(f)["sensor"]["min_intensity"]  # As the firmware ships
+
+# Allowed drift from the baseline before a run fails
+TOLERANCE = {
+    "cost": 0.50,          # Relative per-sample / batch cost (timings on shared machines are noisy)
+    "heap_bytes": 32,      # Peak heap per call
+    "accuracy": 0.005,     # Absolute
+    "unknown_rate": 0.01,  # Absolute
+}
+
+# ===== Dataset =====
+_RANGE = re.compile(r"Raw Values: R: (\d+)-(\d+), G: (\d+)-(\d+), B: (\d+)-(\d+)")
+_DETECTION = re.compile(r'Detection: "([^"]+)"')
+_VARIATION = re.compile(r"- \*\*(.+?)\*\*: R: (\d+), G: (\d+), B: (\d+) → (.*)")
+
+def grid(low, high, n=GRID):
+    return [low + (high - low) * i // (n - 1) for i in range(n)]
+
+def load_dataset(path=EXAMPLES, names=None):
+    """[(r, g, b, {acceptable names}, source)], from the documented readings"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    ranges = []
+    for match in _RANGE.finditer(text):
+        detection = _DETECTION.search(text, match.end())
+        ranges.append((tuple(int(v) for v in match.groups()), detection.group(1)))
+    white = [bounds for bounds, name in ranges if name == "White"]
+    white_counts = sum(white[0]) // 6 if white else 1800  # Mid white reading
+
+    samples = []
+    for (r0, r1, g0, g1, b0, b1), name in ranges:
+        for r in grid(r0, r1):
+            for g in grid(g0, g1):
+                for b in grid(b0, b1):
+                    samples.append((r, g, b, {name}, name))
+    for label, r, g, b, expected in _VARIATION.findall(text):
+        accepted = set(re.findall(r'"([^"]+)"', expected))
+        if names is not None:
+            accepted &= set(names)
+        if accepted:
+            samples.append((int(r) * white_counts // 255, int(g) * white_counts // 255,
+                            int(b) * white_counts // 255, accepted, label))
+    return samples
+
+def load_captures(paths, names):
+    """Labelled samples of capture files (needs numpy)"""
+    import capture_replay
+    capture_replay.require_numpy()
+    samples = []
+    for path in paths:
+        for records in capture_replay.open_capture(path)[1]:
+            records = records[records["label"] < len(names)]
+            r, g, b, _ = capture_replay.scaled(records)
+            for ri, gi, bi, label in zip(r.tolist(), g.tolist(), b.tolist(), records["label"].tolist()):
+                samples.append((ri, gi, bi, {names[label]}, os.path.basename(path)))
+    return samples
+
+# ===== Classifiers =====
+def calibration_factors(path=CALIBRATION):
+    with open(path) as f:
+        factors = json.load(f)["calibration_factors"]
+    return (factors["red_factor"], factors["green_factor"], factors["blue_factor"])
+
+def default_lut():
+    return ColorLUT.load(os.path.join(ROOT, "sender", "lut_default.bin"))
+
+def build_detect(min_intensity=MIN_INTENSITY):
+    """classifier.detect() as the sender calls it: (r, g, b) -> (name, confidence)"""
+    lut, factors = default_lut(), calibration_factors()
+
+    def detect(r, g, b):
+        return classifier.detect(r, g, b, factors, min_intensity, lut)
+    return detect, lut.names
+
+def build_detect_fixed(min_intensity=MIN_INTENSITY):
+    """classifier.FixedClassifier: (r, g, b) -> (color_id << 8) | confidence"""
+    lut = default_lut()
+    fixed = classifier.FixedClassifier(lut, calibration_factors(), min_intensity)
+    return fixed.classify, lut.names
+
+def build_detect_batch(min_intensity=MIN_INTENSITY):
+    """The NumPy form utils/capture_replay.py uses, as (prepare, run); None without numpy"""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    import capture_replay
+    vector = capture_replay.VectorDetect(default_lut(), calibration_factors(), min_intensity)
+
+    def prepare(inputs):
+        return [np.array(channel, dtype=np.int64) for channel in zip(*inputs)]
+
+    def run(arrays):
+        return vector(arrays[0], arrays[1], arrays[2], None)[0]
+    return prepare, run
+
+# name -> (single-sample factory, batch factory or None), both taking
+# min_intensity. A single-sample factory returns (fn, names), fn returning
+# (name, confidence) or a packed (color_id << 8) | confidence; a batch
+# factory returns (prepare(list of (r, g, b)) -> input, run(input)) or None
+CLASSIFIERS = {
+    "detect": (build_detect, build_detect_batch),
+    "detect_fixed": (build_detect_fixed, None),
+}
+
+def load_plugin(spec):
+    """'module:function' taking (r, g, b) -> (name, confidence)"""
+    import importlib
+    module, _, function = spec.partition(":")
+    sys.path.insert(0, os.getcwd())
+    fn = getattr(importlib.import_module(module), function)
+    return (lambda min_intensity: (fn, None)), None
+
+# ===== Measurements =====
+def reference_loop(n=100000):
+    """ns per iteration of a fixed integer loop: the unit costs are stored in"""
+    start = time.perf_counter_ns()
+    x = 0
+    for i in range(n):
+        x = (x * 31 + i) & 0xFFFF
+    return (time.perf_counter_ns() - start) / n
+
+def relative_cost(run, repeats=9):
+    """(best ns per sample of run(), in reference-loop units). The
+    reference loop is timed between runs, so both see the same load"""
+    best = unit = None
+    enabled = gc.isenabled()
+    gc.disable()  # As timeit does: a collection is not part of either cost
+    try:
+        for _ in range(repeats):
+            ref = reference_loop()
+            ns = run()
+            unit = ref if unit is None else min(unit, ref)
+            best = ns if best is None else min(best, ns)
+    finally:
+        if enabled:
+            gc.enable()
+    return best, best / unit
+
+def per_sample_run(fn, samples, min_calls=20000):
+    """A run() for relative_cost: ns per call over the dataset"""
+    inputs = [(r, g, b) for r, g, b, _, _ in samples]
+    rounds = max(1, min_calls // len(inputs))
+
+    def run():
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for r, g, b in inputs:
+                fn(r, g, b)
+        return (time.perf_counter_ns() - start) / (rounds * len(inputs))
+    return run
+
+def batch_run(batch, samples, size=100000):
+    """A run() for relative_cost: ns per sample for one batch of `size` samples"""
+    prepare, process = batch
+    inputs = [(r, g, b) for r, g, b, _, _ in samples]
+    data = prepare((inputs * (size // len(inputs) + 1))[:size])
+
+    def run():
+        start = time.perf_counter_ns()
+        process(data)
+        return (time.perf_counter_ns() - start) / size
+    return run
+
+def heap_bytes(fn, samples, calls=2000):
+    """Mean peak heap (tracemalloc) held during one call, beyond what it returns"""
+    inputs = [(r, g, b) for r, g, b, _, _ in samples][:calls]
+    fn(*inputs[0])  # Warm caches
+    total = 0
+    tracemalloc.start()
+    try:
+        for r, g, b in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn(r, g, b)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(inputs)
+
+def name_of(result, names):
+    """Color name of a single-sample result, tuple or packed"""
+    return names[result >> 8] if isinstance(result, int) else result[0]
+
+def accuracy(fn, samples, names=None):
+    """(share classified as one of the accepted names, share Unknown, {(source, detected): misses})"""
+    right = unknown = 0
+    misses = {}
+    for r, g, b, accepted, source in samples:
+        name = name_of(fn(r, g, b), names)
+        if name in accepted:
+            right += 1
+        else:
+            key = (source, name)
+            misses[key] = misses.get(key, 0) + 1
+        if name == "Unknown":
+            unknown += 1
+    return right / len(samples), unknown / len(samples), misses
+
+def measure(factories, samples, min_intensity=MIN_INTENSITY, timing=True):
+    """(result dict, misses); result["ns"] / ["batch_ns"] are this machine's timings.
+    timing=False: accuracy only (deterministic, no cost or heap figures)"""
+    single, batch_factory = factories
+    fn, names = single(min_intensity)
+    acc, unknown, misses = accuracy(fn, samples, names)
+    result = {
+        "accuracy": round(acc, 4),
+        "unknown_rate": round(unknown, 4),
+        "samples": len(samples),
+    }
+    if not timing:
+        return result, misses
+    ns, cost = relative_cost(per_sample_run(fn, samples))
+    result.update(cost=round(cost, 2), ns=round(ns), heap_bytes=round(heap_bytes(fn, samples), 1))
+    batch = batch_factory(min_intensity) if batch_factory else None
+    if batch:
+        ns, cost = relative_cost(batch_run(batch, samples))
+        result["batch_cost"] = round(cost, 3)
+        result["batch_ns"] = round(ns, 1)
+    return result, misses
+
+def regressions(name, result, baseline, tolerance=TOLERANCE):
+    """Messages for every figure in result past its baseline (empty = pass)"""
+    base = baseline.get("classifiers", {}).get(name)
+    if not base:
+        return []
+    problems = []
+    for key in ("cost", "batch_cost"):
+        if key in result and key in base and result[key] > base[key] * (1 + tolerance["cost"]):
+            problems.append(f"{name}: {key} {result[key]} > {base[key]} +{tolerance['cost']:.0%}")
+    if "heap_bytes" in result and result["heap_bytes"] > base["heap_bytes"] + tolerance["heap_bytes"]:
+        problems.append(f"{name}: heap {result['heap_bytes']} B > {base['heap_bytes']} B")
+    if base.get("samples") == result["samples"]:  # Same dataset: accuracy is comparable
+        if result["accuracy"] < base["accuracy"] - tolerance["accuracy"]:
+            problems.append(f"{name}: accuracy {result['accuracy']:.2%} < {base['accuracy']:.2%}")
+        if result["unknown_rate"] > base["unknown_rate"] + tolerance["unknown_rate"]:
+            problems.append(f"{name}: unknown rate {result['unknown_rate']:.2%} > {base['unknown_rate']:.2%}")
+    return problems
+
+def load_baseline(path=BASELINE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_baseline(results, path=BASELINE):
+    baseline = load_baseline(path)
+    baseline.setdefault("classifiers", {}).update(results)
+    baseline["unit"] = "cost = ns per sample / ns per reference_loop() iteration"
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classifiers and check for regressions")
+    parser.add_argument("--classifier", action="append",
+                        help="Registered name or module:function (repeatable, default: all registered)")
+    parser.add_argument("--min-intensity", type=int, default=MIN_INTENSITY)
+    parser.add_argument("--captures", nargs="*", default=[], help="Labelled capture files to add")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    args = parser.parse_args()
+
+    names = build_detect()[1]
+    samples = load_dataset(names=names) + load_captures(args.captures, names)
+    print(f"🎨 {len(samples)} labelled samples")
+
+    baseline = load_baseline(args.baseline)
+    results, problems = {}, []
+    for name in args.classifier or list(CLASSIFIERS):
+        factories = CLASSIFIERS[name] if name in CLASSIFIERS else load_plugin(name)
+        result, misses = measure(factories, samples, args.min_intensity)
+        results[name] = result
+        batch = f", batch {result['batch_ns']} ns/sample" if "batch_ns" in result else ""
+        print(f"\n📊 {name}: {result['ns']} ns/sample ({result['cost']} units){batch}, "
+              f"{result['heap_bytes']:.0f} B heap/call")
+        print(f"   accuracy {result['accuracy']:.2%}, unknown {result['unknown_rate']:.2%}")
+        worst = sorted(misses.items(), key=lambda item: -item[1])[:5]
+        if worst:
+            print("   misses: " + ", ".join(f"{source} as {name} x{n}" for (source, name), n in worst))
+        problems += regressions(name, result, baseline)
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f"\n💾 Baseline updated: {args.baseline}")
+        return
+    if problems:
+        print("\n❌ Regressions:")
+        for problem in problems:
+            print(f"   {problem}")
+        sys.exit(1)
+    print("\n✅ No regressions" if baseline else "\n💡 No baseline yet: run with --update-baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""
+ESP32 Hardware Emulator for Sensory Spectrum
+Runs the sender and receiver firmware unmodified on CPython (Linux/macOS).
+
+Installs stand-ins for the MicroPython modules the firmware imports
+(machine, network, micropython, ujson, esp, esp32, uasyncio) plus the
+MicroPython-only time functions, backed by:
+  - a TCS34725 register-map emulator fed with a scripted scene sequence
+  - a DFPlayer UART sink that decodes command packets and replies
+  - a fake network.WLAN (UDP goes over real localhost sockets)
+  - machine.lightsleep() on the virtual clock, ended early by the
+    esp32.wake_on_ext0/ext1 pins (logged as "sleep" events)
+
+Each device runs in its own process with a temporary directory as its
+flash filesystem, exactly as flash_helper.py lays it out on the board.
+
+Usage:
+  python utils/emulator.py device <fs_dir> [--scene scene.json] [--events ev.jsonl]
+  python utils/emulator.py run tests/test_sensor.py [--scene scene.json]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import runpy
+import shutil
+import socket
+import sys
+import threading
+import time
+import types
+
+# Raw counts at the driver's 50ms / 4x reference setting. The first scene
+# is held long enough for the sender's boot-time white calibration.
+DEFAULT_SCENE = [
+    {"color": "White", "rgb": [1850, 1620, 1780], "hold": 10.0},
+    {"color": "Red", "rgb": [1500, 300, 250], "hold": 5.0},
+    {"color": "Green", "rgb": [300, 1500, 300], "hold": 5.0},
+    {"color": "Blue", "rgb": [250, 400, 1600], "hold": 5.0},
+    {"color": "Yellow", "rgb": [1500, 1300, 250], "hold": 5.0},
+    {"color": "Cyan", "rgb": [250, 1300, 1450], "hold": 5.0},
+    {"color": "Magenta", "rgb": [1500, 300, 1400], "hold": 5.0},
+    {"color": "White", "rgb": [1850, 1620, 1780], "hold": 5.0},
+    {"color": "Black", "rgb": [40, 35, 30], "hold": 5.0},
+]
+
+_REFERENCE_SENSITIVITY = 84  # 50ms (21 cycles) * 4x, as in tcs34725.py
+_GAIN_MULTIPLIER = (1, 4, 16, 60)
+_PERSISTENCE_CYCLES = (1, 1, 2, 3, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60)
+
+# ===== Virtual Clock =====
+class Clock:
+    """Device time, optionally running `speed` times faster than real time.
+
+    The epoch is CLOCK_MONOTONIC (system-wide on Linux), so processes
+    started with the same epoch agree on timestamps.
+    """
+    def __init__(self, speed=1.0, epoch=None):
+        self.speed = speed
+        self.epoch = time.monotonic() if epoch is None else epoch
+
+    def now(self):
+        return (time.monotonic() - self.epoch) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _real_sleep(seconds / self.speed)
+
+_real_sleep = time.sleep
+
+# ===== Event Log =====
+class EventLog:
+    """JSON-lines event log with virtual timestamps"""
+    def __init__(self, clock, path=None):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.file = open(path, "a", buffering=1) if path else None
+
+    def log(self, kind, **fields):
+        if not self.file:
+            return
+        fields["t"] = round(self.clock.now(), 6)
+        fields["event"] = kind
+        with self.lock:
+            self.file.write(json.dumps(fields) + "\n")
+
+# ===== TCS34725 =====
+class TCS34725Emulator:
+    """Register-level TCS34725 model driven by a scene script"""
+    ADDRESS = 0x29
+
+    def __init__(self, clock, events, scene=None, noise=0.02, seed=0, int_pin=4):
+        self.clock = clock
+        self.events = events
+        self.scene = scene or DEFAULT_SCENE
+        self.noise = noise
+        self.rng = random.Random(seed)
+        self.int_pin = int_pin
+        self.regs = bytearray(0x20)
+        self.regs[0x01] = 0xFF
+        self.regs[0x12] = 0x44
+        self.cycle_start = clock.now()
+        self.rgb = self.scene[0]["rgb"]
+        self.aint = False
+        self.out_of_range = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run_scene, daemon=True).start()
+        threading.Thread(target=self._run_cycles, daemon=True).start()
+
+    # --- scene and integration cycle threads ---
+    def _run_scene(self):
+        while True:
+            for step in self.scene:
+                with self.lock:
+                    self.rgb = step["rgb"]
+                self.events.log("scene", color=step.get("color"), rgb=step["rgb"])
+                self.clock.sleep(step["hold"])
+
+    def integration_s(self):
+        return (256 - self.regs[0x01]) * 0.0024
+
+    def wait_s(self):
+        """WEN wait state between cycles (WTIME, 12x with WLONG)"""
+        if not self.regs[0x00] & 0x08:
+            return 0.0
+        return (256 - self.regs[0x03]) * 0.0024 * (12 if self.regs[0x0D] & 0x02 else 1)
+
+    def _run_cycles(self):
+        # Evaluate the clear-channel interrupt once per integration cycle
+        while True:
+            self.clock.sleep(max(self.integration_s() + self.wait_s(), 0.01 * self.clock.speed))
+            with self.lock:
+                enabled = self.regs[0x00] & 0x13 == 0x13  # PON | AEN | AIEN
+                if not enabled or self.aint:
+                    self.out_of_range = 0
+                    continue
+                clear = self._channels()[3]
+                low = self.regs[0x04] | (self.regs[0x05] << 8)
+                high = self.regs[0x06] | (self.regs[0x07] << 8)
+                if clear < low or clear > high:
+                    self.out_of_range += 1
+                else:
+                    self.out_of_range = 0
+                fire = self.out_of_range >= _PERSISTENCE_CYCLES[self.regs[0x0C] & 0x0F]
+                if fire:
+                    self.aint = True
+            if fire:
+                self.events.log("sensor_int")
+                pin = Pin.registry.get(self.int_pin)
+                if pin:
+                    pin._drive(0)
+
+    # --- measurement model ---
+    def _channels(self):
+        atime = self.regs[0x01]
+        sens = (256 - atime) * _GAIN_MULTIPLIER[self.regs[0x0F] & 0x03]
+        full = min(65535, (256 - atime) * 1024)
+        r, g, b = self.rgb
+        out = []
+        for ref in (r, g, b, r + g + b):
+            value = ref * sens / _REFERENCE_SENSITIVITY
+            if self.noise:
+                value *= 1 + self.rng.gauss(0, self.noise)
+            out.append(max(0, min(full, int(value))))
+        return out
+
+    def _read_reg(self, reg):
+        if reg == 0x13:
+            valid = self.regs[0x00] & 0x03 == 0x03 and \
+                self.clock.now() - self.cycle_start >= self.integration_s()
+            return (0x01 if valid else 0) | (0x10 if self.aint else 0)
+        return self.regs[reg]
+
+    # --- I2C interface ---
+    def read(self, command, n):
+        reg = command & 0x1F
+        with self.lock:
+            if reg == 0x14 and n >= 2:
+                self.reads += 1
+                r, g, b, c = self._channels()
+                data = bytes((c & 0xFF, c >> 8, r & 0xFF, r >> 8,
+                              g & 0xFF, g >> 8, b & 0xFF, b >> 8))
+                if n == 8:
+                    self.events.log("read", rgbc=[r, g, b, c])
+                return data[:n]
+            if 0x14 <= reg < 0x1C:
+                r, g, b, c = self._channels()
+                words = (c, r, g, b)[(reg - 0x14) // 2:]
+                data = b"".join(bytes((w & 0xFF, w >> 8)) for w in words)
+                return data[(reg - 0x14) % 2:][:n]
+            return bytes(self._read_reg(reg + i) for i in range(n))
+
+    def write(self, command, data):
+        with self.lock:
+            if command & 0x60 == 0x60:  # special function
+                if command & 0x1F == 0x06:
+                    self.aint = False
+                    self.out_of_range = 0
+                    pin = Pin.registry.get(self.int_pin)
+                    if pin:
+                        pin._drive(1)
+                return
+            reg = command & 0x1F
+            for i, value in enumerate(data):
+                if reg + i == 0x00:
+                    self.cycle_start = self.clock.now()
+                    if value & 0x0B != self.regs[0x00] & 0x0B:  # PON / AEN / WEN
+                        self.events.log("sensor_power", enable=value)
+                self.regs[reg + i] = value
+
+# ===== DFPlayer =====
+class DFPlayerSink:
+    """Decodes DFPlayer Mini packets from the UART and queues replies"""
+
+    def __init__(self, clock, events, clip_seconds=0.8):
+        self.clock = clock
+        self.events = events
+        self.clip_seconds = clip_seconds
+        self.rx = bytearray()
+        self.replies = bytearray()
+        self.lock = threading.Lock()
+        self.playing = None
+        # Power-on: the module reports "online" with the SD card present
+        self.replies += self.packet(0x3F, 0x02)
+
+    @staticmethod
+    def packet(cmd, param=0, feedback=0):
+        body = bytes((0xFF, 0x06, cmd, feedback, (param >> 8) & 0xFF, param & 0xFF))
+        checksum = -sum(body) & 0xFFFF
+        return bytes((0x7E,)) + body + bytes((checksum >> 8, checksum & 0xFF, 0xEF))
+
+    def feed(self, data):
+        self.rx += data
+        while len(self.rx) >= 10:
+            start = self.rx.find(0x7E)
+            if start < 0:
+                self.rx = bytearray()
+                return
+            del self.rx[:start]
+            if len(self.rx) < 10:
+                return
+            pkt = bytes(self.rx[:10])
+            del self.rx[:10]
+            if pkt[9] != 0xEF or (sum(pkt[1:7]) + ((pkt[7] << 8) | pkt[8])) & 0xFFFF:
+                self.events.log("df_bad_packet", raw=pkt.hex())
+                continue
+            self._command(pkt[3], (pkt[5] << 8) | pkt[6])
+
+    def _command(self, cmd, param):
+        self.events.log("df_cmd", cmd=cmd, param=param)
+        if cmd == 0x03:
+            self.events.log("play", track=param)
+            token = object()
+            self.playing = token
+            threading.Thread(target=self._finish, args=(token, param), daemon=True).start()
+        elif cmd in (0x0E, 0x16):
+            self.playing = None
+
+    def _finish(self, token, track):
+        self.clock.sleep(self.clip_seconds)
+        if self.playing is token:
+            self.playing = None
+            with self.lock:
+                self.replies += self.packet(0x3D, track)
+
+    def read(self, n=None):
+        with self.lock:
+            if not self.replies:
+                return None
+            n = len(self.replies) if n is None else n
+            data = bytes(self.replies[:n])
+            del self.replies[:n]
+            return data
+
+    def any(self):
+        with self.lock:
+            return len(self.replies)
+
+# ===== machine =====
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    registry = {}
+
+    def __init__(self, id, mode=None, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 1 if pull == Pin.PULL_UP else (value or 0)
+        self._handler = None
+        self._trigger = 0
+        Pin.registry[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self._handler = handler
+        self._trigger = trigger
+
+    def _drive(self, level):
+        """Drive an input from the emulated hardware side"""
+        old, self._value = self._value, level
+        if self._handler and old != level:
+            edge = Pin.IRQ_FALLING if level == 0 else Pin.IRQ_RISING
+            if self._trigger & edge:
+                self._handler(self)
+
+class I2C:
+    devices = {}
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400000):
+        self.id = id
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def _device(self, addr):
+        try:
+            return self.devices[addr]
+        except KeyError:
+            raise OSError(19, "ENODEV")
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._device(addr).read(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._device(addr).write(memaddr, bytes(buf))
+
+    def writeto(self, addr, buf):
+        buf = bytes(buf)
+        self._device(addr).write(buf[0], buf[1:])
+
+class UART:
+    sink = None
+
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs):
+        self.id = id
+
+    def write(self, buf):
+        if self.sink:
+            self.sink.feed(bytes(buf))
+        return len(buf)
+
+    def read(self, n=None):
+        return self.sink.read(n) if self.sink else None
+
+    def any(self):
+        return self.sink.any() if self.sink else 0
+
+class LightSleep:
+    """machine.lightsleep(): device time passes; a configured wake pin at
+    its level ends the sleep early"""
+    TIMER_WAKE, EXT0_WAKE, EXT1_WAKE = 4, 2, 3
+    STEP = 0.002  # Device seconds between wake pin checks
+
+    def __init__(self, clock, events):
+        self.clock = clock
+        self.events = events
+        self.ext0 = None   # (pin id, level)
+        self.ext1 = ()     # ((pin id, ...), level)
+        self.reason = 0
+
+    def _pin_wake(self):
+        if self.ext0 and self._level(self.ext0[0]) == self.ext0[1]:
+            return self.EXT0_WAKE
+        if self.ext1:
+            pins, any_high = self.ext1
+            levels = [self._level(p) for p in pins]
+            if (any(levels) if any_high else pins and not any(levels)):
+                return self.EXT1_WAKE
+        return None
+
+    @staticmethod
+    def _level(pin_id):
+        pin = Pin.registry.get(pin_id)
+        return pin._value if pin else 1
+
+    def __call__(self, ms=None):
+        start = self.clock.now()
+        end = None if ms is None else start + ms / 1000
+        reason = None
+        while reason is None:
+            reason = self._pin_wake()
+            if reason is None:
+                now = self.clock.now()
+                if end is not None and now >= end:
+                    reason = self.TIMER_WAKE
+                else:
+                    self.clock.sleep(self.STEP if end is None else min(self.STEP, end - now))
+        self.reason = reason
+        self.events.log("sleep", ms=ms, slept=round(self.clock.now() - start, 6), reason=reason)
+
+    def wake_on_ext0(self, pin, level):
+        self.ext0 = None if pin is None else (getattr(pin, "id", pin), 1 if level else 0)
+
+    def wake_on_ext1(self, pins, level):
+        self.ext1 = (tuple(getattr(p, "id", p) for p in pins or ()), bool(level))
+
+# ===== network =====
+class WLAN:
+    PM_NONE, PM_PERFORMANCE, PM_POWERSAVE = 0, 1, 2
+    events = None
+
+    def __init__(self, interface=0):
+        self._active = False
+        self._connected = False
+        self._pm = WLAN.PM_PERFORMANCE
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = state
+
+    def connect(self, ssid=None, password=None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+    def config(self, *args, **kwargs):
+        if "pm" in kwargs:
+            self._pm = kwargs["pm"]
+            if WLAN.events:
+                WLAN.events.log("wifi_pm", pm=self._pm)
+        if args == ("pm",):
+            return self._pm
+        return None
+
+# ===== uasyncio =====
+class ThreadSafeFlag:
+    """uasyncio.ThreadSafeFlag: set() may be called from IRQ handlers
+    (emulator threads here); one waiter, cleared when wait() returns"""
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._loop = None
+        self._pending = False
+
+    def set(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._pending = True
+
+    def clear(self):
+        self._pending = False
+        self._event.clear()
+
+    async def wait(self):
+        self._loop = asyncio.get_running_loop()
+        if self._pending:
+            self._pending = False
+        else:
+            await self._event.wait()
+        self._event.clear()
+
+def make_uasyncio(clock):
+    """asyncio with the MicroPython additions, sleeping on device time"""
+    uasyncio = types.ModuleType("uasyncio")
+    for name in ("run", "gather", "create_task", "Event", "Lock",
+                 "get_event_loop", "CancelledError", "TimeoutError", "current_task"):
+        setattr(uasyncio, name, getattr(asyncio, name))
+    uasyncio.sleep = lambda seconds: asyncio.sleep(seconds / clock.speed)
+    uasyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000 / clock.speed)
+    uasyncio.wait_for = lambda aw, timeout: asyncio.wait_for(
+        aw, None if timeout is None else timeout / clock.speed)
+    uasyncio.wait_for_ms = lambda aw, timeout: uasyncio.wait_for(aw, timeout / 1000)
+    uasyncio.ThreadSafeFlag = ThreadSafeFlag
+    return uasyncio
+
+# ===== Installation =====
+def install(clock, events, scene=None, noise=0.02, seed=0, clip_seconds=0.8, loss=0.0):
+    """Register the stand-in modules and hardware; returns (sensor, dfplayer)"""
+    sensor = TCS34725Emulator(clock, events, scene, noise, seed)
+    dfplayer = DFPlayerSink(clock, events, clip_seconds)
+    I2C.devices = {TCS34725Emulator.ADDRESS: sensor}
+    UART.sink = dfplayer
+
+    machine = types.ModuleType("machine")
+    machine.Pin = Pin
+    machine.I2C = I2C
+    machine.UART = UART
+    machine.unique_id = lambda: b"\x24\x0a\xc4\x00\x00\x01"
+    machine.freq = lambda *args: 240000000
+    machine.reset = lambda: sys.exit(0)
+    machine.reset_cause = lambda: 1  # PWRON_RESET
+    sleeper = LightSleep(clock, events)
+    machine.lightsleep = sleeper
+    machine.wake_reason = lambda: sleeper.reason
+    machine.TIMER_WAKE, machine.EXT0_WAKE, machine.EXT1_WAKE = (
+        LightSleep.TIMER_WAKE, LightSleep.EXT0_WAKE, LightSleep.EXT1_WAKE)
+    machine.PIN_WAKE = LightSleep.EXT0_WAKE
+
+    network = types.ModuleType("network")
+    network.STA_IF = 0
+    network.AP_IF = 1
+    network.WLAN = WLAN
+    WLAN.events = events
+
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda value: value
+    micropython.native = lambda f: f
+    micropython.viper = lambda f: f
+
+    ujson = types.ModuleType("ujson")
+    ujson.load = json.load
+    ujson.loads = json.loads
+    ujson.dump = json.dump
+    ujson.dumps = json.dumps
+
+    esp = types.ModuleType("esp")
+    esp.osdebug = lambda level: None
+
+    esp32 = types.ModuleType("esp32")
+    esp32.WAKEUP_ALL_LOW = False
+    esp32.WAKEUP_ANY_HIGH = True
+    esp32.wake_on_ext0 = sleeper.wake_on_ext0
+    esp32.wake_on_ext1 = sleeper.wake_on_ext1
+
+    for module in (machine, network, micropython, ujson, esp, esp32, make_uasyncio(clock)):
+        sys.modules[module.__name__] = module
+
+    # MicroPython time API on the virtual clock
+    time.sleep = clock.sleep
+    time.sleep_ms = lambda ms: clock.sleep(ms / 1000)
+    time.sleep_us = lambda us: clock.sleep(us / 1000000)
+    time.time = lambda: int(clock.now())
+    time.ticks_ms = lambda: int(clock.now() * 1000) & 0x3FFFFFFF
+    time.ticks_us = lambda: int(clock.now() * 1000000) & 0x3FFFFFFF
+    time.ticks_add = lambda t, delta: (t + delta) & 0x3FFFFFFF
+    time.ticks_diff = lambda a, b: ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+    # MicroPython heap API (the host heap has no fixed size)
+    gc.mem_free = lambda: 100000
+    gc.mem_alloc = lambda: 0
+
+    # Lossy Wi-Fi: drop a fraction of outgoing datagrams
+    if loss:
+        rng = random.Random(seed + 1)
+        sendto = socket.socket.sendto
+
+        def lossy_sendto(self, data, *args):
+            if rng.random() < loss:
+                events.log("udp_drop", size=len(data))
+                return len(data)
+            return sendto(self, data, *args)
+        socket.socket.sendto = lossy_sendto
+
+    # Socket timeouts are device time too
+    if clock.speed != 1.0:
+        settimeout = socket.socket.settimeout
+        socket.socket.settimeout = lambda self, t: settimeout(
+            self, None if t is None else t / clock.speed)
+
+    return sensor, dfplayer
+
+def prepare_fs(fs_dir, role, config_overrides=None):
+    """Lay out a device filesystem the way flash_helper.py uploads it"""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    src = os.path.join(root, role)
+    os.makedirs(fs_dir, exist_ok=True)
+    for directory in (src, os.path.join(root, "common")):
+        for name in os.listdir(directory):
+            if name.endswith((".py", ".json", ".bin")):
+                shutil.copy(os.path.join(directory, name), fs_dir)
+    with open(os.path.join(fs_dir, "main.py"), "w") as f:
+        f.write(f"import {role}\n")  # Same stub flash_helper.py deploys
+    if config_overrides:
+        path = os.path.join(fs_dir, "config.json")
+        with open(path) as f:
+            config = json.load(f)
+        for section, values in config_overrides.items():
+            config.setdefault(section, {}).update(values)
+        with open(path, "w") as f:
+            json.dump(config, f, indent=4)
+
+def load_scene(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run firmware on emulated ESP32 hardware")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    device = sub.add_parser("device", help="Boot a device filesystem (boot.py, then main.py)")
+    device.add_argument("fs", help="Device filesystem directory (see prepare_fs)")
+    run = sub.add_parser("run", help="Run a single script against emulated hardware")
+    run.add_argument("script")
+    for p in (device, run):
+        p.add_argument("--scene", help="Scene script JSON (default: built-in color cycle)")
+        p.add_argument("--events", help="Write JSON-lines events here")
+        p.add_argument("--speed", type=float, default=1.0, help="Device time speed-up")
+        p.add_argument("--epoch", type=float, help="Shared CLOCK_MONOTONIC epoch")
+        p.add_argument("--noise", type=float, default=0.02, help="Relative sensor noise")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--loss", type=float, default=0.0, help="Outgoing UDP drop rate")
+    args = parser.parse_args()
+
+    clock = Clock(args.speed, args.epoch)
+    events = EventLog(clock, args.events and os.path.abspath(args.events))
+    scene = load_scene(args.scene)
+    install(clock, events, scene, args.noise, args.seed, loss=args.loss)
+
+    if args.mode == "run":
+        script = os.path.abspath(args.script)
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        sys.path[:0] = [os.path.join(root, "sender"), os.path.join(root, "common")]
+        sys.argv = [script]
+        runpy.run_path(script, run_name="__main__")
+        return
+
+    os.chdir(args.fs)
+    sys.path.insert(0, os.getcwd())
+    events.log("boot")
+    if os.path.exists("boot.py"):
+        runpy.run_path("boot.py", run_name="__main__")
+    runpy.run_path("main.py", run_name="__main__")
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,384 @@
 """
 ESP32 Flash Helper for Sensory Spectrum
 Automates flashing MicroPython and uploading code files
+
+Usage:
+  python utils/flash_helper.py --sender-port COM3 --receiver-port COM4
+  python utils/flash_helper.py --ports /dev/ttyUSB0 /dev/ttyUSB1:receiver --role sender
+  python utils/flash_helper.py --manifest fleet.json --retries 2
+  python utils/flash_helper.py --ports COM3 --skip-flash        # code update only
+
+A manifest lists the devices to provision:
+  [{"port": "/dev/ttyUSB0", "role": "sender"},
+   {"port": "/dev/ttyUSB1", "role": "receiver"}]
+
+Devices are provisioned in parallel (one worker per device by default),
+so a batch takes about as long as its slowest unit.
+
+Uploads are incremental: each device keeps a hash manifest (deploy.json)
+and only changed files are written, over one raw-REPL session. With
+mpy-cross on PATH, modules are uploaded precompiled as .mpy; --force
+rewrites everything.
 """
 
 import subprocess
 import sys
 import argparse
+import base64
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from ampy.pyboard import Pyboard, PyboardError
+except ImportError:  # Only needed for uploads; checked in RawReplSession
+    Pyboard = None
+    PyboardError = OSError
+
+# Shared modules uploaded to both units
+COMMON_FILES = ["protocol.py", "reliable.py", "aqueue.py", "stats.py"]
 
-def run_command(cmd, check=True):
-    """Run shell command and print output"""
-    print(f"$ {' '.join(cmd)}")
-    result = subprocess.run(cmd, shell=False, capture_output=True, text=True)
+SENDER_FILES = ["boot.py", "config.json", "sender.py", "tcs34725.py",
+                "color_lut.py", "color_filter.py", "lut_default.bin", "lut_low_light.bin",
+                "palette.py", "palette.bin", "discovery.py", "calibration.py",
+                "classifier.py", "capture.py", "power.py"]
+RECEIVER_FILES = ["boot.py", "config.json", "receiver.py", "dfplayer.py",
+                  "scheduler.py"]
+ROLES = ("sender", "receiver")
+
+_print_lock = threading.Lock()
+
+class FlashError(Exception):
+    """A flashing or upload step failed on one device"""
+
+def device_logger(port):
+    """print() with a [port] prefix that keeps parallel output line-atomic"""
+    def log(message):
+        with _print_lock:
+            for line in str(message).splitlines() or [""]:
+                print(f"[{port}] {line}")
+    return log
+
+def run_command(cmd, check=True, log=print, verbose=True):
+    """Run command and print output; raises FlashError when it fails"""
+    log(f"$ {' '.join(cmd)}")
+    try:
+        result = subprocess.run(cmd, shell=False, capture_output=True, text=True)
+    except OSError as e:  # Tool missing or not executable
+        raise FlashError(f"{cmd[0]}: {e}")
     if check and result.returncode != 0:
-        print(f"❌ Error: {result.stderr}")
-        sys.exit(1)
-    print(result.stdout)
+        raise FlashError((result.stderr or result.stdout).strip() or
+                         f"{cmd[0]} exited with {result.returncode}")
+    if verbose and result.stdout.strip():
+        log(result.stdout.rstrip())
     return result
 
-def flash_esp32(port, firmware_path="micropython-esp32.bin"):
+def run_step(cmd, retries=0, log=print, verbose=True):
+    """run_command with up to `retries` extra attempts; returns attempts used"""
+    for attempt in range(retries + 1):
+        try:
+            run_command(cmd, log=log, verbose=verbose)
+            return attempt + 1
+        except FlashError as e:
+            if attempt == retries:
+                raise
+            log(f"⚠️ Attempt {attempt + 1} failed ({e}), retrying...")
+            time.sleep(1)
+
+def flash_esp32(port, firmware_path="micropython-esp32.bin", retries=0, log=print, verbose=True):
     """Flash MicroPython firmware"""
-    print(f"🔥 Flashing {port}...")
-    run_command(["esptool.py", "--port", port, "erase_flash"])
-    run_command([
-        "esptool.py", "--port", port, "--baud", "460800", 
+    log(f"🔥 Flashing {port}...")
+    attempts = run_step(["esptool.py", "--port", port, "erase_flash"], retries, log, verbose)
+    attempts += run_step([
+        "esptool.py", "--port", port, "--baud", "460800",
         "write_flash", "-z", "0x1000", firmware_path
-    ])
-    print("✅ Firmware flashed!")
+    ], retries, log, verbose)
+    log("✅ Firmware flashed!")
+    return attempts - 2
+
+# ===== Incremental deploy =====
+# Each device keeps deploy.json: device file name -> content hash of what
+# was uploaded. A deploy reads it back over one raw-REPL session and only
+# writes files whose hash changed. main.py is a one-line stub importing
+# the role's module, so the application is uploaded once and, with
+# mpy-cross, runs from precompiled .mpy (no compile at boot).
+MANIFEST_FILE = "deploy.json"
+SOURCE_ONLY = ("boot.py", "main.py")  # Run as source by the firmware
+CHUNK = 512  # Bytes per raw-REPL write
+
+def role_files(role):
+    """(local path, device name) pairs for a role, main.py stub excluded"""
+    files = [(f"{role}/{name}", name) for name in (SENDER_FILES if role == "sender" else RECEIVER_FILES)]
+    files += [(f"common/{name}", name) for name in COMMON_FILES]
+    return files
+
+def find_mpy_cross(path=None):
+    """mpy-cross executable, or None to upload .py sources"""
+    return path or shutil.which("mpy-cross")
+
+def compile_mpy(path, mpy_cross, march="xtensawin"):
+    """Precompile one module; returns the .mpy bytes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.mpy")
+        run_command([mpy_cross, f"-march={march}", "-o", out, path], log=lambda m: None)
+        with open(out, "rb") as f:
+            return f.read()
+
+def build_plan(role, mpy_cross=None, march="xtensawin"):
+    """Device file name -> contents for a role (modules as .mpy when mpy_cross is given)"""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    plan = {}
+    for path, name in role_files(role):
+        path = os.path.join(root, path)
+        if mpy_cross and name.endswith(".py") and name not in SOURCE_ONLY:
+            plan[name[:-3] + ".mpy"] = compile_mpy(path, mpy_cross, march)
+        else:
+            with open(path, "rb") as f:
+                plan[name] = f.read()
+    plan["main.py"] = f"import {role}\n".encode()
+    return plan
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+class RawReplSession:
+    """One raw-REPL connection for reading, writing and removing files"""
+
+    def __init__(self, port, baudrate=115200):
+        if Pyboard is None:
+            raise FlashError("Deploy needs ampy's pyboard module: pip install adafruit-ampy")
+        self.port = port
+        self.baudrate = baudrate
+        self.pyb = None
+
+    def __enter__(self):
+        self.pyb = Pyboard(self.port, baudrate=self.baudrate)
+        self.pyb.enter_raw_repl()
+        self.pyb.exec_("import os\nfrom ubinascii import a2b_base64 as _d")
+        return self
 
-def upload_sender(port):
+    def __exit__(self, *exc):
+        try:
+            self.pyb.exit_raw_repl()
+        finally:
+            self.pyb.close()
+
+    def read_text(self, name):
+        """File contents as text, or None when it does not exist"""
+        out = self.pyb.exec_(f"try:\n with open({name!r}) as f: print(f.read())\n"
+                             f"except OSError: print('\\x00')")
+        text = out.decode().rstrip("\r\n")
+        return None if text == "\x00" else text
+
+    def write(self, name, data):
+        self.pyb.exec_(f"f = open({name!r}, 'wb')")
+        for i in range(0, len(data), CHUNK):
+            chunk = base64.b64encode(data[i:i + CHUNK]).decode()
+            self.pyb.exec_(f"f.write(_d({chunk!r}))")
+        self.pyb.exec_("f.close()")
+
+    def remove(self, name):
+        self.pyb.exec_(f"try:\n os.remove({name!r})\nexcept OSError: pass")
+
+def deploy(port, role, mpy_cross=None, march="xtensawin", force=False, log=print, session=None,
+           plan=None):
+    """Upload only the files whose hash differs from the device's manifest
+    (plan: build_plan() output to reuse, None = build it here)"""
+    if plan is None:
+        plan = build_plan(role, mpy_cross, march)
+    hashes = {name: file_hash(data) for name, data in plan.items()}
+
+    log(f"📤 Deploying {role} to {port}{' (.mpy)' if mpy_cross else ''}...")
+    with session or RawReplSession(port) as dev:
+        remote = {}
+        text = None if force else dev.read_text(MANIFEST_FILE)
+        if text:
+            try:
+                remote = json.loads(text)
+            except ValueError:
+                log("⚠️ Unreadable device manifest, uploading everything")
+        changed = [name for name in plan if remote.get(name) != hashes[name]]
+        # A leftover .py shadows its .mpy on import, so drop the other form too
+        stale = [name for name in remote if name not in plan]
+        for name in changed:
+            if name.endswith(".mpy"):
+                stale.append(name[:-4] + ".py")
+            elif name.endswith(".py") and name not in SOURCE_ONLY:
+                stale.append(name[:-3] + ".mpy")
+
+        stale = sorted(set(stale))
+        stale_remote = [name for name in stale if name in remote]
+        for name in stale:
+            dev.remove(name)
+        for i, name in enumerate(changed, 1):
+            log(f"   {i}/{len(changed)} {name} ({len(plan[name])} bytes)")
+            dev.write(name, plan[name])
+        # Written last: an interrupted deploy is simply resumed next time
+        if changed or stale_remote or remote.keys() != hashes.keys():
+            dev.write(MANIFEST_FILE, json.dumps(hashes).encode())
+
+    sent = sum(len(plan[name]) for name in changed)
+    log(f"✅ {role.capitalize()}: {len(changed)} changed, {len(plan) - len(changed)} unchanged, "
+        f"{len(stale_remote)} removed ({sent} bytes sent)")
+    return len(changed)
+
+def upload_sender(port, **kwargs):
     """Upload sender files"""
-    print(f"📤 Uploading sender to {port}...")
-    for filename in ["boot.py", "config.json", "sender.py", "tcs34725.py"]:
-        run_command(["ampy", "--port", port, "put", f"sender/{filename}"])
-    run_command(["ampy", "--port", port, "put", "sender/sender.py", "main.py"])
-    print("✅ Sender uploaded!")
+    return deploy(port, "sender", **kwargs)
 
-def upload_receiver(port):
+def upload_receiver(port, **kwargs):
     """Upload receiver files"""
-    print(f"📤 Uploading receiver to {port}...")
-    for filename in ["boot.py", "config.json", "receiver.py"]:
-        run_command(["ampy", "--port", port, "put", f"receiver/{filename}"])
-    run_command(["ampy", "--port", port, "put", "receiver/receiver.py", "main.py"])
-    print("✅ Receiver uploaded!")
+    return deploy(port, "receiver", **kwargs)
+
+def deploy_step(port, role, retries=0, log=print, **options):
+    """deploy() with up to `retries` extra attempts; returns retries used"""
+    for attempt in range(retries + 1):
+        try:
+            deploy(port, role, log=log, **options)
+            return attempt
+        except (FlashError, PyboardError, OSError) as e:
+            if attempt == retries:
+                raise FlashError(f"Upload failed: {e}")
+            log(f"⚠️ Upload attempt {attempt + 1} failed ({e}), retrying...")
+            time.sleep(1)
+
+def provision(device, firmware, skip_flash=False, retries=1, verbose=False, deploy_options=None,
+              plan=None):
+    """Flash and upload one device; returns a result dict (never raises)
+    (plan: the role's build_plan(), shared by every device and retry)"""
+    port, role = device["port"], device["role"]
+    log = device_logger(port)
+    result = {"port": port, "role": role, "ok": False, "retries": 0, "error": None}
+    start = time.monotonic()
+    try:
+        if not skip_flash:
+            result["retries"] += flash_esp32(port, firmware, retries, log, verbose)
+        result["retries"] += deploy_step(port, role, retries, log, plan=plan, **(deploy_options or {}))
+        result["ok"] = True
+    except FlashError as e:
+        result["error"] = str(e).splitlines()[-1]
+        log(f"❌ Failed: {result['error']}")
+    result["seconds"] = time.monotonic() - start
+    return result
+
+def parse_ports(ports, default_role):
+    """["COM3", "/dev/ttyUSB1:receiver"] -> device dicts"""
+    devices = []
+    for spec in ports:
+        port, role = spec, default_role
+        head, sep, tail = spec.rpartition(":")
+        if sep and tail in ROLES:
+            port, role = head, tail
+        devices.append({"port": port, "role": role})
+    return devices
+
+def load_manifest(path):
+    with open(path) as f:
+        devices = json.load(f)
+    if isinstance(devices, dict):
+        devices = [{"port": port, "role": role} for port, role in devices.items()]
+    return devices
+
+def print_summary(results, elapsed):
+    print("\n📋 Fleet summary")
+    print("=" * 60)
+    for r in results:
+        status = "✅" if r["ok"] else "❌"
+        line = f"{status} {r['port']:<16} {r['role']:<9} {r['seconds']:6.1f}s  retries={r['retries']}"
+        if r["error"]:
+            line += f"  {r['error']}"
+        print(line)
+    ok = sum(r["ok"] for r in results)
+    serial = sum(r["seconds"] for r in results)
+    print("=" * 60)
+    print(f"{ok}/{len(results)} devices provisioned in {elapsed:.1f}s "
+          f"(sequential would take ~{serial:.1f}s)")
+
+def provision_fleet(devices, firmware, workers=None, skip_flash=False, retries=1, verbose=False,
+                    deploy_options=None):
+    """Provision devices in parallel; returns results in input order"""
+    for device in devices:
+        if device["role"] not in ROLES:
+            raise ValueError(f"{device['port']}: unknown role {device['role']!r}")
+    ports = [d["port"] for d in devices]
+    if len(set(ports)) != len(ports):
+        raise ValueError("A port is listed twice")
+
+    # The files (and .mpy compiles) are the same for every device of a role
+    options = dict(deploy_options or {})
+    plans, build_errors = {}, {}
+    for role in sorted({d["role"] for d in devices}):
+        try:
+            plans[role] = build_plan(role, options.get("mpy_cross"), options.get("march", "xtensawin"))
+        except FlashError as e:
+            build_errors[role] = f"Build failed: {str(e).splitlines()[-1]}"
+            print(f"❌ {role}: {build_errors[role]}")
+
+    def run(device):
+        if device["role"] in build_errors:
+            return {"port": device["port"], "role": device["role"], "ok": False, "retries": 0,
+                    "error": build_errors[device["role"]], "seconds": 0.0}
+        return provision(device, firmware, skip_flash, retries, verbose, options, plans[device["role"]])
+
+    print(f"🚀 Provisioning {len(devices)} device(s) with {workers or len(devices)} worker(s)...")
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers or len(devices)) as pool:
+        results = list(pool.map(run, devices))
+    print_summary(results, time.monotonic() - start)
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Sensory Spectrum Flash Helper")
-    parser.add_argument("--sender-port", required=True, help="Sender ESP32 port (COM3)")
-    parser.add_argument("--receiver-port", required=True, help="Receiver ESP32 port (COM4)")
+    parser.add_argument("--sender-port", help="Sender ESP32 port (COM3)")
+    parser.add_argument("--receiver-port", help="Receiver ESP32 port (COM4)")
+    parser.add_argument("--ports", nargs="+", metavar="PORT[:ROLE]",
+                        help="Any number of ports; role suffix overrides --role")
+    parser.add_argument("--role", choices=ROLES, default="sender", help="Role for --ports")
+    parser.add_argument("--manifest", help="JSON list of {port, role} to provision")
     parser.add_argument("--firmware", default="micropython-esp32.bin", help="MicroPython firmware")
+    parser.add_argument("--workers", type=int, help="Parallel devices (default: all)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts per step")
+    parser.add_argument("--skip-flash", action="store_true", help="Only upload files")
+    parser.add_argument("--force", action="store_true", help="Upload every file, ignoring deploy.json")
+    parser.add_argument("--no-mpy", action="store_true", help="Upload .py sources even with mpy-cross")
+    parser.add_argument("--mpy-cross", help="mpy-cross executable (default: from PATH)")
+    parser.add_argument("--march", default="xtensawin", help="mpy-cross target architecture")
+    parser.add_argument("--verbose", action="store_true", help="Show tool output")
     args = parser.parse_args()
 
-    # Flash both ESP32s
-    flash_esp32(args.sender_port, args.firmware)
-    flash_esp32(args.receiver_port, args.firmware)
+    devices = []
+    if args.sender_port:
+        devices.append({"port": args.sender_port, "role": "sender"})
+    if args.receiver_port:
+        devices.append({"port": args.receiver_port, "role": "receiver"})
+    if args.ports:
+        devices += parse_ports(args.ports, args.role)
+    if args.manifest:
+        devices += load_manifest(args.manifest)
+    if not devices:
+        parser.error("give --sender-port/--receiver-port, --ports or --manifest")
 
-    # Upload code
-    upload_sender(args.sender_port)
-    upload_receiver(args.receiver_port)
+    mpy_cross = None if args.no_mpy else find_mpy_cross(args.mpy_cross)
+    if mpy_cross is None and not args.no_mpy:
+        print("💡 mpy-cross not found: uploading .py sources (pip install mpy-cross)")
+    options = {"mpy_cross": mpy_cross, "march": args.march, "force": args.force}
+
+    try:
+        results = provision_fleet(devices, args.firmware, args.workers, args.skip_flash,
+                                  args.retries, args.verbose, options)
+    except ValueError as e:
+        parser.error(str(e))
+    if not all(r["ok"] for r in results):
+        sys.exit(1)
 
     print("\n🎉 Flash complete!")
     print(f"💡 Next: Update config.json WiFi settings")
-    print("💡 Boot receiver first to get IP address")
+    print("💡 Receivers are found automatically (receiver_ip \"auto\")")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,238 @@
+"""
+End-to-end Latency Benchmark for Sensory Spectrum
+Boots the receiver and sender firmware on the CPython emulator
+(utils/emulator.py), plays a scripted color sequence into the sensor and
+reports color-change-to-df_play latency percentiles and loop throughput.
+
+Usage:
+  python utils/latency_bench.py                      # built-in scene, real time
+  python utils/latency_bench.py --speed 5 --json out.json
+  python utils/latency_bench.py --scene my_scene.json --sample-delay 0.2
+  python utils/latency_bench.py --loss 0.3          # lossy Wi-Fi
+  python utils/latency_bench.py --power low --idle-after 2
+
+Times are device time. With --speed > 1 the firmware's sleeps shrink but
+CPython compute does not, so use the same speed when comparing runs.
+
+With --power low the sender runs its duty cycling (power.py) and the
+report adds the share of time awake, wake latency (end of a light sleep
+to the next sensor read) and an average current estimated from
+--awake-ma / --sleep-ma. CPython is slower than the ESP32 and its compute
+counts as awake time, so the duty cycle measured here is an upper bound.
+"""
+
+import argparse
+import bisect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import emulator
+
+UDP_PORT = 42100  # Away from the real 4210 so a bench run never talks to hardware
+# Typical ESP32 currents: awake with Wi-Fi in modem sleep at 240 MHz, and
+# light sleep (datasheet figures; Wi-Fi beacon wake-ups not included)
+AWAKE_MA = 50.0
+SLEEP_MA = 0.8
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+def load_events(path):
+    events = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass  # Last line may be cut off when the process is killed
+    return events
+
+def analyse(sender_events, receiver_events, track_map):
+    """Match each scene change to the first play of its track before the next change"""
+    scenes = [e for e in sender_events if e["event"] == "scene"]
+    plays = [e for e in receiver_events if e["event"] == "play"]
+    reads = [e for e in sender_events if e["event"] == "read"]
+
+    latencies, missed = [], []
+    # The first scene is the calibration target, not an announcement
+    for i in range(1, len(scenes)):
+        scene = scenes[i]
+        if scene["color"] == scenes[i - 1]["color"]:
+            continue
+        end = scenes[i + 1]["t"] if i + 1 < len(scenes) else float("inf")
+        track = track_map.get(scene["color"])
+        hit = next((p for p in plays if p["track"] == track and scene["t"] <= p["t"] < end), None)
+        if hit:
+            latencies.append(hit["t"] - scene["t"])
+        else:
+            missed.append(scene["color"])
+
+    report = {
+        "changes": len(latencies) + len(missed),
+        "announced": len(latencies),
+        "missed": missed,
+        "plays": len(plays),
+        "sensor_reads": len(reads),
+    }
+    if len(reads) > 1:
+        report["reads_per_s"] = (len(reads) - 1) / (reads[-1]["t"] - reads[0]["t"])
+    sleeps = [e for e in sender_events if e["event"] == "sleep"]
+    if len(scenes) > 1 and sender_events:
+        report["power"] = analyse_power(sleeps, reads, scenes[1]["t"], sender_events[-1]["t"])
+    if latencies:
+        report["latency_ms"] = {
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+            "mean": sum(latencies) / len(latencies) * 1000,
+        }
+    return report
+
+def analyse_power(sleeps, reads, start, end):
+    """Share of [start, end] awake (not in light sleep) and wake latencies,
+    timed as power.PowerManager does: from the end of the last sleep before
+    each read"""
+    sleeps = [s for s in sleeps if start <= s["t"] <= end]
+    slept = sum(min(s["slept"], s["t"] - start) for s in sleeps)
+    read_times = [r["t"] for r in reads]
+    wakes = []
+    for i, sleep in enumerate(sleeps):
+        k = bisect.bisect_left(read_times, sleep["t"])
+        if k < len(read_times) and (i + 1 == len(sleeps) or sleeps[i + 1]["t"] > read_times[k]):
+            wakes.append(read_times[k] - sleep["t"])  # This wake ends with a read
+    span = end - start
+    power = {"awake": 1 - slept / span if span > 0 else 1.0, "sleeps": len(sleeps)}
+    if wakes:
+        power["wake_ms"] = {"p50": percentile(wakes, 50) * 1000, "p90": percentile(wakes, 90) * 1000,
+                            "max": max(wakes) * 1000}
+    return power
+
+def wait_for(path, text, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            with open(path, errors="replace") as f:
+                if text in f.read():
+                    return True
+        time.sleep(0.05)
+    return False
+
+def run_bench(scene, speed=1.0, sample_delay=None, noise=0.02, seed=0, workdir=None, loss=0.0,
+              power=None, int_pin=False):
+    """Run both firmwares through one pass of the scene; returns the report.
+    power: the sender's "power" config section (None = always awake)"""
+    workdir = workdir or tempfile.mkdtemp(prefix="ss_bench_")
+    here = os.path.dirname(os.path.abspath(__file__))
+    scene_path = os.path.join(workdir, "scene.json")
+    with open(scene_path, "w") as f:
+        json.dump(scene, f)
+
+    sensor = {}
+    if int_pin:
+        sensor["int_pin"] = 4  # The emulated INT line
+    if sample_delay is not None:
+        sensor["sample_delay"] = sample_delay
+    emulator.prepare_fs(os.path.join(workdir, "receiver"), "receiver",
+                        {"network": {"udp_port": UDP_PORT}})
+    overrides = {"network": {"receiver_ip": "127.0.0.1", "udp_port": UDP_PORT},
+                 "sensor": sensor}
+    if power:
+        overrides["power"] = power
+    emulator.prepare_fs(os.path.join(workdir, "sender"), "sender", overrides)
+    with open(os.path.join(workdir, "receiver", "config.json")) as f:
+        track_map = json.load(f)["audio"]["track_map"]
+
+    epoch = time.monotonic()
+    procs = []
+    try:
+        for role in ("receiver", "sender"):
+            log = open(os.path.join(workdir, f"{role}.log"), "w")
+            cmd = [sys.executable, os.path.join(here, "emulator.py"), "device",
+                   os.path.join(workdir, role),
+                   "--events", os.path.join(workdir, f"{role}.jsonl"),
+                   "--scene", scene_path, "--speed", str(speed), "--epoch", str(epoch),
+                   "--noise", str(noise), "--seed", str(seed), "--loss", str(loss)]
+            procs.append(subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT))
+            if role == "receiver" and not wait_for(log.name, "Listening on UDP port", 30):
+                raise RuntimeError(f"Receiver did not start, see {log.name}")
+
+        # One pass of the scene, plus time for the last announcement
+        duration = sum(step["hold"] for step in scene) / speed + 1.0
+        time.sleep(duration)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+    report = analyse(load_events(os.path.join(workdir, "sender.jsonl")),
+                     load_events(os.path.join(workdir, "receiver.jsonl")),
+                     track_map)
+    report["workdir"] = workdir
+    return report
+
+def print_report(report, awake_ma=AWAKE_MA, sleep_ma=SLEEP_MA):
+    print("\n📊 Latency benchmark")
+    print("=" * 40)
+    print(f"Color changes:  {report['changes']}")
+    print(f"Announced:      {report['announced']}")
+    if report["missed"]:
+        print(f"Missed:         {', '.join(report['missed'])}")
+    print(f"Plays:          {report['plays']}")
+    if "reads_per_s" in report:
+        print(f"Loop rate:      {report['reads_per_s']:.2f} reads/s")
+    if "latency_ms" in report:
+        lat = report["latency_ms"]
+        print(f"Latency (ms):   p50={lat['p50']:.0f} p90={lat['p90']:.0f} "
+              f"p99={lat['p99']:.0f} max={lat['max']:.0f}")
+    power = report.get("power")
+    if power and power["sleeps"]:
+        current = power["awake"] * awake_ma + (1 - power["awake"]) * sleep_ma
+        print(f"Awake:          {power['awake']:.1%} ({power['sleeps']} light sleeps)")
+        if "wake_ms" in power:
+            wake = power["wake_ms"]
+            print(f"Wake (ms):      p50={wake['p50']:.0f} p90={wake['p90']:.0f} max={wake['max']:.0f}")
+        print(f"Est. current:   {current:.1f} mA (always awake: {awake_ma:.1f} mA, "
+              f"{awake_ma / current:.1f}x less)")
+    print(f"Logs:           {report['workdir']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulated end-to-end latency benchmark")
+    parser.add_argument("--scene", help="Scene script JSON (default: built-in color cycle)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Device time speed-up")
+    parser.add_argument("--sample-delay", type=float, help="Override sensor.sample_delay")
+    parser.add_argument("--noise", type=float, default=0.02, help="Relative sensor noise")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--loss", type=float, default=0.0, help="UDP drop rate on both units")
+    parser.add_argument("--power", choices=("full", "low"), default="full",
+                        help="Sender power mode (low = duty cycling, see power.py)")
+    parser.add_argument("--idle-after", type=float, default=2.0, help="low: seconds to idle")
+    parser.add_argument("--idle-delay", type=float, default=1.0, help="low: idle sleep seconds")
+    parser.add_argument("--int-pin", action="store_true", help="Sample on the sensor INT line")
+    parser.add_argument("--awake-ma", type=float, default=AWAKE_MA)
+    parser.add_argument("--sleep-ma", type=float, default=SLEEP_MA)
+    parser.add_argument("--json", help="Also write the report here")
+    args = parser.parse_args()
+
+    scene = emulator.load_scene(args.scene) or emulator.DEFAULT_SCENE
+    power = None
+    if args.power == "low":
+        power = {"mode": "low", "idle_after": args.idle_after, "idle_delay": args.idle_delay}
+    report = run_bench(scene, args.speed, args.sample_delay, args.noise, args.seed,
+                       loss=args.loss, power=power, int_pin=args.int_pin)
+    print_report(report, args.awake_ma, args.sleep_ma)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Color LUT Generator for Sensory Spectrum
+Compiles the color_profiles in config/calibration_data.json into the
+lookup tables the sender loads at runtime (lut_<profile>.bin)
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from color_lut import ColorLUT, DEFAULT_LEVELS  # noqa: E402
+
+def load_profiles(path="config/calibration_data.json"):
+    """Return the color_profiles dict from a calibration file"""
+    with open(path, "r") as f:
+        return json.load(f)["color_profiles"]
+
+def generate_luts(profiles, out_dir="sender", levels=DEFAULT_LEVELS):
+    """Compile every profile and write lut_<name>.bin; returns the paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, profile in profiles.items():
+        lut = ColorLUT.from_profile(profile, levels)
+        path = os.path.join(out_dir, f"lut_{name}.bin")
+        lut.save(path)
+        print(f"✅ {path} ({len(lut.table)} bytes, {levels}x{levels} cells)")
+        written.append(path)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile color profiles into lookup tables")
+    parser.add_argument("--calibration", default="config/calibration_data.json",
+                        help="Calibration file with color_profiles")
+    parser.add_argument("--profile", action="append",
+                        help="Profile to compile (repeatable, default: all)")
+    parser.add_argument("--levels", type=int, default=DEFAULT_LEVELS,
+                        help="Quantization levels per axis")
+    parser.add_argument("--out", default="sender", help="Output directory")
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.calibration)
+    if args.profile:
+        missing = [p for p in args.profile if p not in profiles]
+        if missing:
+            print(f"❌ Unknown profile(s): {', '.join(missing)}")
+            sys.exit(1)
+        profiles = {p: profiles[p] for p in args.profile}
+
+    generate_luts(profiles, args.out, args.levels)
+    print("💡 Upload the .bin files with the sender code (flash_helper.py does this)")
+
+if __name__ == "__main__":
+    main()
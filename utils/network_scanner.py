@@ -1,45 +1,115 @@
 """
 Network Scanner for Sensory Spectrum
-Finds ESP32 devices on local network by hostname
+Finds receivers on the local network with the discovery probe from
+common/protocol.py: one broadcast plus a unicast probe to every host of
+the subnet, sent at once and answered within a single timeout. Needs no
+root, ARP sweep or scapy.
+
+Usage:
+  python utils/network_scanner.py                          # local /24, port 4210
+  python utils/network_scanner.py --subnet 192.168.4.0/24 --timeout 1.5
+  python utils/network_scanner.py --ping 192.168.4.2
 """
 
+import argparse
+import asyncio
+import ipaddress
+import os
+import random
 import socket
 import subprocess
-import time
-from scapy.all import ARP, Ether, srp  # Requires: pip install scapy
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import protocol  # noqa: E402
+
+UDP_PORT = 4210
+HOST_ID = 0  # Sender ID used in probes from this tool
+
+def local_subnet(prefix=24):
+    """Subnet of the interface that routes to the internet, e.g. 192.168.1.0/24,
+    or None without a default route (e.g. on the ESP32's own access point)"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))  # Picks the route; sends nothing
+            ip = s.getsockname()[0]
+    except OSError:
+        return None
+    return ipaddress.ip_network(f"{ip}/{prefix}", strict=False)
+
+def capability_names(capabilities):
+    names = [name for bit, name in ((protocol.CAP_BINARY, "binary"), (protocol.CAP_TEXT, "text"),
+                                    (protocol.CAP_AUDIO, "audio")) if capabilities & bit]
+    return ", ".join(names) or "none"
 
-def scan_network(interface="wlan0"):
-    """Scan local network for devices"""
-    print("🔍 Scanning local network...")
+class _Collector(asyncio.DatagramProtocol):
+    def __init__(self, nonce):
+        self.nonce = nonce
+        self.found = {}
 
-    # Get local IP range
-    result = subprocess.run(["ip", "route"], capture_output=True, text=True)
-    gateway = result.stdout.split("default via ")[1].split(" ")[0]
-    ip_range = ".".join(gateway.split(".")[:-1]) + ".1/24"
+    def datagram_received(self, data, addr):
+        answer = protocol.unpack_announce(data)
+        if answer and answer[1] == self.nonce:
+            receiver_id, _, capabilities, tracks = answer
+            self.found[addr[0]] = {"ip": addr[0], "id": receiver_id,
+                                   "capabilities": capabilities, "tracks": tracks}
 
-    print(f"Scanning {ip_range}...")
+    def error_received(self, exc):
+        pass  # ICMP unreachable from hosts without a receiver
 
-    # ARP scan
-    arp = ARP(pdst=ip_range)
-    ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-    packet = ether/arp
+async def probe(network, port=UDP_PORT, timeout=1.0):
+    """Probe every host of network at once; returns receivers answering within timeout"""
+    loop = asyncio.get_running_loop()
+    nonce = random.randrange(0x10000)
+    transport, collector = await loop.create_datagram_endpoint(
+        lambda: _Collector(nonce), local_addr=("0.0.0.0", 0), allow_broadcast=True)
+    packet = bytes(protocol.pack_discover(bytearray(protocol.DISCOVER_SIZE), HOST_ID, nonce))
+    try:
+        for target in [str(network.broadcast_address)] + [str(h) for h in network.hosts()]:
+            try:
+                transport.sendto(packet, (target, port))
+            except OSError:
+                pass  # Unroutable host or broadcast refused: the rest still go out
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+    return sorted(collector.found.values(), key=lambda r: ipaddress.ip_address(r["ip"]))
 
-    result = srp(packet, timeout=3, verbose=0)[0]
+def hostname(ip):
+    """Reverse DNS name, or None when the lookup fails"""
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except (OSError, UnicodeError):
+        return None
 
-    devices = []
-    for sent, received in result:
-        mac = received.hwsrc
-        ip = received.psrc
-        devices.append((ip, mac))
+def resolve_names(ips, workers=32):
+    """Look up all hostnames in parallel: total time is about one lookup"""
+    if not ips:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(ips))) as pool:
+        return dict(zip(ips, pool.map(hostname, ips)))
 
-    print("📡 Devices found:")
-    for ip, mac in devices:
-        hostname = socket.gethostbyaddr(ip)[0] if socket.gethostbyaddr(ip) else "Unknown"
-        print(f"  {ip} ({hostname}) - {mac}")
-        if "sensory" in hostname.lower():
-            print(f"🎯 RECEIVER FOUND: {ip}")
+def scan_network(subnet=None, port=UDP_PORT, timeout=1.0):
+    """Find receivers on the subnet (default: local /24)"""
+    network = ipaddress.ip_network(subnet, strict=False) if subnet else local_subnet()
+    if network is None:
+        sys.exit("❌ No default route to find the local subnet: pass it with --subnet, "
+                 "e.g. --subnet 192.168.4.0/24")
+    print(f"🔍 Probing {network} on UDP port {port} ({timeout:.1f}s)...")
 
-    return devices
+    receivers = asyncio.run(probe(network, port, timeout))
+    names = resolve_names([r["ip"] for r in receivers])
+
+    if not receivers:
+        print("❌ No receivers answered")
+        return receivers
+    print("📡 Receivers found:")
+    for r in receivers:
+        r["hostname"] = names.get(r["ip"])
+        print(f"  🎯 {r['ip']} ({r['hostname'] or 'Unknown'}) - ID {r['id']}, "
+              f"{r['tracks']} tracks, {capability_names(r['capabilities'])}")
+    return receivers
 
 def ping_esp32(ip):
     """Test if ESP32 is responsive"""
@@ -52,5 +122,18 @@ def ping_esp32(ip):
         print(f"❌ {ip} not responding")
         return False
 
+def main():
+    parser = argparse.ArgumentParser(description="Find Sensory Spectrum receivers")
+    parser.add_argument("--subnet", help="CIDR to probe (default: local /24)")
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--timeout", type=float, default=1.0, help="Seconds to wait for answers")
+    parser.add_argument("--ping", metavar="IP", help="Only ping this device")
+    args = parser.parse_args()
+
+    if args.ping:
+        ping_esp32(args.ping)
+    else:
+        scan_network(args.subnet, args.port, args.timeout)
+
 if __name__ == "__main__":
-    scan_network()
+    main()
@@ -0,0 +1,69 @@
+"""
+Palette Builder for Sensory Spectrum
+Generates everything that depends on the color list from config/palette.json:
+the sender's palette.bin (CIELAB grid index) and the receiver track_map.
+audio_generator.py reads the same file for its track list.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from palette import build_palette, DEFAULT_GRID  # noqa: E402
+
+def load_palette(path="config/palette.json"):
+    """Return the palette's color entries (dicts), checked for duplicate names"""
+    with open(path, "r") as f:
+        colors = json.load(f)["colors"]
+    names = set()
+    for entry in colors:
+        if entry["name"] in names:
+            raise ValueError(f"Duplicate color name: {entry['name']}")
+        names.add(entry["name"])
+    return colors
+
+def load_colors(path="config/palette.json"):
+    """Return [(name, (r, g, b)), ...]; track number = position + 1"""
+    return [(entry["name"], tuple(entry["rgb"])) for entry in load_palette(path)]
+
+def track_map(colors):
+    """Receiver track_map: color name -> DFPlayer track number"""
+    return {name: i + 1 for i, (name, _) in enumerate(colors)}
+
+def update_track_map(config_path, tracks, indent):
+    """Rewrite audio.track_map in a JSON config, keeping everything else"""
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    config.setdefault("audio", {})["track_map"] = tracks
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=indent, ensure_ascii=False)
+        f.write("\n")
+    print(f"✅ {config_path} track_map ({len(tracks)} tracks)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build palette assets from config/palette.json")
+    parser.add_argument("--palette", default="config/palette.json", help="Palette source")
+    parser.add_argument("--grid", type=int, default=DEFAULT_GRID, help="Lab grid cells per axis")
+    parser.add_argument("--out", default="sender/palette.bin", help="Sender palette output")
+    args = parser.parse_args()
+
+    colors = load_colors(args.palette)
+    if len(colors) > 3000:
+        print("❌ DFPlayer supports at most 3000 tracks")
+        sys.exit(1)
+
+    data = build_palette(colors, args.grid)
+    with open(args.out, "wb") as f:
+        f.write(data)
+    print(f"✅ {args.out} ({len(colors)} colors, {len(data)} bytes)")
+
+    tracks = track_map(colors)
+    update_track_map("receiver/config.json", tracks, 4)
+    update_track_map("config/config.template.json", tracks, 2)
+
+    print("💡 Next: python utils/audio_generator.py to create the matching tracks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+Telemetry Collector for Sensory Spectrum
+Receives the MSG_STATS / MSG_EVENT datagrams units send when
+telemetry.host is set, stores them as fixed-size binary rows and answers
+questions about them: latency percentiles, retry rates and reconnects per
+device and time window.
+
+Usage:
+  python utils/telemetry_collector.py serve                      # UDP 4211 -> telemetry/
+  python utils/telemetry_collector.py serve --store /var/lib/ss --raw
+  python utils/telemetry_collector.py report --since 6h --window 15m
+  python utils/telemetry_collector.py report --device sender:3 --since 2026-10-01 --window 1d
+  python utils/telemetry_collector.py events --since 1d
+  python utils/telemetry_collector.py devices
+
+Store layout (all files append-only, one per UTC day):
+  1m/YYYYMMDD.bin      per-minute rollup rows
+  1h/YYYYMMDD.bin      per-hour rollup rows (kept when 1m/ is pruned)
+  events/YYYYMMDD.bin  one row per event
+  raw/YYYYMMDD-HH.log  every datagram as received (--raw only)
+  devices.json         last address, uptime and counters per unit
+
+A rollup row is ROW_FORMAT (64 bytes): bucket start, role, unit ID,
+kind, metric, then count / min / max / sum and the 8 stats.py histogram
+buckets. Timers keep microsecond durations; counters keep the increase in
+`sum` (the devices send totals since boot) and the totals seen in
+min/max; gauges keep the reported values. Rows for the same bucket may
+repeat (a restart flushes partial buckets): reports merge them.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import protocol  # noqa: E402
+
+UDP_PORT = 4211
+STORE_DIR = "telemetry"
+TIERS = (("1m", 60), ("1h", 3600))
+GRACE = 90           # Seconds after a bucket ends before it is written
+FLUSH_INTERVAL = 10  # Seconds between flushes of closed buckets
+
+KIND_TIMER, KIND_COUNTER, KIND_GAUGE = 0, 1, 2
+KINDS = ("timer", "counter", "gauge")
+ROLES = {protocol.ROLE_SENDER: "sender", protocol.ROLE_RECEIVER: "receiver"}
+METRICS = {
+    protocol.ROLE_SENDER: (protocol.SENDER_TIMERS, protocol.SENDER_COUNTERS, protocol.SENDER_GAUGES),
+    protocol.ROLE_RECEIVER: (protocol.RECEIVER_TIMERS, protocol.RECEIVER_COUNTERS, protocol.RECEIVER_GAUGES),
+}
+
+BUCKETS = protocol.STATS_BUCKETS
+ROW_FORMAT = "<IBHBBIIIQ%dI3x" % BUCKETS
+ROW = struct.Struct(ROW_FORMAT)  # 64 bytes
+EVENT_ROW = struct.Struct("<dBHBI4s")  # time, role, unit, code, value, IPv4 (20 bytes)
+RAW_HEADER = struct.Struct("<d4sH")    # time, IPv4, datagram length
+
+# Upper edges of the stats.py histogram buckets (microseconds)
+EDGES = [100 << (2 * i) for i in range(BUCKETS - 1)]
+
+def day_name(ts):
+    return time.strftime("%Y%m%d", time.gmtime(ts))
+
+def ip_bytes(ip):
+    try:
+        return socket.inet_aton(ip)
+    except OSError:
+        return bytes(4)
+
+# ===== Aggregation =====
+# An aggregate is a list: [count, min, max, sum, hist0 .. hist7]
+def new_aggregate():
+    return [0, 0xFFFFFFFF, 0, 0] + [0] * BUCKETS
+
+def slot(rows, key):
+    agg = rows.get(key)
+    if agg is None:
+        agg = rows[key] = new_aggregate()
+    return agg
+
+def merge(agg, count, low, high, total, hist=None):
+    if count == 0:
+        return
+    agg[0] += count
+    agg[1] = min(agg[1], low)
+    agg[2] = max(agg[2], high)
+    agg[3] += total
+    if hist:
+        for i in range(BUCKETS):
+            agg[4 + i] += hist[i]
+
+class Store:
+    """Rollups in memory until their bucket closes, then appended to disk"""
+
+    def __init__(self, path=STORE_DIR, raw=False):
+        self.path = path
+        self.raw = raw
+        self.open = {tier: {} for tier, _ in TIERS}  # tier -> {bucket: {key: aggregate}}
+        self.devices = {}
+        self.received = self.rejected = 0
+        for tier, _ in TIERS:
+            os.makedirs(os.path.join(path, tier), exist_ok=True)
+        os.makedirs(os.path.join(path, "events"), exist_ok=True)
+        if raw:
+            os.makedirs(os.path.join(path, "raw"), exist_ok=True)
+        try:
+            with open(os.path.join(path, "devices.json")) as f:
+                self.devices = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self._raw_file = self._raw_name = None
+
+    def ingest(self, data, ip, now):
+        """Store one datagram; returns False when it is not telemetry"""
+        self.received += 1
+        if self.raw:
+            self._write_raw(data, ip, now)
+        kind = protocol.msg_type(data) if protocol.is_binary(data) else None
+        if kind == protocol.MSG_STATS:
+            report = protocol.unpack_stats(data)
+            if report and report["role"] in METRICS:
+                self._add_report(report, ip, now)
+                return True
+        elif kind == protocol.MSG_EVENT:
+            event = protocol.unpack_event(data)
+            if event:
+                self._add_event(event, ip, now)
+                return True
+        self.rejected += 1
+        return False
+
+    def _device(self, role, unit_id, ip, now):
+        device = self.devices.setdefault(f"{role}:{unit_id}", {"counters": None, "uptime_ms": 0})
+        device["ip"] = ip
+        device["seen"] = now
+        return device
+
+    def _add_report(self, report, ip, now):
+        role, unit_id = report["role"], report["unit_id"]
+        device = self._device(role, unit_id, ip, now)
+        counters = report["counters"]
+        last = device["counters"]
+        # Totals since boot: one going back means a reboot, so they restarted at zero
+        # (uptime is no help, ticks_ms wraps); the first report seen only sets the baseline
+        if last is None or len(last) != len(counters):
+            last = counters
+        elif any(c < p for c, p in zip(counters, last)):
+            last = [0] * len(counters)
+        device["counters"] = list(counters)
+        device["uptime_ms"] = report["uptime_ms"]
+
+        for tier, seconds in TIERS:
+            bucket = int(now) // seconds * seconds
+            rows = self.open[tier].setdefault(bucket, {})
+            for metric, (count, low, avg, high, hist) in enumerate(report["timers"]):
+                if count:
+                    merge(slot(rows, (role, unit_id, KIND_TIMER, metric)),
+                          count, low, high, avg * count, hist)
+            for metric, value in enumerate(counters):
+                merge(slot(rows, (role, unit_id, KIND_COUNTER, metric)),
+                      1, value, value, value - last[metric])
+            for metric, value in enumerate(report["gauges"]):
+                merge(slot(rows, (role, unit_id, KIND_GAUGE, metric)), 1, value, value, value)
+
+    def _add_event(self, event, ip, now):
+        role, unit_id, code, value = event
+        self._device(role, unit_id, ip, now)
+        with open(os.path.join(self.path, "events", day_name(now) + ".bin"), "ab") as f:
+            f.write(EVENT_ROW.pack(now, role, unit_id, code, value, ip_bytes(ip)))
+
+    def _write_raw(self, data, ip, now):
+        name = time.strftime("%Y%m%d-%H", time.gmtime(now)) + ".log"
+        if name != self._raw_name:
+            if self._raw_file:
+                self._raw_file.close()
+            self._raw_file = open(os.path.join(self.path, "raw", name), "ab")
+            self._raw_name = name
+        self._raw_file.write(RAW_HEADER.pack(now, ip_bytes(ip), len(data)))
+        self._raw_file.write(data)
+
+    def flush(self, now=None):
+        """Append closed buckets (all buckets when now is None); returns rows written"""
+        written = 0
+        for tier, seconds in TIERS:
+            buckets = self.open[tier]
+            closed = sorted(b for b in buckets if now is None or b + seconds + GRACE <= now)
+            out = {}
+            for bucket in closed:
+                rows = buckets.pop(bucket)
+                chunk = out.setdefault(day_name(bucket), bytearray())
+                for (role, unit_id, kind, metric), agg in rows.items():
+                    if agg[0] == 0 or (kind == KIND_COUNTER and agg[3] == 0):
+                        continue  # Nothing happened: the report reads absent rows as zero
+                    chunk += ROW.pack(bucket, role, unit_id, kind, metric, *agg)
+            for day, chunk in out.items():
+                if chunk:
+                    with open(os.path.join(self.path, tier, day + ".bin"), "ab") as f:
+                        f.write(chunk)
+                    written += len(chunk) // ROW.size
+        if self._raw_file:
+            self._raw_file.flush()
+        self._save_devices()
+        return written
+
+    def _save_devices(self):
+        tmp = os.path.join(self.path, "devices.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.devices, f)
+        os.replace(tmp, os.path.join(self.path, "devices.json"))
+
+    def prune(self, keep_days, now):
+        """Delete 1m and raw files older than keep_days (1h and events are kept)"""
+        oldest = day_name(now - keep_days * 86400)
+        for sub in ("1m", "raw"):
+            folder = os.path.join(self.path, sub)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name[:8] < oldest:
+                    os.remove(os.path.join(folder, name))
+
+    def close(self):
+        self.flush()
+        if self._raw_file:
+            self._raw_file.close()
+            self._raw_file = None
+
+# ===== Server =====
+class CollectorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, store):
+        self.store = store
+
+    def datagram_received(self, data, addr):
+        self.store.ingest(data, addr[0], time.time())
+
+async def serve(store, host, port, keep_days):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: CollectorProtocol(store),
+                                                       local_addr=(host, port))
+    sock = transport.get_extra_info("socket")
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)  # Ride out report bursts
+    except OSError:
+        pass
+    print(f"📡 Collecting on UDP {host}:{port} into {store.path}/")
+    last_count, last_report = 0, time.monotonic()
+    try:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            now = time.time()
+            rows = store.flush(now)
+            if rows:
+                store.prune(keep_days, now)
+            if time.monotonic() - last_report >= 60:
+                rate = (store.received - last_count) / (time.monotonic() - last_report)
+                active = sum(1 for d in store.devices.values() if now - d["seen"] < 120)
+                print(f"📥 {rate:.1f} datagrams/s from {active} units, "
+                      f"{store.rejected} rejected, {rows} rows written")
+                last_count, last_report = store.received, time.monotonic()
+    finally:
+        transport.close()
+
+# ===== Queries =====
+def parse_duration(text):
+    """'90s', '15m', '6h', '2d' or plain seconds -> seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_time(text, now):
+    """A duration back from now ('6h') or an ISO date/time (UTC when no zone)"""
+    if text is None:
+        return now
+    try:
+        return now - parse_duration(text)
+    except ValueError:
+        pass
+    t = datetime.fromisoformat(text)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+def parse_device(text):
+    """'sender:3' / 'receiver:4660' -> (role, unit ID)"""
+    role, _, unit = text.partition(":")
+    roles = {name: number for number, name in ROLES.items()}
+    if role not in roles or not unit.isdigit():
+        raise argparse.ArgumentTypeError("expected sender:<id> or receiver:<id>")
+    return roles[role], int(unit)
+
+def days_between(since, until):
+    day = int(since) // 86400 * 86400
+    while day < until:
+        yield day_name(day)
+        day += 86400
+
+def read_rows(path, tier, since, until, device=None):
+    """Rollup rows of a tier with since <= bucket start < until"""
+    for day in days_between(since, until):
+        try:
+            with open(os.path.join(path, tier, day + ".bin"), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        usable = len(data) - len(data) % ROW.size  # Ignore a torn last row
+        for row in ROW.iter_unpack(memoryview(data)[:usable]):
+            if since <= row[0] < until and (device is None or device == (row[1], row[2])):
+                yield row
+
+def rollup(rows, since, window):
+    """{(window start, role, unit): {(kind, metric): aggregate}}"""
+    result = {}
+    for row in rows:
+        start = since + (row[0] - since) // window * window
+        metrics = result.setdefault((start, row[1], row[2]), {})
+        merge(slot(metrics, (row[3], row[4])), row[5], row[6], row[7], row[8], row[9:])
+    return result
+
+def percentile(agg, q):
+    """Estimate from the histogram: linear within a bucket, clamped to min/max"""
+    count = sum(agg[4:])
+    if count == 0:
+        return None
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(agg[4:]):
+        if n and seen + n >= rank:
+            low = max(agg[1], EDGES[i - 1] if i else 0)
+            high = min(agg[2], EDGES[i]) if i < len(EDGES) else agg[2]
+            return low + (high - low) * (rank - seen) / n
+        seen += n
+    return agg[2]
+
+def metric(metrics, role, kind, name):
+    index = METRICS[role][kind].index(name)
+    return metrics.get((kind, index))
+
+def summarize(role, metrics):
+    """The figures of one device and window as a dict"""
+    def timer(name, *quantiles):
+        agg = metric(metrics, role, KIND_TIMER, name)
+        return {f"{name}_p{int(q * 100)}_ms": (round(percentile(agg, q) / 1000, 2) if agg else None)
+                for q in quantiles}
+
+    def counter(name):
+        agg = metric(metrics, role, KIND_COUNTER, name)
+        return agg[3] if agg else 0
+
+    if role == protocol.ROLE_SENDER:
+        sent, retries = counter("sent"), counter("retries")
+        out = timer("rtt", 0.5, 0.9, 0.99)
+        out.update(timer("read", 0.99))
+        out.update({"sent": sent, "retry_rate": round(retries / sent, 4) if sent else None,
+                    "ack_lost": counter("ack_lost"), "reconnects": counter("wifi_reconnects"),
+                    "sensor_errors": counter("sensor_errors"), "queue_drops": counter("queue_drops")})
+        # Low-power units (power.py): share of time awake, wake-to-read latency
+        asleep, awake = counter("sleep_ms"), counter("awake_ms")
+        out["awake_rate"] = round(awake / (awake + asleep), 4) if asleep else None
+        out.update(timer("wake", 0.9))
+    else:
+        out = timer("handle", 0.5, 0.99)
+        out.update(timer("queue_wait", 0.5, 0.99))
+        out.update({name: counter(name) for name in
+                    ("datagrams", "duplicates", "dropped", "plays", "player_errors")})
+    heap = metric(metrics, role, KIND_GAUGE, "free_heap")
+    out["min_free_heap"] = heap[1] if heap else None
+    return out
+
+def fmt(name, value):
+    if value is None:
+        return "-"
+    if name.endswith("_rate"):
+        return f"{value:.1%}"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+def report(path, since, until, window, device=None, tier="auto", as_json=False):
+    if tier == "auto":
+        # Hourly rows lag an hour behind, so they are only read where 1m/ was pruned
+        pruned = not os.path.exists(os.path.join(path, "1m", day_name(since) + ".bin"))
+        tier = "1h" if window % 3600 == 0 and pruned else "1m"
+    rows = rollup(read_rows(path, tier, since, until, device), since, window)
+    lines = []
+    for (start, role, unit_id), metrics in sorted(rows.items()):
+        entry = {"start": datetime.fromtimestamp(start, timezone.utc).isoformat(timespec="minutes"),
+                 "role": ROLES.get(role, str(role)), "unit": unit_id}
+        if role in METRICS:
+            entry.update(summarize(role, metrics))
+        lines.append(entry)
+    if as_json:
+        print(json.dumps(lines, indent=1))
+        return lines
+    if not lines:
+        print(f"❌ No {tier} data between {since:.0f} and {until:.0f} in {path}/")
+        return lines
+    for role in ("sender", "receiver"):
+        entries = [e for e in lines if e["role"] == role]
+        if not entries:
+            continue
+        columns = [k for k in entries[0] if k not in ("start", "role")]
+        print(f"\n📊 {role}s ({tier} rollups, {window // 60} min windows)")
+        print("  " + "start".ljust(18) + "".join(c[:14].rjust(15) for c in columns))
+        for e in entries:
+            print("  " + e["start"][:16].ljust(18) + "".join(fmt(c, e[c]).rjust(15) for c in columns))
+    return lines
+
+def list_events(path, since, until, device=None):
+    roles = {number: name for number, name in ROLES.items()}
+    for day in days_between(since, until):
+        try:
+            with open(os.path.join(path, "events", day + ".bin"), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        usable = len(data) - len(data) % EVENT_ROW.size
+        for ts, role, unit_id, code, value, ip in EVENT_ROW.iter_unpack(memoryview(data)[:usable]):
+            if since <= ts < until and (device is None or device == (role, unit_id)):
+                name = protocol.EVENT_NAMES[code] if code < len(protocol.EVENT_NAMES) else f"event {code}"
+                print(f"{datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='seconds')}  "
+                      f"{roles.get(role, role)}:{unit_id:<6} {socket.inet_ntoa(ip):<15} {name} {value}")
+
+def list_devices(path, now):
+    try:
+        with open(os.path.join(path, "devices.json")) as f:
+            devices = json.load(f)
+    except (OSError, ValueError):
+        print(f"❌ No devices.json in {path}/")
+        return
+    for key, device in sorted(devices.items(), key=lambda item: -item[1]["seen"]):
+        role, _, unit = key.partition(":")
+        age = now - device["seen"]
+        state = "🟢" if age < 120 else "⚪"
+        print(f"{state} {ROLES.get(int(role), role)}:{unit:<6} {device['ip']:<15} "
+              f"seen {age:.0f}s ago, up {device['uptime_ms'] // 1000}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect and query unit telemetry")
+    parser.add_argument("--store", default=STORE_DIR, help="Storage folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("serve", help="Receive and store telemetry")
+    p.add_argument("--host", default="0.0.0.0", help="Address to bind (default: all)")
+    p.add_argument("--port", type=int, default=UDP_PORT)
+    p.add_argument("--raw", action="store_true", help="Also keep every datagram in raw/")
+    p.add_argument("--keep-days", type=int, default=14, help="Days of 1m and raw data to keep")
+
+    for name, text in (("report", "Percentiles and rates per device and window"),
+                       ("events", "List boots, reconnects and other events")):
+        p = commands.add_parser(name, help=text)
+        p.add_argument("--since", default="1h", help="Start: duration back (6h, 2d) or ISO time")
+        p.add_argument("--until", help="End: duration back or ISO time (default: now)")
+        p.add_argument("--device", type=parse_device, help="Only this unit, e.g. sender:3")
+        if name == "report":
+            p.add_argument("--window", default="5m", help="Window size (5m, 1h, 1d)")
+            p.add_argument("--tier", choices=("auto", "1m", "1h"), default="auto")
+            p.add_argument("--json", action="store_true")
+    commands.add_parser("devices", help="Units seen, with address and uptime")
+    args = parser.parse_args()
+
+    now = time.time()
+    if args.command == "serve":
+        store = Store(args.store, args.raw)
+        try:
+            asyncio.run(serve(store, args.host, args.port, args.keep_days))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            store.close()
+            print("\n💾 Open buckets flushed")
+    elif args.command == "devices":
+        list_devices(args.store, now)
+    else:
+        since, until = parse_time(args.since, now), parse_time(args.until, now)
+        if args.command == "events":
+            list_events(args.store, since, until, args.device)
+        else:
+            report(args.store, since, until, parse_duration(args.window), args.device,
+                   args.tier, args.json)
+
+if __name__ == "__main__":
+    main()